@@ -1,10 +1,11 @@
 from flask import Flask, render_template, session, redirect, url_for, flash, request
 from flask_login import LoginManager, current_user
 from config import Config
-from dao.dao import SupabaseDAO
+from dao.dao import get_dao
 
 from utils.advanced_logger import logger, setup_request_logging, log_startup_info
 from utils.session_manager import get_session_manager
+from utils import request_cache
 
 # Importa blueprints
 from controllers.auth_controller import auth_bp
@@ -12,6 +13,7 @@ from controllers.chat_controller import chat_bp
 from controllers.admin_controller import admin_bp
 from controllers.project_controller import project_bp
 from controllers.orientador_controller import orientador_bp
+from controllers.jobs_controller import jobs_bp
 
 # Inicializa aplicação
 app = Flask(__name__)
@@ -21,6 +23,9 @@ Config.init_app(app)
 # ✅ NOVO: Configura logging avançado
 setup_request_logging(app)
 
+# ✅ Identity map por requisição (memoiza leituras do DAO)
+request_cache.init_app(app)
+
 # Inicializa Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -29,7 +34,7 @@ login_manager.login_message = 'Por favor, faça login para acessar esta página.
 login_manager.login_message_category = 'info'
 
 # DAO para carregar usuários
-dao = SupabaseDAO()
+dao = get_dao()
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -59,6 +64,30 @@ logger.debug("✅ project_bp registrado em /projetos")
 app.register_blueprint(orientador_bp, url_prefix='/orientador')
 logger.debug("✅ orientador_bp registrado em /orientador")
 
+app.register_blueprint(jobs_bp, url_prefix='/jobs')
+logger.debug("✅ jobs_bp registrado em /jobs")
+
+# ✅ Ledger de uso: cotas persistem entre reinícios e são somadas entre workers
+from services.usage_ledger import get_usage_ledger
+usage_ledger = get_usage_ledger()
+if usage_ledger:
+    from services.gemini_stats import gemini_stats
+    from services.gemini_scheduler import get_gemini_scheduler
+    from utils.rate_limiter import rate_limiter
+    gemini_stats.attach_ledger(usage_ledger)
+    get_gemini_scheduler().attach_ledger(usage_ledger)
+    rate_limiter.attach_ledger(usage_ledger)
+
+# ✅ Pré-aquecimento do Gemini (cliente + corpus + índice) sem bloquear o boot
+if Config.GEMINI_WARMUP:
+    import threading
+    from services.gemini_service import get_gemini_service
+    threading.Thread(
+        target=get_gemini_service().warm_up,
+        name='gemini-warmup',
+        daemon=True
+    ).start()
+
 @app.before_request
 def check_session_validity():
     """Verifica validade da sessão antes de cada request"""
@@ -0,0 +1,17 @@
+"""
+Benchmarks da APBIA (rodar com `python -m benchmarks.<nome>` na raiz)
+
+Usam fakes em memória no lugar de Supabase/Gemini; a latência de rede
+é simulada e pode ser ajustada pelos argumentos de cada script
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault('SUPABASE_URL', 'https://bench.supabase.co')
+os.environ.setdefault('SUPABASE_KEY', 'chave-de-benchmark')
+os.environ.setdefault('GEMINI_API_KEY', 'chave-de-benchmark')
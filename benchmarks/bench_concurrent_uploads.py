@@ -0,0 +1,95 @@
+"""
+Benchmark: 50 uploads simultâneos em _save_chat_file_to_disk
+
+Compara o salvamento serializado por um lock global (comportamento
+antigo) com o salvamento sem lock (tmp O_EXCL + publicação atômica).
+A leitura do corpo da requisição é simulada com uma pausa por bloco
+
+Uso:
+    python -m benchmarks.bench_concurrent_uploads [uploads] [tamanho_mb]
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import FileStorage
+
+from config import Config
+
+# Diretório descartável ANTES de importar o controller (caminhos são fixados no import)
+Config.UPLOAD_FOLDER = tempfile.mkdtemp(prefix='apbia-bench-')
+
+from controllers import chat_controller  # noqa: E402
+
+
+class _CorpoLento(io.BytesIO):
+    """Corpo da requisição chegando pela rede (5 ms por bloco)"""
+
+    def read(self, size=-1):
+        time.sleep(0.005)
+        return super().read(size)
+
+
+def _limpar_armazenamento():
+    shutil.rmtree(chat_controller.CHAT_FILES_DIR, ignore_errors=True)
+    os.makedirs(chat_controller.CHAT_FILES_TMP_DIR, exist_ok=True)
+
+
+def rodar(salvar, payloads):
+    def enviar(dados):
+        return salvar(FileStorage(_CorpoLento(dados), filename='projeto.pdf', content_type='application/pdf'))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(payloads)) as executor:
+        resultados = list(executor.map(enviar, payloads))
+    return time.perf_counter() - start, resultados
+
+
+def main():
+    uploads = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    tamanho = int(float(sys.argv[2]) * 1024 * 1024) if len(sys.argv) > 2 else 4 * 1024 * 1024
+
+    # 80% conteúdos distintos, 20% o mesmo conteúdo (exercita a deduplicação)
+    distintos = uploads - uploads // 5
+    repetido = os.urandom(tamanho)
+    payloads = [os.urandom(tamanho) for _ in range(distintos)] + [repetido] * (uploads - distintos)
+
+    lock = threading.Lock()
+
+    def salvar_com_lock(file):
+        with lock:
+            return chat_controller._save_chat_file_to_disk(file)
+
+    try:
+        _limpar_armazenamento()
+        t_lock, _ = rodar(salvar_com_lock, payloads)
+
+        _limpar_armazenamento()
+        t_livre, resultados = rodar(chat_controller._save_chat_file_to_disk, payloads)
+
+        hashes_ok = all(
+            r['sha256'] == hashlib.sha256(dados).hexdigest()
+            for r, dados in zip(resultados, payloads)
+        )
+        for resultado in resultados:
+            chat_controller._soltar_conteudo(resultado)
+
+        print(f"{uploads} uploads simultâneos de {tamanho / 1024 / 1024:.0f} MB")
+        print(f"  com lock global: {t_lock:.2f} s")
+        print(f"  sem lock:        {t_livre:.2f} s ({t_lock / t_livre:.1f}x)")
+        print(f"  hashes corretos: {hashes_ok} | deduplicados: {sum(r['dedup'] for r in resultados)}"
+              f" | temporários restantes: {len(os.listdir(chat_controller.CHAT_FILES_TMP_DIR))}")
+
+    finally:
+        shutil.rmtree(Config.UPLOAD_FOLDER, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: carregamento de um chat (N+1 x listar_mensagens_enriquecidas)
+
+Compara o padrão antigo do load_history (uma consulta de notas por
+mensagem + busca linear do anexo) com o carregador em lote do DAO,
+contando round-trips ao Supabase com latência simulada
+
+Uso:
+    python -m benchmarks.bench_message_loader [mensagens] [latencia_ms]
+"""
+
+import sys
+import time
+
+from dao.dao import SupabaseDAO
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data)
+
+
+class _Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.filters = []
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def execute(self):
+        self.client.round_trips += 1
+        time.sleep(self.client.latency)
+        rows = self.client.tables.get(self.table, [])
+        return _Result([dict(row) for row in rows if all(f(row) for f in self.filters)])
+
+
+class FakeSupabase:
+    """Cliente Supabase em memória que conta round-trips"""
+
+    def __init__(self, tables, latency):
+        self.tables = tables
+        self.latency = latency
+        self.round_trips = 0
+
+    def table(self, name):
+        return _Query(self, name)
+
+
+def _montar_chat(chat_id, total_mensagens):
+    mensagens = []
+    notas = []
+    arquivos = []
+
+    for i in range(total_mensagens):
+        nota = {'id': i, 'mensagem_id': i, 'nota': f'nota {i}', 'data_criacao': f'2026-01-01T00:{i % 60:02d}'}
+        notas.append(nota)
+        mensagens.append({
+            'id': i, 'chat_id': chat_id, 'role': 'user' if i % 2 == 0 else 'model',
+            'conteudo': f'mensagem {i}', 'notas_orientador': [nota]
+        })
+        if i % 10 == 0:
+            arquivos.append({'id': i, 'chat_id': chat_id, 'mensagem_id': i, 'nome_arquivo': f'arq{i}.pdf'})
+
+    return {'mensagens': mensagens, 'notas_orientador': notas, 'arquivos_chat': arquivos}
+
+
+def carregar_n_mais_1(dao, chat_id):
+    """Padrão antigo do load_history / visualizar_chat"""
+    mensagens = dao.listar_mensagens_por_chat(chat_id)
+    arquivos = dao.listar_arquivos_por_chat(chat_id)
+
+    for msg in mensagens:
+        msg['notas'] = dao.listar_notas_por_mensagem(msg['id']) or []
+        arquivo = next((arq for arq in arquivos if arq.get('mensagem_id') == msg['id']), None)
+        if arquivo:
+            msg['arquivo'] = arquivo
+
+    return mensagens
+
+
+def carregar_em_lote(dao, chat_id):
+    mensagens, _ = dao.listar_mensagens_enriquecidas(chat_id)
+    return mensagens
+
+
+def medir(funcao, client, dao, chat_id):
+    client.round_trips = 0
+    start = time.perf_counter()
+    mensagens = funcao(dao, chat_id)
+    return time.perf_counter() - start, client.round_trips, mensagens
+
+
+def main():
+    total_mensagens = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+
+    client = FakeSupabase(_montar_chat(1, total_mensagens), latency_ms / 1000)
+    dao = SupabaseDAO.__new__(SupabaseDAO)
+    dao.supabase = client
+
+    t_antigo, rt_antigo, antigas = medir(carregar_n_mais_1, client, dao, 1)
+    t_lote, rt_lote, novas = medir(carregar_em_lote, client, dao, 1)
+
+    assert [m['notas'][0]['id'] for m in antigas] == [m['notas'][0]['id'] for m in novas]
+    assert [m.get('arquivo', {}).get('id') for m in antigas] == [m.get('arquivo', {}).get('id') for m in novas]
+
+    print(f"Chat com {total_mensagens} mensagens, latência simulada {latency_ms:.0f} ms por consulta")
+    print(f"  N+1:   {rt_antigo:4d} round-trips  {t_antigo * 1000:8.1f} ms")
+    print(f"  lote:  {rt_lote:4d} round-trips  {t_lote * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark: contagem local de tokens do /chat/count-tokens
+
+Mede a latência de TokenEstimator.count_text para textos de 10 KB
+(pt, en e código), com o LRU frio (texto novo a cada chamada) e quente
+(mesmo texto repetido). Meta: p99 < 1 ms
+
+Uso:
+    python -m benchmarks.bench_token_count [iteracoes]
+"""
+
+import sys
+import time
+
+from services.token_estimator import TokenEstimator
+
+
+TAMANHO = 10 * 1024
+
+TEXTOS = {
+    'pt': "O projeto de pesquisa que foi apresentado na feira não é para uma banca com os avaliadores mais exigentes. ",
+    'en': "The project of the team is that for the fair and it was with this plan. ",
+    'code': "def f(x):\n    return {'a': [x(1), x(2)]}; y = (a<b)\n",
+}
+
+
+def _percentil(amostras, p):
+    return amostras[min(len(amostras) - 1, int(len(amostras) * p))]
+
+
+def medir(estimator, texto, iteracoes, cache_frio):
+    latencias = []
+
+    for i in range(iteracoes):
+        # Sufixo muda o hash: força detecção de idioma a cada chamada
+        entrada = f"{texto}{i}" if cache_frio else texto
+
+        start = time.perf_counter()
+        estimator.count_text(entrada)
+        latencias.append(time.perf_counter() - start)
+
+    latencias.sort()
+    return _percentil(latencias, 0.50), _percentil(latencias, 0.99)
+
+
+def main():
+    iteracoes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    # Sem amostragem: o benchmark mede só o caminho local (sem API)
+    estimator = TokenEstimator(sample_every=0)
+
+    print(f"count_text em textos de {TAMANHO // 1024} KB, {iteracoes} chamadas por caso")
+
+    pior_p99 = 0
+    for idioma, base in TEXTOS.items():
+        texto = (base * (TAMANHO // len(base) + 1))[:TAMANHO]
+
+        for rotulo, cache_frio in (('frio', True), ('quente', False)):
+            p50, p99 = medir(estimator, texto, iteracoes, cache_frio)
+            pior_p99 = max(pior_p99, p99)
+            print(f"  {idioma:<5} cache {rotulo:<6} p50 {p50 * 1000:.3f} ms  p99 {p99 * 1000:.3f} ms")
+
+    print(f"Pior p99: {pior_p99 * 1000:.3f} ms ({'OK' if pior_p99 < 0.001 else 'ACIMA DA META'} < 1 ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -25,6 +25,79 @@ class Config:
     # Contexto da IA
     CONTEXT_FILES_PATH = 'context_files'
     
+    # Cache explícito do corpus da Bragantec no Gemini (Context Caching)
+    GEMINI_CONTEXT_CACHE = os.getenv('GEMINI_CONTEXT_CACHE', 'true').lower() == 'true'
+    GEMINI_CACHE_TTL_SECONDS = int(os.getenv('GEMINI_CACHE_TTL_SECONDS', 3600))
+    # Pré-carrega cliente/corpus/índice em background ao iniciar o worker
+    GEMINI_WARMUP = os.getenv('GEMINI_WARMUP', 'false').lower() == 'true'
+    
+    # Busca BM25 nos cadernos (Modo Bragantec envia só os trechos relevantes)
+    BRAGANTEC_INDEX_PATH = os.getenv('BRAGANTEC_INDEX_PATH', os.path.join('context_files', '.index', 'bragantec_bm25.json'))
+    BRAGANTEC_TOP_K = int(os.getenv('BRAGANTEC_TOP_K', 8))
+    
+    # Cache do painel do orientador (segundos, 0 = desativado)
+    ORIENTADOS_CACHE_TTL_SECONDS = int(os.getenv('ORIENTADOS_CACHE_TTL_SECONDS', 30))
+    
+    # Pool HTTP compartilhado do Supabase (keep-alive)
+    SUPABASE_POOL_SIZE = int(os.getenv('SUPABASE_POOL_SIZE', 20))
+    SUPABASE_POOL_KEEPALIVE = int(os.getenv('SUPABASE_POOL_KEEPALIVE', 10))
+    SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv('SUPABASE_KEEPALIVE_EXPIRY', 60))
+    SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', 30))
+    SUPABASE_CONNECT_TIMEOUT = float(os.getenv('SUPABASE_CONNECT_TIMEOUT', 5))
+    SUPABASE_POOL_TIMEOUT = float(os.getenv('SUPABASE_POOL_TIMEOUT', 10))
+    SUPABASE_HTTP2 = os.getenv('SUPABASE_HTTP2', 'true').lower() == 'true'
+    
+    # Rate limiting: 'memory' (um processo) ou 'sqlite' (compartilhado entre workers)
+    LIMITER_BACKEND = os.getenv('LIMITER_BACKEND', 'memory').lower()
+    LIMITER_SQLITE_PATH = os.getenv('LIMITER_SQLITE_PATH', os.path.join('data', 'limiter.sqlite3'))
+    
+    # Ledger de uso do Gemini (persiste cotas entre reinícios e workers)
+    USAGE_LEDGER_ENABLED = os.getenv('USAGE_LEDGER_ENABLED', 'true').lower() == 'true'
+    USAGE_LEDGER_PATH = os.getenv('USAGE_LEDGER_PATH', os.path.join('data', 'usage_ledger.sqlite3'))
+    USAGE_LEDGER_FLUSH_SECONDS = float(os.getenv('USAGE_LEDGER_FLUSH_SECONDS', 2))
+    
+    # Fila do Gemini: limites são por chave da API (globais), excesso espera na fila
+    GEMINI_QUEUE_MAX = int(os.getenv('GEMINI_QUEUE_MAX', 100))
+    GEMINI_QUEUE_MAX_WAIT_SECONDS = int(os.getenv('GEMINI_QUEUE_MAX_WAIT_SECONDS', 45))
+    GEMINI_WEIGHT_ORIENTADOR = float(os.getenv('GEMINI_WEIGHT_ORIENTADOR', 2))
+    GEMINI_WEIGHT_PARTICIPANTE = float(os.getenv('GEMINI_WEIGHT_PARTICIPANTE', 1))
+    
+    # Contador de tokens local (/chat/count-tokens); a API só calibra por amostragem
+    TOKEN_COUNT_CACHE_SIZE = int(os.getenv('TOKEN_COUNT_CACHE_SIZE', 2048))
+    TOKEN_COUNT_SAMPLE_EVERY = int(os.getenv('TOKEN_COUNT_SAMPLE_EVERY', 50))
+    
+    # Histórico do chat: janela por orçamento de tokens + resumo acumulado do que saiu dela
+    HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 8000))
+    HISTORY_MAX_MESSAGES = int(os.getenv('HISTORY_MAX_MESSAGES', 60))
+    HISTORY_SUMMARY_MIN_MESSAGES = int(os.getenv('HISTORY_SUMMARY_MIN_MESSAGES', 6))
+    HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv('HISTORY_SUMMARY_MAX_TOKENS', 800))
+    
+    # Jobs em background (geração de ideias, análise de arquivos)
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+    JOB_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join('data', 'jobs.sqlite3'))
+    JOB_RETENTION_HOURS = int(os.getenv('JOB_RETENTION_HOURS', 24))
+    
+    # Saída estruturada: tentativas extras de reparo quando o JSON não valida
+    STRUCTURED_MAX_REPAIRS = int(os.getenv('STRUCTURED_MAX_REPAIRS', 1))
+    
+    # Pool de variantes do "gerar ideias" (prompt igual para todos os usuários)
+    IDEIAS_POOL_SIZE = int(os.getenv('IDEIAS_POOL_SIZE', 4))
+    IDEIAS_CACHE_TTL_SECONDS = int(os.getenv('IDEIAS_CACHE_TTL_SECONDS', 6 * 3600))
+    IDEIAS_REFRESH_INTERVAL_SECONDS = int(os.getenv('IDEIAS_REFRESH_INTERVAL_SECONDS', 600))
+    IDEIAS_CACHE_PATH = os.getenv('IDEIAS_CACHE_PATH', os.path.join('data', 'ideias_cache.sqlite3'))
+    
+    # Arquivos mantidos no Gemini (Files API): registro, cota e limpeza
+    GEMINI_FILES_DB_PATH = os.getenv('GEMINI_FILES_DB_PATH', os.path.join('data', 'gemini_files.sqlite3'))
+    GEMINI_FILES_QUOTA_BYTES = int(os.getenv('GEMINI_FILES_QUOTA_BYTES', 20 * 1024 ** 3))
+    GEMINI_FILES_SWEEP_SECONDS = int(os.getenv('GEMINI_FILES_SWEEP_SECONDS', 900))
+    GEMINI_FILES_ORPHAN_GRACE_SECONDS = int(os.getenv('GEMINI_FILES_ORPHAN_GRACE_SECONDS', 3600))
+    # Arquivos do chat anexados (por referência) às mensagens seguintes
+    CHAT_FILE_REFERENCES_MAX = int(os.getenv('CHAT_FILE_REFERENCES_MAX', 5))
+    
+    # Sessões: revalidação do token no banco e gravação de atividade em lote
+    SESSION_CACHE_TTL_SECONDS = int(os.getenv('SESSION_CACHE_TTL_SECONDS', 15))
+    SESSION_ACTIVITY_FLUSH_SECONDS = int(os.getenv('SESSION_ACTIVITY_FLUSH_SECONDS', 30))
+    
     # Sistema
     IA_STATUS = True  # IA ativa por padrão
     
@@ -1,7 +1,13 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, Response
 from flask_login import login_required, current_user
 from functools import wraps
-from dao.dao import SupabaseDAO
+from dao.dao import get_dao
+from dao.http_pool import get_pool_metrics
+from services.gemini_scheduler import get_gemini_scheduler
+from services.history_compactor import get_history_compactor
+from services.job_queue import get_job_queue
+from services.variant_pool import get_variant_pool
+from services.gemini_files import get_gemini_file_manager
 from config import Config
 from services.gemini_stats import gemini_stats  
 from utils.advanced_logger import logger
@@ -11,7 +17,7 @@ import json
 
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
-dao = SupabaseDAO()
+dao = get_dao()
 
 # Decorator para verificar se usuário é admin
 def admin_required(f):
@@ -263,11 +269,17 @@ def gemini_stats_export():
         global_stats = gemini_stats.get_global_stats()
         all_users_stats = gemini_stats.get_all_users_stats()
         limits_info = gemini_stats.get_limits_info()
+        timeline = gemini_stats.get_timeline()
+        
+        # ✅ Visão agregada de todos os workers (ledger durável)
+        ledger_summary = gemini_stats.get_ledger_summary()
         
         # Monta estrutura JSON
         export_data = {
             'timestamp': datetime.now().isoformat(),
             'global': global_stats,
+            'timeline': timeline,
+            'ledger': ledger_summary,
             'limits': limits_info,
             'users': all_users_stats,
             'total_users': len(all_users_stats)
@@ -556,11 +568,12 @@ def test_gemini():
     Testa conexão com Gemini API
     """
     try:
-        from services.gemini_service import GeminiService
+        from services.gemini_service import get_gemini_service
         
         logger.info("🧪 Testando conexão com Gemini...")
         
-        gemini = GeminiService()
+        # ✅ Instância compartilhada (não relê o corpus a cada teste)
+        gemini = get_gemini_service()
         
         # Envia mensagem de teste simples
         response = gemini.chat(
@@ -584,7 +597,8 @@ def test_gemini():
             'success': True,
             'message': 'Gemini funcionando corretamente! ✓',
             'response': response.get('response', ''),
-            'model': 'gemini-2.5-flash'
+            'model': gemini.model_name,
+            'health': gemini.health()
         })
         
     except Exception as e:
@@ -610,7 +624,8 @@ def test_db():
             return jsonify({
                 'success': True,
                 'message': 'Banco de dados funcionando',
-                'rows': len(result.data) if result.data else 0
+                'rows': len(result.data) if result.data else 0,
+                'pool': get_pool_metrics()
             })
         else:
             return jsonify({
@@ -625,6 +640,18 @@ def test_db():
             'message': f'Erro: {str(e)}'
         }), 500
 
+@admin_bp.route('/db-pool-api')
+@admin_required
+def db_pool_api():
+    """
+    Métricas do pool de conexões HTTP com o Supabase
+    """
+    return jsonify({
+        'success': True,
+        'pool': get_pool_metrics()
+    })
+
+
 @admin_bp.route('/gemini-stats-api')
 @admin_required
 def gemini_stats_api():
@@ -697,7 +724,15 @@ def gemini_stats_api():
                 'unique_users_24h': global_stats.get('unique_users_24h', 0),
                 'requests_24h': global_stats.get('requests_24h', 0),
                 'tokens_24h': global_stats.get('tokens_24h', 0),
+                'tokens_cached_24h': global_stats.get('tokens_cached_24h', 0),
+                'total_tokens_cached': global_stats.get('total_tokens_cached', 0),
             },
+            'scheduler': get_gemini_scheduler().get_stats(),
+            'history': get_history_compactor().get_stats(),
+            'jobs': get_job_queue().get_stats(),
+            'structured': gemini_stats.get_structured_stats(),
+            'variant_pool': get_variant_pool().get_stats(),
+            'gemini_files': get_gemini_file_manager().get_stats(),
             'limits': limits_info
         })
         
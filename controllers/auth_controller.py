@@ -1,11 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, make_response
 from flask_login import login_user, logout_user, login_required, current_user
-from dao.dao import SupabaseDAO
+from dao.dao import get_dao
 from utils.session_manager import get_session_manager
 from utils.advanced_logger import logger
 
 auth_bp = Blueprint('auth', __name__)
-dao = SupabaseDAO()
+dao = get_dao()
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -1,70 +1,199 @@
-from flask import Blueprint, render_template, request, jsonify, session, send_file
+from flask import Blueprint, render_template, request, jsonify, session, send_file, Response, stream_with_context
 from flask_login import login_required, current_user
-from dao.dao import SupabaseDAO
-from services.gemini_service import GeminiService
+from dao.dao import get_dao
+from services.gemini_service import get_gemini_service
+from services.history_compactor import get_history_compactor
+from services.job_queue import get_job_queue
 from config import Config
 from werkzeug.utils import secure_filename
 import os
+import json
 import uuid
+import hashlib
+import time
+import threading
 import mimetypes
 from datetime import datetime
 from utils.rate_limiter import rate_limiter
 from utils.advanced_logger import logger
 
 chat_bp = Blueprint('chat', __name__)
-dao = SupabaseDAO()
-gemini = GeminiService()
+dao = get_dao()
+gemini = get_gemini_service()
 
 # Diretório para arquivos permanentes
 CHAT_FILES_DIR = os.path.join(Config.UPLOAD_FOLDER, 'chat_files')
-os.makedirs(CHAT_FILES_DIR, exist_ok=True)
+CHAT_FILES_TMP_DIR = os.path.join(CHAT_FILES_DIR, 'tmp')
+os.makedirs(CHAT_FILES_TMP_DIR, exist_ok=True)
 
-def _save_chat_file_to_disk(file, user_id, chat_id):
-    """Salva arquivo com proteção contra race conditions"""
-    import time
-    from threading import Lock
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _limpar_temporarios_antigos(max_age_seconds=86400):
+    """Remove temporários e pins de uploads interrompidos (job perdido no reinício)"""
+    limite = time.time() - max_age_seconds
+    for nome in os.listdir(CHAT_FILES_TMP_DIR):
+        caminho = os.path.join(CHAT_FILES_TMP_DIR, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+
+_limpar_temporarios_antigos()
+
+def _save_chat_file_to_disk(file):
+    """
+    Salva o upload no armazenamento por conteúdo (chat_files/<aa>/<sha256>)
+
+    Os bytes são lidos uma única vez: o SHA-256 é calculado enquanto o
+    arquivo vai para um temporário, que vira o arquivo definitivo ou é
+    descartado se o mesmo conteúdo já está salvo (ex: o PDF do projeto
+    enviado em vários chats). Os registros de arquivos_chat com o mesmo
+    hash dividem a cópia
+
+    Sem lock: o temporário tem nome uuid4 criado com O_EXCL e a publicação
+    é um os.link atômico (falha se o conteúdo já existe), então uploads
+    simultâneos - inclusive do mesmo arquivo - rodam em paralelo
+
+    Enquanto o job não grava o registro no banco, o upload mantém um hard
+    link do conteúdo (pin em chat_files/tmp): a limpeza não apaga conteúdo
+    com pin e, se apagou no meio do caminho, o job o restaura a partir do pin
+
+    Args:
+        file: FileStorage do request
+
+    Returns:
+        dict: filepath, filename, mime_type, size, sha256, dedup (conteúdo já
+              existia) e pin (liberar com _soltar_conteudo)
+    """
+    original_filename = secure_filename(file.filename)
+    name = uuid.uuid4().hex
+    tmp_path = os.path.join(CHAT_FILES_TMP_DIR, f"{name}.part")
+    pin_path = os.path.join(CHAT_FILES_TMP_DIR, f"{name}.pin")
     
-    # Lock global para evitar race conditions
-    if not hasattr(_save_chat_file_to_disk, 'lock'):
-        _save_chat_file_to_disk.lock = Lock()
+    digest = hashlib.sha256()
+    file_size = 0
     
-    with _save_chat_file_to_disk.lock:
-        user_dir = os.path.join(CHAT_FILES_DIR, str(user_id))
-        chat_dir = os.path.join(user_dir, str(chat_id))
-        os.makedirs(chat_dir, exist_ok=True)
+    try:
+        # Uma passada: hash + escrita em blocos
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                file_size += len(chunk)
+        
+        sha256 = digest.hexdigest()
+        relative_path = os.path.join('chat_files', sha256[:2], sha256)
+        full_path = os.path.join(Config.UPLOAD_FOLDER, relative_path)
         
-        # Nome único COM timestamp + contador
-        original_filename = secure_filename(file.filename)
-        unique_id = str(uuid.uuid4())[:8]
-        timestamp = int(time.time() * 1000)  # Milissegundos
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
         
-        counter = 0
         while True:
-            suffix = f"_{counter}" if counter > 0 else ""
-            unique_filename = f"{unique_id}_{timestamp}{suffix}_{original_filename}"
-            full_path = os.path.join(chat_dir, unique_filename)
+            try:
+                os.link(tmp_path, full_path)
+                os.replace(tmp_path, pin_path)  # Mesmo inode: vira o pin
+                dedup = False
+                break
+            except FileExistsError:
+                pass
             
-            if not os.path.exists(full_path):
+            try:
+                os.link(full_path, pin_path)
+                dedup = True
+                logger.info(f"♻️ Conteúdo já armazenado: {sha256[:12]}")
                 break
-            counter += 1
-        
-        file.save(full_path)
-        
-        # Caminho relativo (para salvar no banco)
-        relative_path = os.path.join('chat_files', str(user_id), str(chat_id), unique_filename)
-        
-        # Tamanho do arquivo
-        file_size = os.path.getsize(full_path)
-        
-        # MIME type manual com fallback
-        mime_type = _detect_mime_type(original_filename, file.content_type)
-        
-        return {
-            'filepath': relative_path,
-            'filename': original_filename,
-            'mime_type': mime_type,
-            'size': file_size
-        }
+            except FileNotFoundError:
+                continue  # Apagado entre as duas chamadas: publica o nosso
+    
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    # MIME type manual com fallback
+    mime_type = _detect_mime_type(original_filename, file.content_type)
+    
+    return {
+        'filepath': relative_path,
+        'filename': original_filename,
+        'mime_type': mime_type,
+        'size': file_size,
+        'sha256': sha256,
+        'dedup': dedup,
+        'pin': pin_path
+    }
+
+
+def _restaurar_conteudo(file_info):
+    """Recria a cópia a partir do pin se a limpeza a apagou durante o job"""
+    full_path = os.path.join(Config.UPLOAD_FOLDER, file_info['filepath'])
+    try:
+        os.link(file_info['pin'], full_path)
+        logger.info(f"♻️ Conteúdo restaurado: {file_info['sha256'][:12]}")
+    except FileExistsError:
+        pass
+
+
+def _soltar_conteudo(file_info):
+    """Libera o pin do upload (o registro no banco passa a segurar o conteúdo)"""
+    try:
+        os.remove(file_info['pin'])
+    except OSError:
+        pass
+
+
+def _apagar_conteudo_se_livre(sha256, full_path, gemini_file_name=None):
+    """
+    Apaga a cópia em disco (e no Gemini) se nenhum upload ou registro a usa
+
+    A ordem importa: primeiro os pins (uploads em andamento), depois o banco.
+    Um upload que chega depois da verificação mantém o conteúdo pelo pin e
+    o restaura antes de gravar o registro
+
+    Args:
+        sha256: Hash do conteúdo (None = arquivo antigo, sem deduplicação)
+        full_path: Caminho da cópia em disco
+        gemini_file_name: Arquivo mantido no Gemini (se houver)
+
+    Returns:
+        bool: True se apagou
+    """
+    try:
+        if os.stat(full_path).st_nlink > 1:
+            return False
+    except FileNotFoundError:
+        pass
+
+    if sha256 and dao.contar_referencias_arquivo(sha256) > 0:
+        return False
+
+    if gemini_file_name:
+        gemini.files.delete(gemini_file_name)
+
+    try:
+        os.remove(full_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"⚠️ Erro ao deletar arquivo: {e}")
+
+    return True
+
+
+def _remover_arquivo_armazenado(arquivo):
+    """
+    Apaga a cópia em disco (e no Gemini) quando nenhum registro usa mais o conteúdo
+
+    Args:
+        arquivo: Registro de arquivos_chat já removido do banco
+    """
+    _apagar_conteudo_se_livre(
+        arquivo.get('sha256'),
+        os.path.join(Config.UPLOAD_FOLDER, arquivo['url_arquivo']),
+        arquivo.get('gemini_file_name')
+    )
 
 
 def _detect_mime_type(filename, content_type=None):
@@ -144,6 +273,302 @@ def _detect_mime_type(filename, content_type=None):
     return fallback_types.get(ext, 'application/octet-stream')
 
 
+def _preparar_envio(message, chat_id, data, reenviar_em_background=True):
+    """
+    Prepara o envio de uma mensagem (compartilhado entre /send e /send-stream)
+
+    Cria o chat se necessário, monta contexto de projetos e histórico
+    (janela por orçamento de tokens + resumo acumulado)
+
+    Args:
+        message: Mensagem do usuário
+        chat_id: ID do chat (None para criar)
+        data: JSON da requisição
+        reenviar_em_background: Se True, arquivos expirados são reenviados
+            por um job (e a mensagem avisa a IA); se False, são devolvidos
+            para o chamador reenviar antes de responder
+
+    Returns:
+        tuple: (chat_id, kwargs para gemini.chat / gemini.chat_stream,
+                arquivos expirados a reenviar)
+    """
+    tipo_usuario = None
+    # Tipo de usuário
+    if current_user.is_participante():
+        tipo_usuario = 'participante'
+    elif current_user.is_orientador():
+        tipo_usuario = 'orientador'
+
+    # Arquivos já enviados neste chat (vão por referência, sem novo upload)
+    file_refs, expirados, indisponiveis = _referencias_arquivos(chat_id) if chat_id else ([], [], [])
+
+    reanexando = []
+    if reenviar_em_background:
+        for arquivo in expirados:
+            _agendar_reenvio(arquivo, current_user.id)
+        reanexando = [arquivo['nome_arquivo'] for arquivo in expirados]
+        expirados = []
+
+    # Cria chat se não existir
+    if not chat_id:
+        tipo_ia_id = 2 if current_user.is_participante() else \
+                    3 if current_user.is_orientador() else 1
+
+        from utils.helpers import generate_chat_title
+        titulo = generate_chat_title(message)
+
+        chat = dao.criar_chat(current_user.id, tipo_ia_id, titulo)
+        chat_id = chat.id
+
+    # Contexto de projetos
+    projetos = dao.listar_projetos_por_usuario(current_user.id)
+    contexto_projetos = ""
+
+    if projetos:
+        contexto_projetos = "\n\n=== SEUS PROJETOS ===\n"
+        for projeto in projetos:
+            contexto_projetos += f"""
+Projeto: {projeto.nome}
+Categoria: {projeto.categoria}
+Status: {projeto.status}
+Resumo: {projeto.resumo or 'Não informado'}
+---
+"""
+
+    # ✅ Histórico limitado por tokens (mensagens antigas vão para o resumo do chat)
+    history = get_history_compactor().build_history(chat_id, current_user.id, tipo_usuario)
+
+    # Mensagem com contexto
+    message_com_contexto = f"{contexto_projetos}\n\n{message}"
+
+    nota = _nota_arquivos(reanexando, indisponiveis)
+    if nota:
+        message_com_contexto = f"{nota}\n\n{message_com_contexto}"
+
+    apelido = current_user.apelido if hasattr(current_user, 'apelido') else None
+
+    return chat_id, {
+        'message': message_com_contexto,
+        'tipo_usuario': tipo_usuario,
+        'history': history,
+        'usar_pesquisa': data.get('usar_pesquisa', True),
+        'usar_code_execution': data.get('usar_code_execution', True),
+        'analyze_url': data.get('url'),
+        'usar_contexto_bragantec': data.get('usar_contexto_bragantec', False),
+        'user_id': current_user.id,
+        'apelido': apelido,
+        'file_refs': file_refs
+    }, expirados
+
+
+def _referencias_arquivos(chat_id):
+    """
+    Referências (URI) dos arquivos do chat para anexar à próxima mensagem
+
+    URIs ainda válidas são reutilizadas. Arquivos cujo upload expirou (ou foi
+    apagado pela limpeza) precisam ser reenviados a partir da cópia em
+    chat_files/; sem a cópia local o arquivo não tem mais como ser anexado
+
+    Args:
+        chat_id: ID do chat
+
+    Returns:
+        tuple: ([(uri, mime_type)], expirados a reenviar, nomes indisponíveis)
+               dos CHAT_FILE_REFERENCES_MAX arquivos mais recentes
+    """
+    chat = dao.buscar_chat_por_id(chat_id)
+    if not chat or chat.usuario_id != current_user.id:
+        return [], [], []
+
+    arquivos = dao.listar_arquivos_por_chat(chat_id)[-Config.CHAT_FILE_REFERENCES_MAX:]
+    refs = []
+    expirados = []
+    indisponiveis = []
+
+    for arquivo in arquivos:
+        uri = arquivo.get('gemini_file_uri')
+
+        if uri and gemini.files.is_fresh(arquivo.get('gemini_expiration')):
+            refs.append((uri, arquivo.get('tipo_arquivo')))
+        elif os.path.exists(os.path.join(Config.UPLOAD_FOLDER, arquivo['url_arquivo'])):
+            expirados.append(arquivo)
+        else:
+            indisponiveis.append(arquivo['nome_arquivo'])
+
+    if refs:
+        logger.info(f"📎 {len(refs)} arquivos do chat {chat_id} anexados por referência")
+    if indisponiveis:
+        logger.debug(f"📎 Sem cópia local (não reenviados): {', '.join(indisponiveis)}")
+
+    return refs, expirados, indisponiveis
+
+
+def _nota_arquivos(reanexando, indisponiveis):
+    """
+    Aviso para a IA sobre arquivos do chat que não vão nesta mensagem
+
+    Args:
+        reanexando: Nomes dos arquivos sendo reenviados
+        indisponiveis: Nomes dos arquivos sem cópia local
+
+    Returns:
+        str: Bloco de texto (vazio se todos os arquivos foram anexados)
+    """
+    linhas = []
+
+    if reanexando:
+        linhas.append(
+            f"Sendo reanexados (NÃO acompanham esta mensagem): {', '.join(reanexando)}. "
+            "Se a pergunta depender deles, avise o usuário que estarão disponíveis "
+            "na próxima mensagem."
+        )
+    if indisponiveis:
+        linhas.append(
+            f"Não estão mais disponíveis: {', '.join(indisponiveis)}. Se a pergunta "
+            "depender deles, peça ao usuário para enviá-los novamente."
+        )
+
+    return "=== ARQUIVOS DO CHAT ===\n" + "\n".join(linhas) if linhas else ""
+
+
+# Arquivos com reenvio na fila (evita um job por mensagem enquanto o upload roda)
+_reenvios_pendentes = set()
+_reenvios_lock = threading.Lock()
+
+
+def _agendar_reenvio(arquivo, user_id):
+    """
+    Cria (uma vez por arquivo) o job que reenvia um upload expirado
+
+    Args:
+        arquivo: Registro de arquivos_chat
+        user_id: Dono do chat (dono do job)
+    """
+    with _reenvios_lock:
+        if arquivo['id'] in _reenvios_pendentes:
+            return
+        _reenvios_pendentes.add(arquivo['id'])
+
+    try:
+        get_job_queue().submit('reenviar_arquivo', user_id, _reenviar_arquivo_job, arquivo)
+    except Exception as e:
+        with _reenvios_lock:
+            _reenvios_pendentes.discard(arquivo['id'])
+        logger.warning(f"⚠️ Não foi possível agendar o reenvio de {arquivo['nome_arquivo']}: {e}")
+
+
+def _reenviar_agora(arquivo):
+    """
+    Reenvia um arquivo expirado durante a requisição (/send-stream)
+
+    Args:
+        arquivo: Registro de arquivos_chat
+
+    Returns:
+        File do Gemini (None se outro reenvio do arquivo já está em andamento
+        ou o upload falhou)
+    """
+    with _reenvios_lock:
+        if arquivo['id'] in _reenvios_pendentes:
+            return None
+        _reenvios_pendentes.add(arquivo['id'])
+
+    try:
+        return _reenviar_arquivo(arquivo)
+    except Exception as e:
+        logger.warning(f"⚠️ Erro ao reenviar {arquivo['nome_arquivo']}: {e}")
+        return None
+    finally:
+        with _reenvios_lock:
+            _reenvios_pendentes.discard(arquivo['id'])
+
+
+def _reenviar_arquivo_job(ctx, arquivo):
+    """
+    Job de reenvio de um arquivo expirado (fica disponível na próxima mensagem)
+
+    Returns:
+        dict: arquivo_id e se o reenvio deu certo
+    """
+    try:
+        uploaded = _reenviar_arquivo(arquivo, cancelled=lambda: ctx.cancelled)
+        return {'arquivo_id': arquivo['id'], 'reenviado': bool(uploaded)}
+    finally:
+        with _reenvios_lock:
+            _reenvios_pendentes.discard(arquivo['id'])
+
+
+def _reenviar_arquivo(arquivo, cancelled=None):
+    """
+    Reenvia ao Gemini um arquivo do chat cujo upload expirou
+
+    Args:
+        arquivo: Registro de arquivos_chat
+        cancelled: Função que retorna True se o job foi cancelado
+
+    Returns:
+        File do Gemini (None se a cópia local não existe ou o upload falhou)
+    """
+    full_path = os.path.join(Config.UPLOAD_FOLDER, arquivo['url_arquivo'])
+
+    if not os.path.exists(full_path):
+        logger.warning(f"⚠️ Cópia local ausente, arquivo não reenviado: {arquivo['url_arquivo']}")
+        return None
+
+    logger.info(f"🔁 Reenviando arquivo expirado: {arquivo['nome_arquivo']}")
+
+    uploaded = gemini.upload_file(full_path, mime_type=arquivo.get('tipo_arquivo'),
+                                  cancelled=cancelled, sha256=arquivo.get('sha256'))
+    if not uploaded:
+        return None
+
+    dao.atualizar_arquivo_gemini(
+        arquivo['id'], uploaded.uri, uploaded.name, uploaded.expiration_time
+    )
+    gemini.files.attach(uploaded.name, arquivo['id'])
+
+    return uploaded
+
+
+def _salvar_troca(chat_id, message, response, usar_contexto_bragantec, analyze_url):
+    """
+    Persiste a mensagem do usuário, a resposta da IA e as ferramentas usadas
+
+    Args:
+        chat_id: ID do chat
+        message: Mensagem original do usuário
+        response: Resultado de gemini.chat (ou evento 'done' do stream)
+        usar_contexto_bragantec: Se o Modo Bragantec estava ativo
+        analyze_url: URL analisada (se houver)
+
+    Returns:
+        dict: Mensagem da IA criada (ou None)
+    """
+    # Salva mensagem do usuário
+    dao.criar_mensagem(chat_id, 'user', message)
+
+    # Salva resposta da IA
+    msg_assistant_id = dao.criar_mensagem(
+        chat_id,
+        'model',
+        response['response'],
+        thinking_process=response.get('thinking_process')
+    )
+
+    # Salva informações sobre ferramentas usadas
+    if msg_assistant_id:
+        ferramentas_usadas = {
+            'google_search': response.get('search_used', False),
+            'contexto_bragantec': usar_contexto_bragantec,
+            'code_execution': response.get('code_executed', False),
+            'url_context': bool(analyze_url)
+        }
+
+        dao.salvar_ferramenta_usada(msg_assistant_id['id'], ferramentas_usadas)
+
+    return msg_assistant_id
+
+
 @chat_bp.route('/')
 @login_required
 def index():
@@ -184,8 +609,6 @@ def send_message():
     data = request.json
     message = data.get('message', '')
     chat_id = data.get('chat_id')
-    usar_pesquisa = data.get('usar_pesquisa', True)
-    usar_code_execution = data.get('usar_code_execution', True)
     analyze_url = data.get('url')
     usar_contexto_bragantec = data.get('usar_contexto_bragantec', False)
 
@@ -193,69 +616,10 @@ def send_message():
         return jsonify({'error': True, 'message': 'Mensagem vazia'}), 400
 
     try:
-        tipo_usuario = None
-        # Tipo de usuário
-        if current_user.is_participante():
-            tipo_usuario = 'participante'
-        elif current_user.is_orientador():
-            tipo_usuario = 'orientador'
-
-        # Cria chat se não existir
-        if not chat_id:
-            tipo_ia_id = 2 if current_user.is_participante() else \
-                        3 if current_user.is_orientador() else 1
-
-            from utils.helpers import generate_chat_title
-            titulo = generate_chat_title(message)
-
-            chat = dao.criar_chat(current_user.id, tipo_ia_id, titulo)
-            chat_id = chat.id
-
-        # Contexto de projetos
-        projetos = dao.listar_projetos_por_usuario(current_user.id)
-        contexto_projetos = ""
-
-        if projetos:
-            contexto_projetos = "\n\n=== SEUS PROJETOS ===\n"
-            for projeto in projetos:
-                contexto_projetos += f"""
-Projeto: {projeto.nome}
-Categoria: {projeto.categoria}
-Status: {projeto.status}
-Resumo: {projeto.resumo or 'Não informado'}
----
-"""
-
-        # ✅ Carrega histórico COM ARQUIVOS
-        mensagens_db = dao.obter_ultimas_n_mensagens(chat_id, n=20)
-        arquivos_db = dao.listar_arquivos_por_chat(chat_id)
-
-        history = []
-        
-        # ✅ Monta histórico incluindo arquivos
-        for msg in mensagens_db:
-            history.append({
-                'role': msg['role'],
-                'parts': [msg['conteudo']]
-            })
-
-        # Mensagem com contexto
-        message_com_contexto = f"{contexto_projetos}\n\n{message}"
-        
-        apelido = current_user.apelido if hasattr(current_user, 'apelido') else None
+        chat_id, gemini_kwargs, _ = _preparar_envio(message, chat_id, data)
 
         # Chama Gemini COM MODO BRAGANTEC
-        response = gemini.chat(
-            message_com_contexto,
-            tipo_usuario=tipo_usuario,
-            history=history,
-            usar_pesquisa=usar_pesquisa,
-            usar_code_execution=usar_code_execution,
-            analyze_url=analyze_url,
-            usar_contexto_bragantec=usar_contexto_bragantec,
-            user_id=current_user.id,
-            apelido=apelido
-        )
+        response = gemini.chat(**gemini_kwargs)
 
         # Extrai contagem de tokens
         tokens_input = response.get('tokens_input', 0)
@@ -268,33 +632,16 @@ Resumo: {projeto.resumo or 'Não informado'}
             if tokens_input > 100000:
                 logger.warning(f"⚠️ ALTO CONSUMO DE INPUT: {tokens_input:,} tokens!")
 
+        if response.get('retry_after'):
+            return _resposta_fila_cheia(response)
+
         if response.get('error'):
             return jsonify({
                 'error': True,
                 'message': response['response']
             }), 500
 
-        # Salva mensagem do usuário
-        dao.criar_mensagem(chat_id, 'user', message)
-
-        # Salva resposta da IA
-        msg_assistant_id = dao.criar_mensagem(
-            chat_id,
-            'model',
-            response['response'],
-            thinking_process=response.get('thinking_process')
-        )
-
-        # Salva informações sobre ferramentas usadas
-        if msg_assistant_id:
-            ferramentas_usadas = {
-                'google_search': response.get('search_used', False),
-                'contexto_bragantec': usar_contexto_bragantec,
-                'code_execution': response.get('code_executed', False),
-                'url_context': bool(analyze_url)
-            }
-            
-            dao.salvar_ferramenta_usada(msg_assistant_id['id'], ferramentas_usadas)
+        _salvar_troca(chat_id, message, response, usar_contexto_bragantec, analyze_url)
 
         return jsonify({
             'success': True,
@@ -318,11 +665,146 @@ Resumo: {projeto.resumo or 'Não informado'}
         }), 500
 
 
+def _resposta_fila_cheia(response):
+    """
+    429 com Retry-After quando a fila do Gemini não admitiu a requisição
+
+    Args:
+        response: Resultado de gemini.chat / chat_with_file com 'retry_after'
+
+    Returns:
+        tuple: (Response, 429)
+    """
+    retry_after = int(response['retry_after'])
+
+    resp = jsonify({
+        'error': True,
+        'message': response['response'],
+        'retry_after': retry_after
+    })
+    resp.headers['Retry-After'] = str(retry_after)
+    return resp, 429
+
+
+def _sse_event(event, data):
+    """Formata um evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@chat_bp.route('/send-stream', methods=['POST'])
+@login_required
+def send_message_stream():
+    """
+    Versão em streaming (SSE) de /send
+
+    Envia thought/text/code/code_result conforme o Gemini gera e, ao final,
+    persiste a mensagem e envia o evento 'done'
+    """
+    if not Config.IA_STATUS:
+        return jsonify({
+            'error': True,
+            'message': 'IA está temporariamente offline.'
+        }), 503
+
+    # Verifica rate limit
+    can_proceed, error_msg = rate_limiter.check_limit(current_user.id)
+
+    if not can_proceed:
+        return jsonify({
+            'error': True,
+            'message': error_msg
+        }), 429
+
+    data = request.json
+    message = data.get('message', '')
+    chat_id = data.get('chat_id')
+    analyze_url = data.get('url')
+    usar_contexto_bragantec = data.get('usar_contexto_bragantec', False)
+
+    if not message:
+        return jsonify({'error': True, 'message': 'Mensagem vazia'}), 400
+
+    try:
+        chat_id, gemini_kwargs, expirados = _preparar_envio(
+            message, chat_id, data, reenviar_em_background=False
+        )
+    except Exception as e:
+        logger.error(f"❌ Erro ao preparar stream: {e}")
+        return jsonify({
+            'error': True,
+            'message': f'Erro: {str(e)}'
+        }), 500
+
+    def generate():
+        # Informa o chat_id logo de início (chat novo)
+        yield _sse_event('start', {'chat_id': chat_id})
+
+        try:
+            # Uploads expirados são refeitos antes da resposta (com aviso de progresso)
+            nao_reanexados = []
+            for arquivo in expirados:
+                yield _sse_event('reattaching', {'arquivo': arquivo['nome_arquivo']})
+
+                uploaded = _reenviar_agora(arquivo)
+                if uploaded:
+                    gemini_kwargs['file_refs'].append((uploaded.uri, arquivo.get('tipo_arquivo')))
+                else:
+                    nao_reanexados.append(arquivo['nome_arquivo'])
+
+            if nao_reanexados:
+                gemini_kwargs['message'] = f"{_nota_arquivos(nao_reanexados, [])}\n\n{gemini_kwargs['message']}"
+
+            for event, payload in gemini.chat_stream(**gemini_kwargs):
+                if event == 'error':
+                    yield _sse_event('error', {
+                        'error': True,
+                        'message': payload['message'],
+                        'retry_after': payload.get('retry_after')
+                    })
+                    return
+
+                if event != 'done':
+                    yield _sse_event(event, payload)
+                    continue
+
+                # Fim do stream: persiste a mensagem montada
+                _salvar_troca(chat_id, message, payload, usar_contexto_bragantec, analyze_url)
+
+                yield _sse_event('done', {
+                    'success': True,
+                    'chat_id': chat_id,
+                    'response': payload['response'],
+                    'thinking_process': payload.get('thinking_process'),
+                    'search_used': payload.get('search_used', False),
+                    'code_executed': payload.get('code_executed', False),
+                    'code_results': payload.get('code_results'),
+                    'tokens_input': payload.get('tokens_input', 0),
+                    'tokens_output': payload.get('tokens_output', 0),
+                    'total_tokens': payload.get('total_tokens', 0)
+                })
+
+        except Exception as e:
+            import traceback
+            logger.error(f"❌ Erro no stream: {traceback.format_exc()}")
+            yield _sse_event('error', {'error': True, 'message': f'Erro: {str(e)}'})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Desativa buffering em proxies (nginx)
+        }
+    )
+
+
 @chat_bp.route('/upload-file', methods=['POST'])
 @login_required
 def upload_file():
     """
     ✅ CORRIGIDO: Upload com MIME type manual + mensagem customizável
+    
+    Responde 202 com o id do job; a análise sai em /jobs/<id>
     """
     if not Config.IA_STATUS:
         return jsonify({'error': True, 'message': 'IA offline'}), 503
@@ -346,99 +828,159 @@ def upload_file():
             }), 400
     
     try:
-        # 1. Salva arquivo TEMPORÁRIO
-        temp_filename = secure_filename(file.filename)
-        temp_path = os.path.join(Config.UPLOAD_FOLDER, f"temp_{uuid.uuid4()}_{temp_filename}")
-        file.save(temp_path)
-        
-        mime_type = _detect_mime_type(temp_filename, file.content_type)
-        logger.info(f"📋 MIME type detectado: {mime_type}")
+        # 1. Salva arquivo PERMANENTEMENTE (o job usa o arquivo depois da requisição)
+        file_info = _save_chat_file_to_disk(file)
+        logger.info(f"📋 MIME type detectado: {file_info['mime_type']}")
         
         tipo_usuario = 'participante' if current_user.is_participante() else \
                        'orientador' if current_user.is_orientador() else None
         
-        # Processa arquivo com Gemini 
-        logger.info(f"📁 Processando arquivo: {temp_filename}")
-        
-        response = gemini.chat_with_file(
-            message, 
-            temp_path, 
-            tipo_usuario,
-            user_id=current_user.id,
-            keep_file_on_gemini=True,
-            mime_type=mime_type 
-        )
-        
-        gemini_file_uri = response.get('gemini_file_uri')
-        
-        # 3. Salva arquivo PERMANENTEMENTE
-        file.seek(0)
-        file_info = _save_chat_file_to_disk(file, current_user.id, chat_id or 0)
-        
-        # 4. Remove arquivo temporário
+        # 2. Upload + processamento no Gemini em background (vídeos levam minutos)
         try:
-            os.remove(temp_path)
-        except:
-            pass
-        
-        # 5. Salva no banco
-        if chat_id:
-            arquivo_id = dao.criar_arquivo_chat(
-                chat_id=int(chat_id),
-                nome_arquivo=file_info['filename'],
-                url_arquivo=file_info['filepath'],
-                tipo_arquivo=file_info['mime_type'],
-                tamanho_bytes=file_info['size'],
-                gemini_file_uri=gemini_file_uri
-            )
-            
-            # 6. Salva mensagens
-            msg_user = dao.criar_mensagem(
-                chat_id, 
-                'user', 
-                f'📎 {message} (arquivo: {file_info["filename"]})'
+            job_id = get_job_queue().submit(
+                'analisar_arquivo',
+                current_user.id,
+                _analisar_arquivo_job,
+                current_user.id,
+                tipo_usuario,
+                int(chat_id) if chat_id else None,
+                message,
+                file_info
             )
-            
-            msg_assistant = dao.criar_mensagem(
-                chat_id, 
-                'model', 
-                response['response'],
-                thinking_process=response.get('thinking_process')
-            )
-            
-            # 7. Associa arquivo à mensagem
-            dao.associar_arquivo_mensagem(arquivo_id, msg_user['id'])
+        except Exception:
+            _soltar_conteudo(file_info)
+            raise
         
         return jsonify({
             'success': True,
-            'response': response['response'],
-            'thinking_process': response.get('thinking_process'),
-            'file_type': response.get('file_type'),
-            'file_info': {
-                'name': file_info['filename'],
-                'size': file_info['size'],
-                'type': file_info['mime_type'],
-                'url': f"/chat/file/{arquivo_id}" if chat_id else None
-            }
-        })
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}'
+        }), 202
         
     except Exception as e:
         import traceback
         logger.error(f"❌ Erro: {traceback.format_exc()}")
         
-        # Limpa temporário
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-        
         return jsonify({
             'error': True,
             'message': f'Erro: {str(e)}'
         }), 500
 
 
+def _analisar_arquivo_job(ctx, user_id, tipo_usuario, chat_id, message, file_info):
+    """
+    Job de análise de arquivo: upload ao Gemini, resposta e persistência
+    
+    Args:
+        ctx: JobContext
+        user_id: ID do usuário
+        tipo_usuario: 'participante' ou 'orientador'
+        chat_id: ID do chat (None = sem chat, arquivo não fica no banco)
+        message: Mensagem que acompanha o arquivo
+        file_info: Retorno de _save_chat_file_to_disk
+    
+    Returns:
+        dict: Mesmo formato da antiga resposta de /upload-file
+    """
+    try:
+        return _processar_arquivo(ctx, user_id, tipo_usuario, chat_id, message, file_info)
+    finally:
+        # Registro gravado (ou upload descartado): o pin não é mais necessário
+        _soltar_conteudo(file_info)
+
+
+def _processar_arquivo(ctx, user_id, tipo_usuario, chat_id, message, file_info):
+    """Corpo de _analisar_arquivo_job (o conteúdo em disco está com pin)"""
+    full_path = os.path.join(Config.UPLOAD_FOLDER, file_info['filepath'])
+    response = {}
+    
+    try:
+        logger.info(f"📁 Processando arquivo: {file_info['filename']}")
+        
+        response = gemini.chat_with_file(
+            message, 
+            full_path, 
+            tipo_usuario,
+            user_id=user_id,
+            keep_file_on_gemini=True,
+            mime_type=file_info['mime_type'],
+            cancelled=lambda: ctx.cancelled,
+            sha256=file_info['sha256']
+        )
+        
+        if response.get('error'):
+            raise RuntimeError(response['response'])
+        
+        ctx.check()
+    
+    except Exception:
+        # Nada foi salvo no banco: descarta a cópia se nenhum outro upload/registro a usa
+        if response.get('gemini_file_name'):
+            gemini.files.discard(response['gemini_file_name'])
+        _soltar_conteudo(file_info)
+        _apagar_conteudo_se_livre(file_info['sha256'], full_path)
+        raise
+    
+    gemini_file_name = response.get('gemini_file_name')
+    arquivo_id = None
+    
+    # 3. Salva no banco (com a cópia em disco garantida)
+    if chat_id:
+        _restaurar_conteudo(file_info)
+        arquivo_id = dao.criar_arquivo_chat(
+            chat_id=chat_id,
+            nome_arquivo=file_info['filename'],
+            url_arquivo=file_info['filepath'],
+            tipo_arquivo=file_info['mime_type'],
+            tamanho_bytes=file_info['size'],
+            gemini_file_uri=response.get('gemini_file_uri'),
+            gemini_file_name=gemini_file_name,
+            gemini_expiration=response.get('gemini_expiration'),
+            sha256=file_info['sha256']
+        )
+        _restaurar_conteudo(file_info)
+        
+        # Arquivo remoto passa a ter dono (não é apagado como órfão)
+        if gemini_file_name and arquivo_id:
+            gemini.files.attach(gemini_file_name, arquivo_id)
+        
+        # 4. Salva mensagens
+        msg_user = dao.criar_mensagem(
+            chat_id, 
+            'user', 
+            f'📎 {message} (arquivo: {file_info["filename"]})'
+        )
+        
+        dao.criar_mensagem(
+            chat_id, 
+            'model', 
+            response['response'],
+            thinking_process=response.get('thinking_process')
+        )
+        
+        # 5. Associa arquivo à mensagem
+        dao.associar_arquivo_mensagem(arquivo_id, msg_user['id'])
+    else:
+        # Sem chat nenhum registro aponta para o arquivo (local nem remoto)
+        if gemini_file_name:
+            gemini.files.discard(gemini_file_name)
+        _soltar_conteudo(file_info)
+        _apagar_conteudo_se_livre(file_info['sha256'], full_path)
+    
+    return {
+        'success': True,
+        'response': response['response'],
+        'thinking_process': response.get('thinking_process'),
+        'file_type': response.get('file_type'),
+        'file_info': {
+            'name': file_info['filename'],
+            'size': file_info['size'],
+            'type': file_info['mime_type'],
+            'url': f"/chat/file/{arquivo_id}" if chat_id else None
+        }
+    }
+
+
 @chat_bp.route('/file/<int:arquivo_id>')
 @login_required
 def serve_file(arquivo_id):
@@ -480,22 +1022,12 @@ def load_history(chat_id):
         if not chat or chat.usuario_id != current_user.id:
             return jsonify({'error': True, 'message': 'Chat não encontrado'}), 404
         
-        mensagens = dao.listar_mensagens_por_chat(chat_id)
-        arquivos = dao.listar_arquivos_por_chat(chat_id)
+        # ✅ Mensagens + notas + arquivos em 2 consultas (sem N+1)
+        mensagens, arquivos = dao.listar_mensagens_enriquecidas(chat_id)
         
-        # Enriquece mensagens com arquivos E NOTAS
+        # Formato compacto do arquivo para o front
         for msg in mensagens:
-            notas = dao.listar_notas_por_mensagem(msg['id'])
-            msg['notas'] = notas if notas else []
-            
-            msg_id = msg.get('id')
-            
-            # Adiciona arquivo se houver
-            arquivo = next(
-                (arq for arq in arquivos if arq.get('mensagem_id') == msg_id),
-                None
-            )
-            
+            arquivo = msg.get('arquivo')
             if arquivo:
                 msg['arquivo'] = {
                     'id': arquivo['id'],
@@ -560,18 +1092,13 @@ def delete_chat(chat_id):
         # 1. Busca arquivos
         arquivos = dao.listar_arquivos_por_chat(chat_id)
         
-        # 2. Deleta físicos
-        for arquivo in arquivos:
-            file_path = os.path.join(Config.UPLOAD_FOLDER, arquivo['url_arquivo'])
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    logger.warning(f"⚠️ Erro ao deletar arquivo: {e}")
-        
-        # 3. Deleta chat (CASCADE)
+        # 2. Deleta chat (CASCADE)
         dao.deletar_chat(chat_id)
         
+        # 3. Deleta cópias (disco e Gemini) que nenhum outro chat usa
+        for arquivo in arquivos:
+            _remover_arquivo_armazenado(arquivo)
+        
         return jsonify({'success': True})
         
     except Exception as e:
@@ -584,7 +1111,7 @@ def delete_chat(chat_id):
 @chat_bp.route('/count-tokens', methods=['POST'])
 @login_required
 def count_tokens():
-    """Conta tokens de uma mensagem"""
+    """Conta tokens de uma mensagem (estimativa local, sem chamar a API)"""
     data = request.json
     text = data.get('text', '')
     
@@ -596,6 +1123,7 @@ def count_tokens():
         return jsonify({
             'success': True,
             'tokens': tokens,
+            'estimated': True,
             'within_limit': tokens <= 1000000
         })
     except Exception as e:
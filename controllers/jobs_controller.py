@@ -0,0 +1,47 @@
+from flask import Blueprint, jsonify
+from flask_login import login_required, current_user
+from services.job_queue import get_job_queue
+from utils.advanced_logger import logger
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+
+def _job_do_usuario(job_id):
+    """Job do usuário logado (None se não existe ou é de outro usuário)"""
+    job = get_job_queue().get(job_id)
+    if not job or job['user_id'] != current_user.id:
+        return None
+    return job
+
+
+@jobs_bp.route('/<job_id>')
+@login_required
+def status(job_id):
+    """
+    Status e resultado de um job
+
+    Enquanto status for 'queued'/'running' o front-end volta a consultar;
+    em 'done' o resultado vem em job.result
+    """
+    job = _job_do_usuario(job_id)
+
+    if not job:
+        return jsonify({'error': True, 'message': 'Job não encontrado'}), 404
+
+    return jsonify({'success': True, 'job': job})
+
+
+@jobs_bp.route('/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel(job_id):
+    """Cancela um job em andamento"""
+    job = _job_do_usuario(job_id)
+
+    if not job:
+        return jsonify({'error': True, 'message': 'Job não encontrado'}), 404
+
+    if not get_job_queue().cancel(job_id):
+        return jsonify({'error': True, 'message': 'Job já finalizado'}), 409
+
+    logger.info(f"🛑 User {current_user.id} cancelou o job {job_id}")
+    return jsonify({'success': True})
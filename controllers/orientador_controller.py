@@ -1,12 +1,12 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
 from flask_login import login_required, current_user
 from functools import wraps
-from dao.dao import SupabaseDAO
+from dao.dao import get_dao
 from utils.advanced_logger import logger
 from datetime import datetime
 
 orientador_bp = Blueprint('orientador', __name__, url_prefix='/orientador')
-dao = SupabaseDAO()
+dao = get_dao()
 
 
 def orientador_required(f):
@@ -89,23 +89,11 @@ def visualizar_chat(chat_id):
         flash('Acesso negado. Este não é seu orientado.', 'error')
         return redirect(url_for('orientador.dashboard'))
     
-    # Busca mensagens COM metadados de ferramentas
-    mensagens = dao.listar_mensagens_por_chat(chat_id)
+    # Busca mensagens COM notas e arquivos (2 consultas, sem N+1)
+    mensagens, _ = dao.listar_mensagens_enriquecidas(chat_id)
     
-    # Busca arquivos do chat
-    arquivos = dao.listar_arquivos_por_chat(chat_id)
-    
-    # Enriquece mensagens com:
-    # - Notas do orientador
-    # - Ferramentas usadas
-    # - Arquivos anexados
+    # Identifica ferramentas usadas (salvas na coluna ferramenta_usada)
     for msg in mensagens:
-        msg_id = msg.get('id')
-        
-        # Busca notas desta mensagem
-        msg['notas'] = dao.listar_notas_por_mensagem(msg_id)
-        
-        # Identifica ferramentas usadas (salvas na coluna ferramenta_usada)
         ferramenta_usada = msg.get('ferramenta_usada')
         if ferramenta_usada:
             # Parse do JSON se necessário
@@ -114,11 +102,6 @@ def visualizar_chat(chat_id):
                 msg['ferramentas'] = json.loads(ferramenta_usada) if isinstance(ferramenta_usada, str) else ferramenta_usada
             except:
                 msg['ferramentas'] = {'raw': ferramenta_usada}
-        
-        # Busca arquivo anexado
-        arquivo = next((arq for arq in arquivos if arq.get('mensagem_id') == msg_id), None)
-        if arquivo:
-            msg['arquivo'] = arquivo
     
     # Busca dados do orientado
     orientado = dao.buscar_usuario_por_id(chat.usuario_id)
@@ -1,14 +1,112 @@
 from flask import Blueprint, render_template, request, jsonify, send_file
 from flask_login import login_required, current_user
-from dao.dao import SupabaseDAO
-from services.gemini_service import GeminiService
+from dao.dao import get_dao
+from services.gemini_service import get_gemini_service
+from services.job_queue import get_job_queue
+from services.variant_pool import get_variant_pool, prompt_key
+from services.structured_output import (
+    CATEGORIAS, IDEIAS_SCHEMA, validar_ideias, schema_autocompletar, validador_autocompletar
+)
 from datetime import datetime
 from utils.advanced_logger import logger
-import json
 
 project_bp = Blueprint('project', __name__, url_prefix='/projetos')
-dao = SupabaseDAO()
-gemini = GeminiService()
+dao = get_dao()
+gemini = get_gemini_service()
+
+# Prompt da geração de ideias (igual para todos os usuários: resultado vai para o pool)
+PROMPT_IDEIAS = """
+    🎯 **MISSÃO CRÍTICA: CRIAR PROJETOS VENCEDORES PARA A BRAGANTEC 2025**
+
+    Você tem acesso ao histórico COMPLETO das edições anteriores da Bragantec (feira de ciências do IFSP Bragança Paulista), incluindo cadernos de resumos com TODOS os projetos vencedores.
+
+    **ANÁLISE OBRIGATÓRIA ANTES DE CRIAR:**
+    
+    1. **ESTUDE OS PROJETOS VENCEDORES** nos arquivos de contexto que você possui
+    2. **IDENTIFIQUE PADRÕES DE SUCESSO:**
+       - Que temas/abordagens venceram mais?
+       - Quais características os projetos premiados têm em comum?
+       - Que nível de complexidade/inovação foi valorizado?
+       - Quais problemas reais foram abordados?
+       - Que metodologias foram bem avaliadas?
+    
+    3. **EXTRAIA INSIGHTS DOS VENCEDORES:**
+       - Títulos: Como eram formulados?
+       - Relevância: Que impacto social/científico tinham?
+       - Inovação: O que os diferenciava?
+       - Viabilidade: Eram projetos executáveis por estudantes?
+    
+    4. **ENTENDA OS CRITÉRIOS DE AVALIAÇÃO:**
+       - **Inovação e criatividade** (30 pontos)
+       - **Relevância científica/social** (25 pontos)
+       - **Fundamentação teórica** (20 pontos)
+       - **Viabilidade de execução** (15 pontos)
+       - **Impacto potencial** (10 pontos)
+
+    ---
+
+    **AGORA CRIE 4 IDEIAS DE PROJETOS (UMA POR CATEGORIA):**
+
+    Com base na sua análise dos projetos vencedores das edições anteriores da Bragantec, crie UMA ideia de projeto para CADA uma das 4 categorias:
+
+    1. **Ciências da Natureza e Exatas**
+    2. **Informática**
+    3. **Ciências Humanas e Linguagens**
+    4. **Engenharias**
+
+    **REQUISITOS PARA CADA PROJETO:**
+
+    ✅ **DEVE SER INSPIRADO EM PROJETOS VENCEDORES ANTERIORES** (mas não cópia!)
+    ✅ **DEVE ABORDAR PROBLEMAS REAIS E ATUAIS DE 2025**
+    ✅ **DEVE SER INOVADOR** (trazer algo novo ou melhorado)
+    ✅ **DEVE SER VIÁVEL** para estudantes de ensino médio/técnico executarem
+    ✅ **DEVE TER IMPACTO** científico, social ou ambiental mensurável
+    ✅ **DEVE TER FUNDAMENTAÇÃO TEÓRICA** sólida
+
+    ---
+
+    **PARA CADA CATEGORIA, FORNEÇA:**
+
+    - **titulo**: Título atrativo, direto e científico (máx 80 caracteres)
+      * Exemplo de títulos vencedores: específicos, técnicos, com termos científicos
+    
+    - **resumo**: Resumo executivo COMPLETO E PROFISSIONAL (200-250 palavras) contendo:
+      * **Introdução**: Contexto e problema (2-3 frases)
+      * **Objetivos**: O que o projeto pretende alcançar (1-2 frases)
+      * **Metodologia**: Como será desenvolvido - materiais, métodos (3-4 frases)
+      * **Resultados Esperados**: Impactos e conclusões esperadas (2-3 frases)
+      * **Relevância**: Por que é importante (1-2 frases)
+    
+    - **palavras_chave**: Exatamente 3 palavras-chave técnicas/científicas separadas por vírgula
+      * Use termos que projetos vencedores usaram
+    
+    - **inspiracao_vencedores**: Liste 2-3 características de projetos vencedores que inspiraram esta ideia
+      * Exemplo: "Baseado no padrão de projetos premiados que abordam sustentabilidade com tecnologia IoT"
+    
+    - **diferenciais_competitivos**: O que torna este projeto um VENCEDOR POTENCIAL (máx 150 palavras)
+      * Compare com projetos vencedores anteriores
+      * Explique por que este seria bem avaliado pelos jurados
+    
+    - **viabilidade_tecnica**: Nível de dificuldade e recursos necessários (máx 100 palavras)
+      * Seja realista sobre o que estudantes podem fazer
+
+    ---
+
+    **FORMATO DE SAÍDA:**
+
+    Um objeto JSON com uma chave por categoria (nomes exatos acima), cada uma
+    com os campos descritos. O formato é imposto pelo esquema da resposta.
+
+    **LEMBRE-SE:**
+    - Você tem acesso aos cadernos de resumos das edições anteriores da Bragantec
+    - USE esse conhecimento para criar projetos com padrões de sucesso comprovados
+    - Não copie projetos, mas INSPIRE-SE nos elementos que fizeram eles vencerem
+    - Pense como um jurado: O que ME impressionaria neste projeto?
+    """
+
+# Chave do pool de variantes (muda quando o prompt muda)
+IDEIAS_KEY = prompt_key('gerar_ideias', PROMPT_IDEIAS)
+
 
 @project_bp.route('/')
 @login_required
@@ -156,233 +254,145 @@ def gerar_ideias():
     """
     Analisa projetos vencedores das edições anteriores da Bragantec
     para criar 4 novas ideias com ALTO POTENCIAL DE VITÓRIA que vao deixar os outros no CHINELO kkkkk
+    
+    O prompt não depende do usuário: responde na hora com uma variante do
+    pool quando houver; senão cria um job (pedidos simultâneos compartilham
+    a mesma chamada ao Gemini)
     """
     logger.info(f"💡 Gerando ideias com análise de vencedores - Usuário: {current_user.nome_completo}")
     
-    try:
-        # Prompt que analisa projetos
-        prompt = """
-        🎯 **MISSÃO CRÍTICA: CRIAR PROJETOS VENCEDORES PARA A BRAGANTEC 2025**
-
-        Você tem acesso ao histórico COMPLETO das edições anteriores da Bragantec (feira de ciências do IFSP Bragança Paulista), incluindo cadernos de resumos com TODOS os projetos vencedores.
-
-        **ANÁLISE OBRIGATÓRIA ANTES DE CRIAR:**
-        
-        1. **ESTUDE OS PROJETOS VENCEDORES** nos arquivos de contexto que você possui
-        2. **IDENTIFIQUE PADRÕES DE SUCESSO:**
-           - Que temas/abordagens venceram mais?
-           - Quais características os projetos premiados têm em comum?
-           - Que nível de complexidade/inovação foi valorizado?
-           - Quais problemas reais foram abordados?
-           - Que metodologias foram bem avaliadas?
-        
-        3. **EXTRAIA INSIGHTS DOS VENCEDORES:**
-           - Títulos: Como eram formulados?
-           - Relevância: Que impacto social/científico tinham?
-           - Inovação: O que os diferenciava?
-           - Viabilidade: Eram projetos executáveis por estudantes?
-        
-        4. **ENTENDA OS CRITÉRIOS DE AVALIAÇÃO:**
-           - **Inovação e criatividade** (30 pontos)
-           - **Relevância científica/social** (25 pontos)
-           - **Fundamentação teórica** (20 pontos)
-           - **Viabilidade de execução** (15 pontos)
-           - **Impacto potencial** (10 pontos)
-
-        ---
-
-        **AGORA CRIE 4 IDEIAS DE PROJETOS (UMA POR CATEGORIA):**
-
-        Com base na sua análise dos projetos vencedores das edições anteriores da Bragantec, crie UMA ideia de projeto para CADA uma das 4 categorias:
-
-        1. **Ciências da Natureza e Exatas**
-        2. **Informática**
-        3. **Ciências Humanas e Linguagens**
-        4. **Engenharias**
-
-        **REQUISITOS PARA CADA PROJETO:**
-
-        ✅ **DEVE SER INSPIRADO EM PROJETOS VENCEDORES ANTERIORES** (mas não cópia!)
-        ✅ **DEVE ABORDAR PROBLEMAS REAIS E ATUAIS DE 2025**
-        ✅ **DEVE SER INOVADOR** (trazer algo novo ou melhorado)
-        ✅ **DEVE SER VIÁVEL** para estudantes de ensino médio/técnico executarem
-        ✅ **DEVE TER IMPACTO** científico, social ou ambiental mensurável
-        ✅ **DEVE TER FUNDAMENTAÇÃO TEÓRICA** sólida
-
-        ---
-
-        **PARA CADA CATEGORIA, FORNEÇA:**
-
-        - **titulo**: Título atrativo, direto e científico (máx 80 caracteres)
-          * Exemplo de títulos vencedores: específicos, técnicos, com termos científicos
-        
-        - **resumo**: Resumo executivo COMPLETO E PROFISSIONAL (200-250 palavras) contendo:
-          * **Introdução**: Contexto e problema (2-3 frases)
-          * **Objetivos**: O que o projeto pretende alcançar (1-2 frases)
-          * **Metodologia**: Como será desenvolvido - materiais, métodos (3-4 frases)
-          * **Resultados Esperados**: Impactos e conclusões esperadas (2-3 frases)
-          * **Relevância**: Por que é importante (1-2 frases)
-        
-        - **palavras_chave**: Exatamente 3 palavras-chave técnicas/científicas separadas por vírgula
-          * Use termos que projetos vencedores usaram
-        
-        - **inspiracao_vencedores**: Liste 2-3 características de projetos vencedores que inspiraram esta ideia
-          * Exemplo: "Baseado no padrão de projetos premiados que abordam sustentabilidade com tecnologia IoT"
-        
-        - **diferenciais_competitivos**: O que torna este projeto um VENCEDOR POTENCIAL (máx 150 palavras)
-          * Compare com projetos vencedores anteriores
-          * Explique por que este seria bem avaliado pelos jurados
-        
-        - **viabilidade_tecnica**: Nível de dificuldade e recursos necessários (máx 100 palavras)
-          * Seja realista sobre o que estudantes podem fazer
-
-        ---
-
-        **FORMATO DE SAÍDA (JSON ESTRITO):**
-
-        Retorne APENAS um JSON válido (sem texto adicional) no formato:
-
-        ```json
-        {
-          "Ciências da Natureza e Exatas": {
-            "titulo": "...",
-            "resumo": "...",
-            "palavras_chave": "palavra1, palavra2, palavra3",
-            "inspiracao_vencedores": "...",
-            "diferenciais_competitivos": "...",
-            "viabilidade_tecnica": "..."
-          },
-          "Informática": {
-            "titulo": "...",
-            "resumo": "...",
-            "palavras_chave": "palavra1, palavra2, palavra3",
-            "inspiracao_vencedores": "...",
-            "diferenciais_competitivos": "...",
-            "viabilidade_tecnica": "..."
-          },
-          "Ciências Humanas e Linguagens": {
-            "titulo": "...",
-            "resumo": "...",
-            "palavras_chave": "palavra1, palavra2, palavra3",
-            "inspiracao_vencedores": "...",
-            "diferenciais_competitivos": "...",
-            "viabilidade_tecnica": "..."
-          },
-          "Engenharias": {
-            "titulo": "...",
-            "resumo": "...",
-            "palavras_chave": "palavra1, palavra2, palavra3",
-            "inspiracao_vencedores": "...",
-            "diferenciais_competitivos": "...",
-            "viabilidade_tecnica": "..."
-          }
-        }
-        ```
+    pool = get_variant_pool()
+    pool.register(IDEIAS_KEY, _gerar_variante_ideias)
+    
+    # ✅ Variante pronta: sem tocar na cota
+    variant = pool.get(IDEIAS_KEY)
+    if variant:
+        logger.info(f"🧺 Ideias servidas do pool (variante de {variant['age_seconds']}s)")
+        return jsonify(_resposta_ideias(variant, 'hit'))
+    
+    # ✅ Roda em background: responde na hora com o id do job (resultado em /jobs/<id>)
+    job_id = get_job_queue().submit('gerar_ideias', current_user.id, _gerar_ideias_job, current_user.id)
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': f'/jobs/{job_id}'
+    }), 202
 
-        **LEMBRE-SE:**
-        - Você tem acesso aos cadernos de resumos das edições anteriores da Bragantec
-        - USE esse conhecimento para criar projetos com padrões de sucesso comprovados
-        - Não copie projetos, mas INSPIRE-SE nos elementos que fizeram eles vencerem
-        - Pense como um jurado: O que ME impressionaria neste projeto?
 
-        **NÃO ADICIONE TEXTO EXPLICATIVO. RETORNE APENAS O JSON.**
-        """
-        
-        logger.info("🤖 Chamando Gemini com Modo Bragantec OBRIGATÓRIO")
-        logger.debug("⚠️ Consumo estimado: ~100k-200k tokens de input")
-        
-        response = gemini.chat(
-            prompt, 
-            tipo_usuario='participante',
-            usar_contexto_bragantec=True,  # OBRIGATÓRIO
-            usar_pesquisa=True,
-            usar_code_execution=False,
-            user_id=current_user.id
-        )
-        
-        if response.get('error'):
-            logger.error(f"❌ Erro na resposta do Gemini: {response.get('response')}")
-            return jsonify({
-                'error': True,
-                'message': 'Erro ao gerar ideias com IA'
-            }), 500
-        
-        logger.info("✅ Resposta recebida do Gemini")
-        
-        # Tenta parsear a resposta como JSON
-        ideias_text = response['response']
-        
-        try:
-            # Remove possíveis blocos de código markdown
-            if '```json' in ideias_text:
-                ideias_text = ideias_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in ideias_text:
-                ideias_text = ideias_text.split('```')[1].split('```')[0].strip()
-            
-            # Parse JSON
-            ideias = json.loads(ideias_text)
-            
-            logger.debug("✅ JSON parseado com sucesso")
-            
-            # Valida estrutura e adiciona metadados
-            categorias_esperadas = [
-                "Ciências da Natureza e Exatas",
-                "Informática",
-                "Ciências Humanas e Linguagens",
-                "Engenharias"
-            ]
-            
-            for categoria in categorias_esperadas:
-                if categoria not in ideias:
-                    raise ValueError(f"Categoria '{categoria}' não encontrada")
-                
-                ideia = ideias[categoria]
-                campos_obrigatorios = ['titulo', 'resumo', 'palavras_chave']
-                
-                for campo in campos_obrigatorios:
-                    if campo not in ideia:
-                        raise ValueError(f"Campo '{campo}' não encontrado em '{categoria}'")
-                
-                # Adiciona metadado de que foi gerado com análise de vencedores
-                ideia['gerado_com_analise_vencedores'] = True
-                ideia['ano_geracao'] = 2025
-            
-            logger.info("✅ Ideias validadas e enriquecidas com metadados")
-            
-            # Retorna ideias estruturadas COM metadados
-            return jsonify({
-                'success': True,
-                'ideias': ideias,
-                'formato': 'json',
-                'metadata': {
-                    'analise_vencedores': True,
-                    'modo_bragantec': True,
-                    'contexto_usado': 'Cadernos de resumos das edições anteriores',
-                    'aviso_tokens': 'Esta operação consumiu ~100k-200k tokens (contexto histórico completo)'
-                }
-            })
-            
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.warning(f"⚠️ Erro ao parsear JSON: {e}")
-            logger.debug(f"📄 Resposta bruta (primeiros 500 chars): {ideias_text[:500]}")
-            
-            # Fallback: Se não conseguir parsear, retorna texto bruto
-            return jsonify({
-                'success': True,
-                'ideias': ideias_text,
-                'formato': 'texto',
-                'aviso': 'A IA não retornou JSON estruturado. Exibindo texto bruto.'
-            })
-        
-    except Exception as e:
-        logger.error(f"❌ Erro ao gerar ideias: {str(e)}")
-        import traceback
-        logger.error(f"Traceback completo:\n{traceback.format_exc()}")
-        
-        return jsonify({
-            'error': True,
-            'message': f'Erro ao gerar ideias: {str(e)}'
-        }), 500
+def _gerar_ideias_job(ctx, user_id):
+    """
+    Job de geração de ideias: variante do pool ou geração compartilhada
+    
+    Args:
+        ctx: JobContext
+        user_id: ID do usuário que pediu
+    
+    Returns:
+        dict: Mesmo formato da antiga resposta de /gerar-ideias
+    """
+    ctx.check()
+    
+    variant, origem = get_variant_pool().get_or_generate(
+        IDEIAS_KEY,
+        lambda existentes: _gerar_variante_ideias(existentes, user_id, cancelled=lambda: ctx.cancelled),
+        cancelled=lambda: ctx.cancelled
+    )
+    
+    return _resposta_ideias(variant, origem)
+
+
+def _gerar_variante_ideias(existentes, user_id=None, cancelled=None):
+    """
+    Gera uma variante de ideias (corpus completo da Bragantec, ~100k-200k tokens)
+    
+    Args:
+        existentes: Variantes já no pool (os títulos delas são evitados)
+        user_id: Usuário que pediu (None = reposição em background)
+        cancelled: Função que retorna True se o job foi cancelado
+    
+    Returns:
+        dict: {'ideias', 'tokens_input', 'tokens_output'}
+    """
+    prompt = PROMPT_IDEIAS
+    
+    # Diversidade do pool: pede temas diferentes dos que já existem
+    titulos = [
+        ideia.get('titulo')
+        for variante in existentes
+        for ideia in variante.get('ideias', {}).values()
+        if isinstance(ideia, dict) and ideia.get('titulo')
+    ]
+    if titulos:
+        prompt += "\n\n**JÁ SUGERIDOS (crie ideias com temas diferentes destes):**\n" + \
+                  "\n".join(f"- {titulo}" for titulo in titulos)
+    
+    logger.info("🤖 Chamando Gemini com Modo Bragantec OBRIGATÓRIO")
+    logger.debug("⚠️ Consumo estimado: ~100k-200k tokens de input")
+    
+    # ✅ Saída estruturada (response_schema) validada no servidor, com reparo limitado
+    response = gemini.generate_json(
+        prompt,
+        IDEIAS_SCHEMA,
+        validator=validar_ideias,
+        operation='GERAR_IDEIAS',
+        tipo_usuario='participante',
+        user_id=user_id,
+        usar_contexto_bragantec=True,  # OBRIGATÓRIO: analisa TODOS os cadernos
+        cancelled=cancelled
+    )
+    
+    if response.get('error'):
+        logger.error(f"❌ Erro na resposta do Gemini: {response.get('response')}")
+        raise RuntimeError(response.get('response') or 'Erro ao gerar ideias com IA')
+    
+    ideias = response['data']
+    
+    # Adiciona metadado de que foi gerado com análise de vencedores
+    for categoria in CATEGORIAS:
+        ideias[categoria]['gerado_com_analise_vencedores'] = True
+        ideias[categoria]['ano_geracao'] = 2025
+    
+    logger.info(f"✅ Ideias validadas ({response['attempts']} tentativa(s))")
+    
+    return {
+        'ideias': ideias,
+        'tokens_input': response['tokens_input'],
+        'tokens_output': response['tokens_output']
+    }
+
+
+def _resposta_ideias(variant, origem):
+    """
+    Resposta de /gerar-ideias a partir de uma variante do pool
+    
+    Args:
+        variant: Variante (VariantPool.get)
+        origem: 'hit' (pool), 'coalesced' (geração compartilhada) ou 'miss' (gerada agora)
+    
+    Returns:
+        dict: Ideias estruturadas COM metadados
+    """
+    data = variant['data']
+    
+    return {
+        'success': True,
+        'ideias': data['ideias'],
+        'formato': 'json',
+        'metadata': {
+            'analise_vencedores': True,
+            'modo_bragantec': True,
+            'contexto_usado': 'Cadernos de resumos das edições anteriores',
+            'cache': origem,
+            'gerado_ha_segundos': variant['age_seconds'],
+            'tokens_input': data.get('tokens_input', 0) if origem == 'miss' else 0,
+            'tokens_output': data.get('tokens_output', 0) if origem == 'miss' else 0,
+            'aviso_tokens': (
+                'Esta operação consumiu ~100k-200k tokens (contexto histórico completo)'
+                if origem == 'miss' else 'Ideias já geradas: nenhum token consumido agora'
+            )
+        }
+    }
 
 @project_bp.route('/autocompletar', methods=['POST'])
 @login_required
@@ -410,6 +420,11 @@ def autocompletar():
         resumo = projeto_parcial.get('resumo', 'Não informado')
         palavras_chave = projeto_parcial.get('palavras_chave', 'Não informado')
         
+        try:
+            schema, chaves = schema_autocompletar(campos)
+        except ValueError as e:
+            return jsonify({'error': True, 'message': str(e)}), 400
+        
         # Monta prompt dinâmico
         campos_str = ', '.join(campos)
         
@@ -428,20 +443,7 @@ def autocompletar():
         1. Gere conteúdo profissional, acadêmico e adequado para feira de ciências
         2. Use linguagem científica mas acessível para estudantes de ensino médio
         3. Baseie-se nos critérios de avaliação da Bragantec
-        4. Retorne APENAS um JSON válido no formato:
-
-        {{
-          "introducao": "texto da introdução (se solicitado)...",
-          "objetivo_geral": "texto do objetivo geral (se solicitado)...",
-          "metodologia": "texto da metodologia (se solicitado)...",
-          "resultados_esperados": "texto dos resultados (se solicitado)..."
-        }}
-
-        **IMPORTANTE**:
-        - Inclua APENAS os campos que foram solicitados: {campos_str}
-        - NÃO adicione texto explicativo antes ou depois do JSON
-        - Retorne APENAS o JSON válido
-        - Se o campo for "objetivos", inclua "objetivo_geral" no JSON
+        4. Preencha apenas os campos do esquema da resposta ({campos_str}); "objetivos" = "objetivo_geral"
 
         **REFERÊNCIAS PARA CADA CAMPO**:
 
@@ -456,48 +458,36 @@ def autocompletar():
         
         logger.info("🤖 Chamando Gemini para autocompletar")
         
-        # Chama Gemini
-        response = gemini.chat(
-            prompt, 
+        # ✅ Saída estruturada só com os campos pedidos
+        response = gemini.generate_json(
+            prompt,
+            schema,
+            validator=validador_autocompletar(chaves),
+            operation='AUTOCOMPLETAR',
             tipo_usuario='participante',
             user_id=current_user.id
         )
         
+        if response.get('retry_after'):
+            resp = jsonify({
+                'error': True,
+                'message': response['response'],
+                'retry_after': response['retry_after']
+            })
+            resp.headers['Retry-After'] = str(response['retry_after'])
+            return resp, 429
+        
         if response.get('error'):
             logger.error(f"❌ Erro na resposta do Gemini: {response.get('response')}")
-            return jsonify({'error': True, 'message': 'Erro ao autocompletar'}), 500
+            return jsonify({'error': True, 'message': response.get('response') or 'Erro ao autocompletar'}), 500
         
-        logger.info("✅ Resposta recebida do Gemini")
+        logger.info(f"✅ Conteúdo validado ({response['attempts']} tentativa(s))")
         
-        # Tenta parsear resposta como JSON
-        try:
-            conteudo_text = response['response']
-            
-            # Remove blocos markdown
-            if '```json' in conteudo_text:
-                conteudo_text = conteudo_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in conteudo_text:
-                conteudo_text = conteudo_text.split('```')[1].split('```')[0].strip()
-            
-            conteudo = json.loads(conteudo_text)
-            
-            logger.debug("✅ JSON parseado com sucesso")
-            
-            return jsonify({
-                'success': True,
-                'conteudo': conteudo,
-                'formato': 'json'
-            })
-            
-        except json.JSONDecodeError:
-            logger.warning("⚠️ Erro ao parsear JSON do autocompletar")
-            
-            # Fallback: retorna texto bruto
-            return jsonify({
-                'success': True,
-                'conteudo': {'texto': response['response']},
-                'formato': 'texto'
-            })
+        return jsonify({
+            'success': True,
+            'conteudo': response['data'],
+            'formato': 'json'
+        })
         
     except Exception as e:
         logger.error(f"❌ Erro ao autocompletar: {str(e)}")
@@ -1,4 +1,4 @@
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
 from config import Config
 from models.models import Usuario, Projeto, Chat
 import bcrypt
@@ -6,21 +6,153 @@ from utils.advanced_logger import logger, log_database_operation
 from utils.helpers import validate_bp, format_bp
 from models.models import TipoIA
 from datetime import datetime
+from utils import request_cache
+from dao.http_pool import get_http_client
+import copy
+import threading
+import time
+
+
+class OrientadosCache:
+    """
+    Cache curto (TTL) do painel do orientador, por orientador_id
+
+    Compartilhado entre todas as instâncias do DAO. Invalidado quando um
+    orientado cria/deleta chat (índice reverso participante -> orientadores)
+    """
+
+    def __init__(self, ttl_seconds=30):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}          # {orientador_id: (expira_em, orientados)}
+        self._por_participante = {} # {participante_id: {orientador_id, ...}}
+        self._dono_chat = {}        # {chat_id: participante_id}
+
+    def get(self, orientador_id):
+        if self.ttl_seconds <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(orientador_id)
+            if not entry or entry[0] < time.time():
+                return None
+            return copy.deepcopy(entry[1])
+
+    def set(self, orientador_id, orientados):
+        if self.ttl_seconds <= 0:
+            return
+
+        with self._lock:
+            self._entries[orientador_id] = (time.time() + self.ttl_seconds, copy.deepcopy(orientados))
+            for orientado in orientados:
+                self._por_participante.setdefault(orientado['id'], set()).add(orientador_id)
+                for chat in orientado.get('chats', []):
+                    self._dono_chat[chat['id']] = orientado['id']
+
+    def invalidar_participante(self, participante_id):
+        """Descarta o painel de todos os orientadores deste participante"""
+        with self._lock:
+            for orientador_id in self._por_participante.pop(participante_id, set()):
+                self._entries.pop(orientador_id, None)
+
+    def invalidar_chat(self, chat_id):
+        """Descarta o painel que contém este chat"""
+        with self._lock:
+            participante_id = self._dono_chat.pop(chat_id, None)
+
+        if participante_id is not None:
+            self.invalidar_participante(participante_id)
+
+    def clear(self):
+        """Descarta tudo (vínculos orientador/projeto/participante mudaram)"""
+        with self._lock:
+            self._entries.clear()
+            self._por_participante.clear()
+            self._dono_chat.clear()
+
+
+# Instância global
+orientados_cache = OrientadosCache(ttl_seconds=Config.ORIENTADOS_CACHE_TTL_SECONDS)
+
+
 class SupabaseDAO:
     # Data Access Object para Supabase
     
     def __init__(self): 
+        """Use get_dao() para a instância compartilhada do processo"""
         logger.info("🗄️ Inicializando SupabaseDAO...")
         try:
+            # ✅ Transporte HTTP compartilhado (conexões keep-alive reaproveitadas)
             self.supabase: Client = create_client(
                 Config.SUPABASE_URL, 
-                Config.SUPABASE_KEY
+                Config.SUPABASE_KEY,
+                options=ClientOptions(httpx_client=get_http_client())
             )
             logger.info(f"✅ Conectado ao Supabase: {Config.SUPABASE_URL}")
         except Exception as e:
             logger.critical(f"💥 ERRO ao conectar ao Supabase: {e}")
             raise
     
+    # ============ CONSULTAS EM LOTE ============
+    
+    # Máximo de IDs por filtro in_ (evita URLs gigantes no PostgREST)
+    TAMANHO_LOTE_IN = 200
+    
+    # Linhas por página em consultas que podem passar do max-rows do
+    # PostgREST (1000 por padrão no Supabase; não pode ser maior que ele)
+    TAMANHO_PAGINA = 1000
+    
+    def _buscar_paginado(self, montar_query):
+        """
+        Executa uma consulta em páginas (.range) até vir uma página incompleta
+        
+        Args:
+            montar_query: Função que devolve a query (com ordem estável)
+        
+        Returns:
+            list: Todas as linhas
+        """
+        linhas = []
+        
+        while True:
+            result = montar_query()\
+                .range(len(linhas), len(linhas) + self.TAMANHO_PAGINA - 1)\
+                .execute()
+            
+            pagina = result.data or []
+            linhas.extend(pagina)
+            
+            if len(pagina) < self.TAMANHO_PAGINA:
+                return linhas
+    
+    def _buscar_em_lotes(self, tabela, coluna, valores, select='*'):
+        """
+        Busca linhas cujo `coluna` está em `valores` usando filtros in_
+        
+        Args:
+            tabela: Nome da tabela
+            coluna: Coluna filtrada
+            valores: IDs a buscar
+            select: Colunas retornadas
+        
+        Returns:
+            list: Linhas encontradas
+        """
+        valores = list(dict.fromkeys(v for v in valores if v is not None))
+        linhas = []
+        
+        for inicio in range(0, len(valores), self.TAMANHO_LOTE_IN):
+            lote = valores[inicio:inicio + self.TAMANHO_LOTE_IN]
+            result = self.supabase.table(tabela)\
+                .select(select)\
+                .in_(coluna, lote)\
+                .execute()
+            
+            if result.data:
+                linhas.extend(result.data)
+        
+        return linhas
+    
     # ============ USUÁRIOS ============
     
     def criar_usuario(self, nome_completo, email, senha, tipo_usuario_id, numero_inscricao=None):
@@ -59,10 +191,27 @@ class SupabaseDAO:
 
     def buscar_usuario_por_id(self, usuario_id):
         """Busca usuário por ID"""
-        logger.debug(f"🔍 Buscando usuário ID: {usuario_id}")
-        result = self.supabase.table('usuarios').select('*').eq('id', usuario_id).execute()
-        log_database_operation('SELECT', 'usuarios', data={'id': usuario_id}, result='Found' if result.data else 'Not Found')
-        return self._row_to_usuario(result.data[0]) if result.data else None
+        row = self.buscar_dados_usuario(usuario_id)
+        return self._row_to_usuario(row) if row else None
+    
+    def buscar_dados_usuario(self, usuario_id):
+        """
+        Busca a linha completa do usuário (inclui colunas de sessão)
+        Memoizada durante a requisição (load_user, sessão e controllers)
+        
+        Args:
+            usuario_id: ID do usuário
+        
+        Returns:
+            dict: Linha da tabela usuarios ou None
+        """
+        def carregar():
+            logger.debug(f"🔍 Buscando usuário ID: {usuario_id}")
+            result = self.supabase.table('usuarios').select('*').eq('id', usuario_id).execute()
+            log_database_operation('SELECT', 'usuarios', data={'id': usuario_id}, result='Found' if result.data else 'Not Found')
+            return result.data[0] if result.data else None
+        
+        return request_cache.memoize('usuarios', usuario_id, carregar)
     
     def buscar_usuario_por_email(self, email):
         """Busca usuário por email"""
@@ -85,11 +234,20 @@ class SupabaseDAO:
     def atualizar_usuario(self, usuario_id, **kwargs):
         """Atualiza dados do usuário"""
         result = self.supabase.table('usuarios').update(kwargs).eq('id', usuario_id).execute()
+        
+        # Write-through: a linha retornada já reflete a atualização
+        if result.data:
+            request_cache.put('usuarios', usuario_id, result.data[0])
+        else:
+            request_cache.invalidate('usuarios', usuario_id)
+        
         return result.data[0] if result.data else None
     
     def deletar_usuario(self, usuario_id):
         """Deleta usuário"""
         result = self.supabase.table('usuarios').delete().eq('id', usuario_id).execute()
+        request_cache.invalidate('usuarios', usuario_id)
+        request_cache.invalidate('orientacoes')
         return bool(result.data)
     
     def verificar_senha(self, senha, senha_hash):
@@ -142,12 +300,17 @@ class SupabaseDAO:
     
         if data:
             result = self.supabase.table('projetos').update(data).eq('id', projeto_id).execute()
+            request_cache.invalidate('projetos', projeto_id)
+            request_cache.invalidate('orientacoes')
             return self._row_to_projeto(result.data[0]) if result.data else None
         return None
     
     def deletar_projeto(self, projeto_id):
         """Deleta um projeto"""
         result = self.supabase.table('projetos').delete().eq('id', projeto_id).execute()
+        request_cache.invalidate('projetos', projeto_id)
+        request_cache.invalidate('orientacoes')
+        orientados_cache.clear()
         return bool(result.data)
     
     def associar_participante_projeto(self, participante_id, projeto_id):
@@ -157,6 +320,8 @@ class SupabaseDAO:
             'projeto_id': projeto_id
         }
         result = self.supabase.table('participantes_projetos').insert(data).execute()
+        request_cache.invalidate('orientacoes')
+        orientados_cache.clear()
         return bool(result.data)
     
     def associar_orientador_projeto(self, orientador_id, projeto_id):
@@ -166,6 +331,8 @@ class SupabaseDAO:
             'projeto_id': projeto_id
         }
         result = self.supabase.table('orientadores_projetos').insert(data).execute()
+        request_cache.invalidate('orientacoes')
+        orientados_cache.clear()
         return bool(result.data)
     
     # ============ CHATS ============
@@ -178,12 +345,16 @@ class SupabaseDAO:
             'titulo': titulo
         }
         result = self.supabase.table('chats').insert(data).execute()
+        orientados_cache.invalidar_participante(usuario_id)
         return self._row_to_chat(result.data[0]) if result.data else None
     
     def buscar_chat_por_id(self, chat_id):
         """Busca chat por ID"""
-        result = self.supabase.table('chats').select('*').eq('id', chat_id).execute()
-        return self._row_to_chat(result.data[0]) if result.data else None
+        def carregar():
+            result = self.supabase.table('chats').select('*').eq('id', chat_id).execute()
+            return self._row_to_chat(result.data[0]) if result.data else None
+        
+        return request_cache.memoize('chats', chat_id, carregar)
     
     def listar_chats_por_usuario(self, usuario_id):
         """Lista todos os chats de um usuário"""
@@ -202,6 +373,8 @@ class SupabaseDAO:
             
             # ✅ 2. Deleta chat (CASCADE deleta mensagens automaticamente)
             result = self.supabase.table('chats').delete().eq('id', chat_id).execute()
+            orientados_cache.invalidar_chat(chat_id)
+            request_cache.invalidate('chats', chat_id)
             
             log_database_operation('DELETE', 'chats', data={'id': chat_id}, result='Success')
             return bool(result.data)
@@ -214,9 +387,15 @@ class SupabaseDAO:
     # ============ ARQUIVOS DE CHAT ============
 
     def criar_arquivo_chat(self, chat_id, nome_arquivo, url_arquivo, tipo_arquivo=None, 
-                           tamanho_bytes=None, gemini_file_uri=None):
+                           tamanho_bytes=None, gemini_file_uri=None, gemini_file_name=None,
+                           gemini_expiration=None, sha256=None):
         """
         ✅ NOVO: Cria registro de arquivo no banco
+        
+        Args:
+            gemini_file_uri/gemini_file_name: Arquivo mantido no Gemini (files/...)
+            gemini_expiration: datetime (ou ISO) em que o Gemini apaga o arquivo
+            sha256: Hash do conteúdo (registros com o mesmo hash dividem a cópia em disco)
         """
         logger.info(f"📎 Salvando arquivo no banco: {nome_arquivo}")
         
@@ -225,11 +404,15 @@ class SupabaseDAO:
             'nome_arquivo': nome_arquivo,
             'url_arquivo': url_arquivo,
             'tipo_arquivo': tipo_arquivo,
-            'tamanho_bytes': tamanho_bytes
+            'tamanho_bytes': tamanho_bytes,
+            'sha256': sha256
         }
         
         if gemini_file_uri:
             data['gemini_file_uri'] = gemini_file_uri
+            data['gemini_file_name'] = gemini_file_name
+            data['gemini_expiration'] = gemini_expiration.isoformat() \
+                if hasattr(gemini_expiration, 'isoformat') else gemini_expiration
         
         try:
             result = self.supabase.table('arquivos_chat').insert(data).execute()
@@ -246,6 +429,94 @@ class SupabaseDAO:
             logger.error(f"❌ Erro ao salvar arquivo: {e}")
             raise
 
+    def contar_referencias_arquivo(self, sha256):
+        """
+        Quantos registros de arquivos_chat usam o mesmo conteúdo
+        
+        Args:
+            sha256: Hash do conteúdo
+        
+        Returns:
+            int: Referências (0 = cópia em disco pode ser apagada)
+        """
+        try:
+            result = self.supabase.table('arquivos_chat')\
+                .select('id', count='exact')\
+                .eq('sha256', sha256)\
+                .execute()
+            
+            return result.count or 0
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao contar referências do arquivo: {e}")
+            # Na dúvida, trata como referenciado (não apaga)
+            return 1
+
+    def atualizar_arquivo_gemini(self, arquivo_id, gemini_file_uri, gemini_file_name, gemini_expiration):
+        """
+        Aponta o arquivo do chat para um novo upload no Gemini (reenvio)
+        
+        Args:
+            arquivo_id: ID em arquivos_chat
+            gemini_file_uri/gemini_file_name: Novo arquivo no Gemini
+            gemini_expiration: datetime (ou ISO) de expiração
+        
+        Returns:
+            bool: True se sucesso
+        """
+        data = {
+            'gemini_file_uri': gemini_file_uri,
+            'gemini_file_name': gemini_file_name,
+            'gemini_expiration': gemini_expiration.isoformat() \
+                if hasattr(gemini_expiration, 'isoformat') else gemini_expiration
+        }
+        
+        try:
+            result = self.supabase.table('arquivos_chat')\
+                .update(data)\
+                .eq('id', arquivo_id)\
+                .execute()
+            
+            log_database_operation('UPDATE', 'arquivos_chat',
+                                 data={'id': arquivo_id, 'gemini_file_name': gemini_file_name},
+                                 result='Success')
+            return bool(result.data)
+        
+        except Exception as e:
+            log_database_operation('UPDATE', 'arquivos_chat', data={'id': arquivo_id}, result=f'Error: {e}')
+            logger.error(f"❌ Erro ao atualizar arquivo do Gemini: {e}")
+            return False
+
+    def desvincular_arquivo_gemini(self, gemini_file_name):
+        """
+        Limpa a referência a um arquivo apagado do Gemini (expirado ou removido)
+        
+        Args:
+            gemini_file_name: Nome do arquivo no Gemini (files/...)
+        
+        Returns:
+            bool: True se algum registro foi atualizado
+        """
+        try:
+            result = self.supabase.table('arquivos_chat')\
+                .update({
+                    'gemini_file_uri': None,
+                    'gemini_file_name': None,
+                    'gemini_expiration': None
+                })\
+                .eq('gemini_file_name', gemini_file_name)\
+                .execute()
+            
+            log_database_operation('UPDATE', 'arquivos_chat',
+                                 data={'gemini_file_name': gemini_file_name}, result='Success')
+            return bool(result.data)
+        
+        except Exception as e:
+            log_database_operation('UPDATE', 'arquivos_chat',
+                                 data={'gemini_file_name': gemini_file_name}, result=f'Error: {e}')
+            logger.error(f"❌ Erro ao desvincular arquivo do Gemini: {e}")
+            return False
+
     def listar_arquivos_por_chat(self, chat_id):
         """
         ✅ NOVO: Lista todos os arquivos de um chat
@@ -521,6 +792,44 @@ class SupabaseDAO:
         
         return result.data if result.data else []
 
+    def listar_mensagens_enriquecidas(self, chat_id, limit=100):
+        """
+        Lista mensagens de um chat já com notas do orientador e arquivos
+        
+        Substitui o padrão N+1 (uma consulta de notas por mensagem):
+        são apenas 2 consultas no total, independente do tamanho do chat
+        - mensagens (com notas_orientador embutidas via join)
+        - arquivos do chat (associados por mensagem_id com dict)
+        
+        Args:
+            chat_id: ID do chat
+            limit: Número máximo de mensagens
+        
+        Returns:
+            tuple: (mensagens, arquivos) - cada mensagem ganha 'notas' e,
+                   se houver anexo, 'arquivo'
+        """
+        mensagens = self.listar_mensagens_por_chat(chat_id, limit=limit)
+        arquivos = self.listar_arquivos_por_chat(chat_id)
+        
+        # Primeiro arquivo de cada mensagem (arquivos vêm em ordem de upload)
+        arquivos_por_mensagem = {}
+        for arquivo in arquivos:
+            if arquivo.get('mensagem_id') is not None:
+                arquivos_por_mensagem.setdefault(arquivo['mensagem_id'], arquivo)
+        
+        for msg in mensagens:
+            notas = msg.pop('notas_orientador', None) or []
+            msg['notas'] = sorted(notas, key=lambda n: n.get('data_criacao') or '')
+            
+            arquivo = arquivos_por_mensagem.get(msg.get('id'))
+            if arquivo:
+                msg['arquivo'] = arquivo
+        
+        logger.debug(f"📨 {len(mensagens)} mensagens enriquecidas com 2 consultas")
+        
+        return mensagens, arquivos
+
     def contar_mensagens_por_chat(self, chat_id):
         """
         Conta quantas mensagens existem em um chat
@@ -555,7 +864,7 @@ class SupabaseDAO:
         
         return bool(result.data)
 
-    def obter_ultimas_n_mensagens(self, chat_id, n=10):
+    def obter_ultimas_n_mensagens(self, chat_id, n=10, apos_id=None):
         """
         Obtém as últimas N mensagens de um chat
         Útil para contexto limitado
@@ -563,19 +872,113 @@ class SupabaseDAO:
         Args:
             chat_id: ID do chat
             n: Número de mensagens
+            apos_id: Se informado, só mensagens com id maior (ainda fora do resumo)
         
         Returns:
             list: Lista de mensagens
         """
-        result = self.supabase.table('mensagens')\
+        query = self.supabase.table('mensagens')\
             .select('*')\
-            .eq('chat_id', chat_id)\
+            .eq('chat_id', chat_id)
+        
+        if apos_id:
+            query = query.gt('id', apos_id)
+        
+        result = query\
             .order('data_envio', desc=True)\
             .limit(n)\
             .execute()
         
         # Inverte para ordem cronológica correta
         return list(reversed(result.data)) if result.data else []
+    
+    def listar_mensagens_entre(self, chat_id, apos_id, antes_id, limit=100):
+        """
+        Lista mensagens de um chat num intervalo de IDs (ordem crescente)
+        Usado para resumir mensagens que ficaram antes da janela do histórico
+        
+        Args:
+            chat_id: ID do chat
+            apos_id: Só mensagens com id maior (None = desde o início)
+            antes_id: Só mensagens com id menor
+            limit: Número máximo de mensagens
+        
+        Returns:
+            list: Lista de mensagens
+        """
+        query = self.supabase.table('mensagens')\
+            .select('*')\
+            .eq('chat_id', chat_id)\
+            .lt('id', antes_id)
+        
+        if apos_id:
+            query = query.gt('id', apos_id)
+        
+        result = query\
+            .order('id', desc=False)\
+            .limit(limit)\
+            .execute()
+        
+        return result.data if result.data else []
+    
+    def obter_resumo_chat(self, chat_id):
+        """
+        Obtém o resumo acumulado das mensagens que saíram da janela do histórico
+        
+        Args:
+            chat_id: ID do chat
+        
+        Returns:
+            dict: {'resumo', 'ate_mensagem_id'} (None se ainda não há resumo)
+        """
+        try:
+            result = self.supabase.table('chats')\
+                .select('resumo_historico, resumo_ate_mensagem_id')\
+                .eq('id', chat_id)\
+                .execute()
+        except Exception as e:
+            # Colunas ainda não criadas (schema antigo): segue sem resumo
+            logger.warning(f"⚠️ Resumo do chat {chat_id} indisponível: {e}")
+            result = None
+        
+        row = result.data[0] if result and result.data else {}
+        
+        return {
+            'resumo': row.get('resumo_historico'),
+            'ate_mensagem_id': row.get('resumo_ate_mensagem_id')
+        }
+    
+    def atualizar_resumo_chat(self, chat_id, resumo, ate_mensagem_id):
+        """
+        Grava o resumo acumulado do histórico
+        
+        Args:
+            chat_id: ID do chat
+            resumo: Texto do resumo
+            ate_mensagem_id: ID da mensagem mais recente incluída no resumo
+        
+        Returns:
+            bool: True se sucesso
+        """
+        try:
+            result = self.supabase.table('chats')\
+                .update({
+                    'resumo_historico': resumo,
+                    'resumo_ate_mensagem_id': ate_mensagem_id
+                })\
+                .eq('id', chat_id)\
+                .execute()
+            request_cache.invalidate('chats', chat_id)
+            
+            log_database_operation('UPDATE', 'chats',
+                                 data={'id': chat_id, 'resumo_ate_mensagem_id': ate_mensagem_id},
+                                 result='Success')
+            return bool(result.data)
+        
+        except Exception as e:
+            log_database_operation('UPDATE', 'chats', data={'id': chat_id}, result=f'Error: {e}')
+            logger.error(f"❌ Erro ao atualizar resumo do chat: {e}")
+            return False
 
     def listar_projetos_por_usuario(self, usuario_id):
         """
@@ -616,12 +1019,14 @@ class SupabaseDAO:
         Returns:
             Projeto: Objeto Projeto ou None
         """
-        result = self.supabase.table('projetos')\
-            .select('*')\
-            .eq('id', projeto_id)\
-            .execute()
+        def carregar():
+            result = self.supabase.table('projetos')\
+                .select('*')\
+                .eq('id', projeto_id)\
+                .execute()
+            return self._row_to_projeto(result.data[0]) if result.data else None
         
-        return self._row_to_projeto(result.data[0]) if result.data else None
+        return request_cache.memoize('projetos', projeto_id, carregar)
 
     def listar_tipos_usuario(self):
         """
@@ -684,6 +1089,7 @@ class SupabaseDAO:
             .update({'apelido': apelido})\
             .eq('id', usuario_id)\
             .execute()
+        request_cache.invalidate('usuarios', usuario_id)
     
         return bool(result.data)
 
@@ -695,6 +1101,9 @@ class SupabaseDAO:
         Lista todos os orientados de um orientador
         COM dados dos chats
     
+        Número fixo de consultas: vínculos, participantes, usuários (in_)
+        e chats (in_ por usuario_id, em páginas), agrupados em memória
+    
         Args:
             orientador_id: ID do orientador
     
@@ -703,6 +1112,12 @@ class SupabaseDAO:
         """
         logger.debug(f"📋 Buscando orientados do orientador {orientador_id}")
     
+        # ✅ Cache curto por orientador (invalidado ao criar/deletar chats)
+        orientados = orientados_cache.get(orientador_id)
+        if orientados is not None:
+            logger.debug(f"♻️ Orientados do orientador {orientador_id} vindos do cache")
+            return orientados
+    
         try:
             # Busca IDs dos orientados via tabela de projetos
             # (assumindo que orientador e participante estão ligados via projetos)
@@ -725,19 +1140,41 @@ class SupabaseDAO:
             if not participantes_result.data:
                 return []
         
-            participante_ids = list(set([row['participante_id'] for row in participantes_result.data]))
+            participante_ids = list(dict.fromkeys(row['participante_id'] for row in participantes_result.data))
+        
+            # Dados dos participantes (uma consulta)
+            usuarios = [
+                self._row_to_usuario(row)
+                for row in self._buscar_em_lotes('usuarios', 'id', participante_ids)
+            ]
+        
+            # Chats de todos eles (paginado: grupos grandes passam do max-rows)
+            chats_por_usuario = {}
+            for inicio in range(0, len(participante_ids), self.TAMANHO_LOTE_IN):
+                lote = participante_ids[inicio:inicio + self.TAMANHO_LOTE_IN]
+                chats_rows = self._buscar_paginado(
+                    lambda: self.supabase.table('chats')
+                        .select('id, usuario_id, tipo_ia_id, titulo, data_criacao')
+                        .in_('usuario_id', lote)
+                        .order('data_criacao', desc=True)
+                        .order('id', desc=True)
+                )
+                
+                for row in chats_rows:
+                    chats_por_usuario.setdefault(row['usuario_id'], []).append(self._row_to_chat(row))
         
-            # Busca dados completos dos participantes
+            # Agrupa em memória
+            usuarios_por_id = {u.id: u for u in usuarios}
             orientados = []
             for participante_id in participante_ids:
-                usuario = self.buscar_usuario_por_id(participante_id)
+                usuario = usuarios_por_id.get(participante_id)
                 if usuario:
-                    # Adiciona chats
-                    chats = self.listar_chats_por_usuario(participante_id)
                     orientado_data = usuario.to_dict()
-                    orientado_data['chats'] = [c.to_dict() for c in chats]
+                    orientado_data['chats'] = [c.to_dict() for c in chats_por_usuario.get(participante_id, [])]
                     orientados.append(orientado_data)
         
+            orientados_cache.set(orientador_id, orientados)
+        
             logger.info(f"✅ {len(orientados)} orientados encontrados")
             return orientados
         
@@ -757,30 +1194,35 @@ class SupabaseDAO:
         Returns:
             bool: True se é orientado
         """
-        try:
-            # Busca projetos do orientador
-            result = self.supabase.table('orientadores_projetos')\
-                .select('projeto_id')\
-                .eq('orientador_id', orientador_id)\
-                .execute()
-        
-            if not result.data:
+        def carregar():
+            try:
+                # Busca projetos do orientador
+                result = self.supabase.table('orientadores_projetos')\
+                    .select('projeto_id')\
+                    .eq('orientador_id', orientador_id)\
+                    .execute()
+        
+                if not result.data:
+                    return False
+        
+                projeto_ids = [row['projeto_id'] for row in result.data]
+        
+                # Verifica se participante está em algum desses projetos
+                participante_result = self.supabase.table('participantes_projetos')\
+                    .select('participante_id')\
+                    .eq('participante_id', participante_id)\
+                    .in_('projeto_id', projeto_ids)\
+                    .execute()
+        
+                return bool(participante_result.data)
+        
+            except Exception as e:
+                logger.error(f"❌ Erro ao verificar orientador-participante: {e}")
                 return False
         
-            projeto_ids = [row['projeto_id'] for row in result.data]
-        
-            # Verifica se participante está em algum desses projetos
-            participante_result = self.supabase.table('participantes_projetos')\
-                .select('participante_id')\
-                .eq('participante_id', participante_id)\
-                .in_('projeto_id', projeto_ids)\
-                .execute()
-        
-            return bool(participante_result.data)
-        
-        except Exception as e:
-            logger.error(f"❌ Erro ao verificar orientador-participante: {e}")
-            return False
+        return request_cache.memoize(
+            'orientacoes', ('orientador_participante', orientador_id, participante_id), carregar
+        )
 
 
     # ============ NOTAS DO ORIENTADOR ============
@@ -1030,12 +1472,12 @@ class SupabaseDAO:
 
             participante_ids = [row['participante_id'] for row in result.data]
 
-            # Busca dados completos dos participantes
-            participantes = []
-            for pid in participante_ids:
-                usuario = self.buscar_usuario_por_id(pid)
-                if usuario:
-                    participantes.append(usuario)
+            # Busca dados completos dos participantes (uma consulta)
+            usuarios = {
+                row['id']: self._row_to_usuario(row)
+                for row in self._buscar_em_lotes('usuarios', 'id', participante_ids)
+            }
+            participantes = [usuarios[pid] for pid in participante_ids if pid in usuarios]
 
             logger.info(f"✅ {len(participantes)} participantes encontrados")
             return participantes
@@ -1127,6 +1569,8 @@ class SupabaseDAO:
                 .execute()
 
             log_database_operation('INSERT', 'orientadores_projetos', data, 'Success')
+            request_cache.invalidate('orientacoes')
+            orientados_cache.clear()
             logger.info("✅ Orientação criada")
             return bool(result.data)
 
@@ -1157,6 +1601,8 @@ class SupabaseDAO:
                 .execute()
 
             log_database_operation('DELETE', 'orientadores_projetos', {'orientador': orientador_id, 'projeto': projeto_id}, 'Success')
+            request_cache.invalidate('orientacoes')
+            orientados_cache.clear()
             logger.info("✅ Orientação removida")
             return bool(result.data)
             
@@ -1170,13 +1616,21 @@ class SupabaseDAO:
         """
         Lista todas orientações com dados completos
 
+        Consultas em conjunto (número fixo, independente da quantidade de
+        orientações): vínculos, projetos, participantes e usuários, montados
+        em memória com índices por ID. Resultado memoizado na requisição
+
         Returns:
             list: Lista de orientações com dados de orientador, participante e projeto
         """
+        return request_cache.memoize('orientacoes', 'completas', self._carregar_orientacoes_completas)
+
+    def _carregar_orientacoes_completas(self):
+        """Monta a lista de orientações (ver listar_orientacoes_completas)"""
         logger.debug("📋 Listando orientações completas")
 
         try:
-            # Busca todas as orientações
+            # 1. Todas as orientações
             result = self.supabase.table('orientadores_projetos')\
                 .select('orientador_id, projeto_id')\
                 .execute()
@@ -1184,26 +1638,51 @@ class SupabaseDAO:
             if not result.data:
                 return []
 
+            vinculos = result.data
+            projeto_ids = [row['projeto_id'] for row in vinculos]
+
+            # 2. Projetos
+            projetos = {
+                row['id']: self._row_to_projeto(row)
+                for row in self._buscar_em_lotes('projetos', 'id', projeto_ids)
+            }
+
+            # 3. Participantes de cada projeto
+            participantes_por_projeto = {}
+            for row in self._buscar_em_lotes('participantes_projetos', 'projeto_id', projeto_ids,
+                                             select='participante_id, projeto_id'):
+                participantes_por_projeto.setdefault(row['projeto_id'], []).append(row['participante_id'])
+
+            # 4. Usuários (orientadores + participantes)
+            usuario_ids = [row['orientador_id'] for row in vinculos]
+            for ids in participantes_por_projeto.values():
+                usuario_ids.extend(ids)
+
+            usuarios = {
+                row['id']: self._row_to_usuario(row)
+                for row in self._buscar_em_lotes('usuarios', 'id', usuario_ids)
+            }
+
             orientacoes = []
 
-            for row in result.data:
+            for row in vinculos:
                 orientador_id = row['orientador_id']
                 projeto_id = row['projeto_id']
 
-                # Busca dados do orientador
-                orientador = self.buscar_usuario_por_id(orientador_id)
+                orientador = usuarios.get(orientador_id)
                 if not orientador:
                     continue
-                    
-                # Busca dados do projeto
-                projeto = self.buscar_projeto_por_id(projeto_id)
+
+                projeto = projetos.get(projeto_id)
                 if not projeto:
                     continue
-                    
-                # Busca participantes do projeto
-                participantes = self.listar_participantes_por_projeto(projeto_id)
-                
-            # Para cada participante, cria uma entrada
+
+                participantes = [
+                    usuarios[pid] for pid in participantes_por_projeto.get(projeto_id, [])
+                    if pid in usuarios
+                ]
+
+                # Para cada participante, cria uma entrada
                 if participantes:
                     for participante in participantes:
                         orientacoes.append({
@@ -1294,6 +1773,7 @@ class SupabaseDAO:
                 .update({'notas_orientador': notas})\
                 .eq('id', chat_id)\
                 .execute()
+            request_cache.invalidate('chats', chat_id)
 
             log_database_operation('UPDATE', 'chats', 
                                  data={'id': chat_id, 'notas_orientador': notas[:50]},
@@ -1344,4 +1824,20 @@ class SupabaseDAO:
             .eq('nome', nome)\
             .execute()
         
-        return result.data[0]['id'] if result.data else None
\ No newline at end of file
+        return result.data[0]['id'] if result.data else None
+
+
+# ============ FÁBRICA (instância única por processo) ============
+
+_dao = None
+_dao_lock = threading.Lock()
+
+
+def get_dao():
+    """Retorna instância global do SupabaseDAO"""
+    global _dao
+    if _dao is None:
+        with _dao_lock:
+            if _dao is None:
+                _dao = SupabaseDAO()
+    return _dao
@@ -0,0 +1,158 @@
+"""
+Transporte HTTP compartilhado (keep-alive) para o cliente Supabase
+
+Um único httpx.Client por processo: as conexões TLS com o Supabase são
+reaproveitadas entre requisições em vez de abertas a cada create_client
+"""
+
+import threading
+import time
+import httpx
+from config import Config
+from utils.advanced_logger import logger
+
+
+class PooledTransport(httpx.HTTPTransport):
+    """
+    HTTPTransport que coleta métricas do pool de conexões
+
+    - requisições, conexões novas e handshakes TLS (via trace do httpcore)
+    - esperas: requisições que chegaram com o pool cheio e sem conexão livre
+    """
+
+    def __init__(self, max_connections, **kwargs):
+        super().__init__(**kwargs)
+        self.max_connections = max_connections
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.waits = 0
+        self.wait_time_ms = 0.0
+
+    def _pool_connections(self):
+        return list(getattr(self._pool, 'connections', []) or [])
+
+    def handle_request(self, request):
+        connections = self._pool_connections()
+        pool_full = (
+            len(connections) >= self.max_connections
+            and not any(c.is_available() for c in connections)
+        )
+
+        start = time.perf_counter()
+        waited = {'done': False}
+        previous_trace = request.extensions.get('trace')
+
+        def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.started':
+                with self._lock:
+                    self.new_connections += 1
+            elif event_name == 'connection.start_tls.started':
+                with self._lock:
+                    self.tls_handshakes += 1
+            elif event_name.endswith('send_request_headers.started') and pool_full and not waited['done']:
+                waited['done'] = True
+                with self._lock:
+                    self.wait_time_ms += (time.perf_counter() - start) * 1000
+
+            if previous_trace:
+                previous_trace(event_name, info)
+
+        request.extensions['trace'] = trace
+
+        with self._lock:
+            self.requests += 1
+            if pool_full:
+                self.waits += 1
+
+        return super().handle_request(request)
+
+    def get_metrics(self):
+        """
+        Métricas atuais do pool
+
+        Returns:
+            dict: Conexões abertas/em uso, esperas e taxa de reuso
+        """
+        connections = self._pool_connections()
+
+        with self._lock:
+            requests = self.requests
+            new_connections = self.new_connections
+
+            return {
+                'max_connections': self.max_connections,
+                'open_connections': len(connections),
+                'in_use_connections': sum(1 for c in connections if not c.is_idle()),
+                'requests': requests,
+                'new_connections': new_connections,
+                'tls_handshakes': self.tls_handshakes,
+                'waits': self.waits,
+                'avg_wait_ms': round(self.wait_time_ms / self.waits, 2) if self.waits else 0.0,
+                'reuse_ratio': round(1 - new_connections / requests, 4) if requests else 0.0
+            }
+
+
+# Instâncias globais (criadas sob demanda)
+_http_client = None
+_transport = None
+_lock = threading.Lock()
+
+
+def get_http_client():
+    """
+    Retorna o httpx.Client compartilhado do processo
+
+    Configurável via SUPABASE_POOL_SIZE, SUPABASE_POOL_KEEPALIVE,
+    SUPABASE_KEEPALIVE_EXPIRY, SUPABASE_TIMEOUT, SUPABASE_CONNECT_TIMEOUT,
+    SUPABASE_POOL_TIMEOUT e SUPABASE_HTTP2
+    """
+    global _http_client, _transport
+
+    if _http_client is not None:
+        return _http_client
+
+    with _lock:
+        if _http_client is not None:
+            return _http_client
+
+        limits = httpx.Limits(
+            max_connections=Config.SUPABASE_POOL_SIZE,
+            max_keepalive_connections=Config.SUPABASE_POOL_KEEPALIVE,
+            keepalive_expiry=Config.SUPABASE_KEEPALIVE_EXPIRY
+        )
+
+        _transport = PooledTransport(
+            max_connections=Config.SUPABASE_POOL_SIZE,
+            limits=limits,
+            http2=Config.SUPABASE_HTTP2
+        )
+
+        _http_client = httpx.Client(
+            transport=_transport,
+            timeout=httpx.Timeout(
+                Config.SUPABASE_TIMEOUT,
+                connect=Config.SUPABASE_CONNECT_TIMEOUT,
+                pool=Config.SUPABASE_POOL_TIMEOUT
+            ),
+            follow_redirects=True
+        )
+
+        logger.info(
+            f"🔌 Pool HTTP do Supabase: {Config.SUPABASE_POOL_SIZE} conexões "
+            f"(keep-alive {Config.SUPABASE_POOL_KEEPALIVE}, HTTP/2: {Config.SUPABASE_HTTP2})"
+        )
+
+        return _http_client
+
+
+def get_pool_metrics():
+    """
+    Métricas do pool compartilhado
+
+    Returns:
+        dict: Métricas ou {} se o pool ainda não foi criado
+    """
+    return _transport.get_metrics() if _transport else {}
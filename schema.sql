@@ -61,6 +61,8 @@ CREATE TABLE chats (
   titulo VARCHAR(255) NOT NULL,
   data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   notas_orientador TEXT,
+  resumo_historico TEXT,
+  resumo_ate_mensagem_id BIGINT,
   PRIMARY KEY (id),
   FOREIGN KEY (usuario_id) REFERENCES usuarios(id),
   FOREIGN KEY (tipo_ia_id) REFERENCES tipos_ia(id)
@@ -90,11 +92,14 @@ CREATE TABLE arquivos_chat (
   gemini_file_uri TEXT,
   gemini_file_name TEXT,
   gemini_expiration TIMESTAMP NULL,
+  sha256 CHAR(64),
   PRIMARY KEY (id),
   FOREIGN KEY (chat_id) REFERENCES chats(id),
   FOREIGN KEY (mensagem_id) REFERENCES mensagens(id)
 );
 
+CREATE INDEX idx_arquivos_chat_sha256 ON arquivos_chat (sha256);
+
 CREATE TABLE notas_orientador (
   id BIGINT AUTO_INCREMENT NOT NULL,
   mensagem_id BIGINT NOT NULL,
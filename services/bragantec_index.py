@@ -0,0 +1,383 @@
+"""
+Índice de busca BM25 sobre os cadernos de resumos da Bragantec
+Permite enviar ao Gemini apenas os trechos relevantes em vez do corpus inteiro
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from config import Config
+from utils.advanced_logger import logger
+
+
+# Palavras muito comuns em português (não ajudam na busca)
+STOPWORDS = {
+    'a', 'ao', 'aos', 'as', 'ate', 'com', 'como', 'da', 'das', 'de', 'do', 'dos',
+    'e', 'ela', 'ele', 'em', 'entre', 'era', 'essa', 'esse', 'esta', 'este', 'eu',
+    'foi', 'ha', 'isso', 'isto', 'ja', 'lhe', 'mais', 'mas', 'me', 'mesmo', 'meu',
+    'minha', 'muito', 'na', 'nas', 'nao', 'no', 'nos', 'num', 'numa', 'o', 'os',
+    'ou', 'para', 'pela', 'pelas', 'pelo', 'pelos', 'por', 'qual', 'quando', 'que',
+    'quem', 'se', 'sem', 'ser', 'seu', 'seus', 'sua', 'suas', 'tambem', 'te', 'tem',
+    'ter', 'um', 'uma', 'umas', 'uns', 'voce', 'sao', 'sobre', 'foram', 'pode',
+    'projeto', 'trabalho', 'resumo'
+}
+
+# Início do resumo de um projeto ("RESUMO.", "RESUMO:", "Resumo")
+RESUMO_PATTERN = re.compile(r'^\s*resumo\b', re.IGNORECASE)
+
+# Fim do resumo
+PALAVRAS_CHAVE_PATTERN = re.compile(r'^\s*palavras[\s-]*chave', re.IGNORECASE)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+INDEX_FORMAT_VERSION = 1
+
+
+def normalize_text(text):
+    """
+    Normaliza texto para busca (minúsculas, sem acentos)
+
+    Args:
+        text: Texto original
+
+    Returns:
+        str: Texto normalizado
+    """
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """
+    Quebra texto em termos indexáveis
+
+    Args:
+        text: Texto original
+
+    Returns:
+        list: Lista de termos
+    """
+    return [
+        token for token in TOKEN_PATTERN.findall(normalize_text(text))
+        if len(token) > 2 and token not in STOPWORDS and not token.isdigit()
+    ]
+
+
+def split_caderno(content, ano, max_chars=4000, chunk_lines=40):
+    """
+    Divide um caderno de resumos em passagens (uma por projeto)
+
+    O cabeçalho do projeto (título, autores, instituição) é o bloco de linhas
+    contínuas logo acima de "RESUMO". O texto antes do
+    primeiro projeto (regras, premiação, programação) vira passagens gerais.
+
+    Args:
+        content: Texto do caderno
+        ano: Ano da edição
+        max_chars: Tamanho máximo de cada passagem
+        chunk_lines: Linhas por passagem geral
+
+    Returns:
+        list: Lista de dicts {ano, titulo, texto}
+    """
+    lines = content.splitlines()
+    passages = []
+
+    # Início de cada projeto = começo do cabeçalho acima de "RESUMO"
+    starts = []
+    for i, line in enumerate(lines):
+        if not RESUMO_PATTERN.match(line):
+            continue
+
+        # Pula linhas em branco entre o cabeçalho e o "RESUMO"
+        start = i
+        while start > 0 and i - start < 3 and not lines[start - 1].strip():
+            start -= 1
+
+        while start > 0 and lines[start - 1].strip():
+            start -= 1
+
+        if starts and start <= starts[-1][1]:
+            start = i
+
+        starts.append((start, i))
+
+    # Informações gerais da edição (antes do primeiro projeto)
+    geral_end = starts[0][0] if starts else len(lines)
+    geral = [l for l in lines[:geral_end] if l.strip()]
+    for n, offset in enumerate(range(0, len(geral), chunk_lines), start=1):
+        texto = '\n'.join(geral[offset:offset + chunk_lines])
+        passages.append({
+            'ano': ano,
+            'titulo': f"Bragantec {ano} - informações gerais (parte {n})",
+            'texto': texto[:max_chars]
+        })
+
+    for idx, (start, resumo_line) in enumerate(starts):
+        end = starts[idx + 1][0] if idx + 1 < len(starts) else len(lines)
+
+        # Corta no "Palavras-chave" (o que vem depois é rodapé/paginação)
+        for j in range(resumo_line, end):
+            if PALAVRAS_CHAVE_PATTERN.match(lines[j]):
+                end = j + 1
+                break
+
+        header = [l.strip() for l in lines[start:resumo_line] if l.strip()]
+        body = ' '.join(l.strip() for l in lines[resumo_line:end] if l.strip())
+
+        titulo = header[0] if header else f"Projeto {idx + 1}"
+        for h in header:
+            if h.lower().startswith('título:') or h.lower().startswith('titulo:'):
+                titulo = h.split(':', 1)[1].strip().strip('"')
+                break
+
+        texto = '\n'.join(header + [body])
+        passages.append({
+            'ano': ano,
+            'titulo': titulo,
+            'texto': texto[:max_chars]
+        })
+
+    return passages
+
+
+class BragantecIndex:
+    """
+    Índice invertido com ranking BM25 sobre os resumos da Bragantec
+
+    - Um documento por projeto (resumo) + trechos gerais de cada edição
+    - Salvo em disco (JSON) e reconstruído se os arquivos mudarem
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+
+        self.passages = []     # [{ano, titulo, texto}]
+        self.doc_lengths = []  # [int]
+        self.postings = {}     # {termo: [[doc_id, tf], ...]}
+        self.idf = {}          # {termo: float}
+        self.avgdl = 0.0
+        self.signature = None
+
+    # ============ CONSTRUÇÃO ============
+
+    @staticmethod
+    def source_signature(context_path):
+        """
+        Assinatura dos arquivos de contexto (nome, tamanho, mtime)
+
+        Args:
+            context_path: Pasta com os .txt
+
+        Returns:
+            list: Assinatura ordenada
+        """
+        if not os.path.exists(context_path):
+            return []
+
+        signature = []
+        for filename in sorted(os.listdir(context_path)):
+            if filename.endswith('.txt'):
+                stat = os.stat(os.path.join(context_path, filename))
+                signature.append([filename, stat.st_size, int(stat.st_mtime)])
+        return signature
+
+    def build(self, context_path):
+        """
+        Constrói o índice a partir dos cadernos
+
+        Args:
+            context_path: Pasta com os .txt
+        """
+        logger.info(f"🔨 Construindo índice BM25 de {context_path}...")
+
+        passages = []
+        for filename, _, _ in self.source_signature(context_path):
+            match = re.search(r'(\d{4})', filename)
+            ano = int(match.group(1)) if match else None
+
+            try:
+                with open(os.path.join(context_path, filename), 'r', encoding='utf-8') as f:
+                    passages.extend(split_caderno(f.read(), ano))
+            except Exception as e:
+                logger.error(f"❌ Erro ao indexar {filename}: {e}")
+
+        postings = defaultdict(list)
+        doc_lengths = []
+
+        for doc_id, passage in enumerate(passages):
+            terms = tokenize(passage['titulo'] + '\n' + passage['texto'])
+            doc_lengths.append(len(terms))
+
+            for term, tf in Counter(terms).items():
+                postings[term].append([doc_id, tf])
+
+        self.passages = passages
+        self.doc_lengths = doc_lengths
+        self.postings = dict(postings)
+        self.signature = self.source_signature(context_path)
+        self._finalize()
+
+        logger.info(f"✅ Índice BM25: {len(passages)} passagens, {len(self.postings):,} termos")
+
+    def _finalize(self):
+        """Calcula estatísticas derivadas (avgdl e idf)"""
+        n_docs = len(self.doc_lengths)
+        self.avgdl = (sum(self.doc_lengths) / n_docs) if n_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+    # ============ PERSISTÊNCIA ============
+
+    def save(self, path):
+        """
+        Salva o índice em disco
+
+        Args:
+            path: Caminho do arquivo JSON
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_FORMAT_VERSION,
+                'k1': self.k1,
+                'b': self.b,
+                'signature': self.signature,
+                'passages': self.passages,
+                'doc_lengths': self.doc_lengths,
+                'postings': self.postings
+            }, f, ensure_ascii=False)
+
+        os.replace(tmp_path, path)
+        logger.info(f"💾 Índice BM25 salvo em {path}")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Carrega índice salvo
+
+        Args:
+            path: Caminho do arquivo JSON
+
+        Returns:
+            BragantecIndex: Índice ou None se não existir/inválido
+        """
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            if data.get('version') != INDEX_FORMAT_VERSION:
+                return None
+
+            index = cls(k1=data['k1'], b=data['b'])
+            index.signature = data['signature']
+            index.passages = data['passages']
+            index.doc_lengths = data['doc_lengths']
+            index.postings = data['postings']
+            index._finalize()
+            return index
+
+        except Exception as e:
+            logger.warning(f"⚠️ Índice BM25 inválido em {path}: {e}")
+            return None
+
+    # ============ BUSCA ============
+
+    def search(self, query, k=8):
+        """
+        Busca as passagens mais relevantes
+
+        Args:
+            query: Texto da consulta
+            k: Número de resultados
+
+        Returns:
+            list: Lista de (score, passage) ordenada por relevância
+        """
+        if not self.passages:
+            return []
+
+        scores = defaultdict(float)
+
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+
+            idf = self.idf[term]
+            for doc_id, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avgdl)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.passages[doc_id]) for doc_id, score in ranked]
+
+    def format_passages(self, query, k=8):
+        """
+        Monta o texto com os trechos relevantes para enviar ao Gemini
+
+        Args:
+            query: Texto da consulta
+            k: Número de passagens
+
+        Returns:
+            str: Trechos formatados ou "" se nada for encontrado
+        """
+        results = self.search(query, k=k)
+        if not results:
+            return ""
+
+        blocks = [
+            f"--- Bragantec {p['ano']} | {p['titulo']} ---\n{p['texto']}"
+            for _, p in results
+        ]
+        return "\n\n".join(blocks)
+
+
+# Instância global (carregada sob demanda)
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_bragantec_index():
+    """
+    Retorna o índice global, carregando do disco ou reconstruindo se os
+    arquivos de contexto mudaram
+    """
+    global _index
+
+    if _index is not None:
+        return _index
+
+    with _index_lock:
+        if _index is not None:
+            return _index
+
+        context_path = Config.CONTEXT_FILES_PATH
+        index_path = Config.BRAGANTEC_INDEX_PATH
+
+        index = BragantecIndex.load(index_path)
+        if index is None or index.signature != BragantecIndex.source_signature(context_path):
+            index = BragantecIndex()
+            index.build(context_path)
+            try:
+                index.save(index_path)
+            except Exception as e:
+                logger.warning(f"⚠️ Não foi possível salvar índice BM25: {e}")
+        else:
+            logger.info(f"✅ Índice BM25 carregado: {len(index.passages)} passagens")
+
+        _index = index
+        return _index
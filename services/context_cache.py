@@ -0,0 +1,330 @@
+"""
+Cache explícito (Context Caching) do corpus da Bragantec no Gemini
+Envia corpus + system instruction UMA vez por modelo/versão e reaproveita
+nas requisições seguintes via `cached_content`
+"""
+
+import hashlib
+import threading
+import time
+from google.genai import types
+from utils.advanced_logger import logger
+
+
+class BragantecContextCache:
+    """
+    Gerenciador de cached contents do Gemini
+
+    - Um cache por (modelo, versão do corpus + instrução, ferramentas)
+    - Controla o TTL localmente
+    - Renova em background enquanto o cache estiver sendo usado
+    - Reaproveita caches já existentes no Gemini (outro worker / restart)
+    """
+
+    DISPLAY_PREFIX = 'apbia-bragantec'
+
+    def __init__(self, client, ttl_seconds=3600, renew_margin_seconds=300,
+                 check_interval_seconds=60, retry_after_failure_seconds=600):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.renew_margin_seconds = renew_margin_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self.retry_after_failure_seconds = retry_after_failure_seconds
+
+        self._lock = threading.Lock()
+
+        # {(model, version, tools_key): {'name', 'expire_at', 'last_used', 'tokens'}}
+        self._entries = {}
+
+        # {(model, version, tools_key): timestamp} - evita recriar após falha
+        self._failed_until = {}
+
+        # Uma criação por chave por vez
+        self._creating = {}
+
+        self._renewer = None
+        self._stop_event = threading.Event()
+
+    # ============ VERSÃO / CHAVES ============
+
+    @staticmethod
+    def compute_version(system_instruction, corpus):
+        """
+        Calcula versão do conteúdo cacheado
+
+        Args:
+            system_instruction: Instrução de sistema
+            corpus: Texto do corpus da Bragantec
+
+        Returns:
+            str: Hash curto (muda quando corpus ou instrução mudam)
+        """
+        digest = hashlib.sha256()
+        digest.update(system_instruction.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(corpus.encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _display_name(self, model, version, tools_key):
+        return f"{self.DISPLAY_PREFIX}-{model}-{version}-{tools_key}"
+
+    # ============ API PÚBLICA ============
+
+    def get_or_create(self, model, system_instruction, corpus, tools=None, tools_key='none'):
+        """
+        Retorna o nome do cached content para o corpus (cria se necessário)
+
+        Args:
+            model: Nome do modelo (ex: gemini-2.5-flash)
+            system_instruction: Instrução de sistema que vai dentro do cache
+            corpus: Texto do corpus da Bragantec
+            tools: Lista de types.Tool (precisam estar no cache)
+            tools_key: Identificador estável das ferramentas
+
+        Returns:
+            str: Nome do cache (cachedContents/...) ou None se indisponível
+        """
+        if not corpus:
+            return None
+
+        version = self.compute_version(system_instruction, corpus)
+        key = (model, version, tools_key)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['expire_at'] - now > 30:
+                entry['last_used'] = now
+                return entry['name']
+
+            if self._failed_until.get(key, 0) > now:
+                return None
+
+            creating = self._creating.get(key)
+            if creating is None:
+                creating = threading.Event()
+                self._creating[key] = creating
+                is_creator = True
+            else:
+                is_creator = False
+
+        if not is_creator:
+            # Outra thread já está criando - espera o resultado
+            creating.wait(timeout=120)
+            with self._lock:
+                entry = self._entries.get(key)
+                return entry['name'] if entry else None
+
+        try:
+            entry = self._find_remote(model, version, tools_key)
+            if entry is None:
+                entry = self._create_remote(model, version, tools_key,
+                                            system_instruction, corpus, tools)
+
+            with self._lock:
+                if entry:
+                    entry['last_used'] = time.time()
+                    self._entries[key] = entry
+                    self._drop_old_versions(model, version, tools_key)
+                else:
+                    self._failed_until[key] = time.time() + self.retry_after_failure_seconds
+
+            if entry:
+                self._ensure_renewer()
+                return entry['name']
+
+            return None
+
+        finally:
+            with self._lock:
+                self._creating.pop(key, None)
+            creating.set()
+
+    def invalidate(self, cache_name):
+        """
+        Esquece um cache (ex: expirou no servidor antes do previsto)
+
+        Args:
+            cache_name: Nome do cache
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry['name'] == cache_name:
+                    del self._entries[key]
+                    logger.warning(f"🗑️ Cache de contexto invalidado: {cache_name}")
+
+    def get_tokens(self, cache_name):
+        """
+        Tokens do conteúdo cacheado (instrução + corpus)
+        
+        Args:
+            cache_name: Nome do cache
+        
+        Returns:
+            int: Tokens ou 0 se desconhecido
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                if entry['name'] == cache_name:
+                    return entry['tokens']
+        return 0
+    
+    def get_info(self):
+        """
+        Retorna informações dos caches ativos
+
+        Returns:
+            list: Lista de caches com nome, tokens e tempo restante
+        """
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    'model': key[0],
+                    'version': key[1],
+                    'tools': key[2],
+                    'name': entry['name'],
+                    'tokens': entry['tokens'],
+                    'expires_in_seconds': max(0, int(entry['expire_at'] - now))
+                }
+                for key, entry in self._entries.items()
+            ]
+
+    def shutdown(self):
+        """Para a thread de renovação"""
+        self._stop_event.set()
+
+    # ============ OPERAÇÕES REMOTAS ============
+
+    def _find_remote(self, model, version, tools_key):
+        """Procura cache já existente no Gemini (criado por outro worker)"""
+        display_name = self._display_name(model, version, tools_key)
+
+        try:
+            for cached in self.client.caches.list():
+                if cached.display_name != display_name:
+                    continue
+
+                expire_at = cached.expire_time.timestamp() if cached.expire_time else 0
+                if expire_at - time.time() <= self.renew_margin_seconds:
+                    continue
+
+                tokens = 0
+                if cached.usage_metadata and cached.usage_metadata.total_token_count:
+                    tokens = cached.usage_metadata.total_token_count
+
+                logger.info(f"♻️ Reaproveitando cache existente: {cached.name} ({tokens:,} tokens)")
+                return {'name': cached.name, 'expire_at': expire_at, 'tokens': tokens}
+
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao listar caches do Gemini: {e}")
+
+        return None
+
+    def _create_remote(self, model, version, tools_key, system_instruction, corpus, tools):
+        """Cria o cached content no Gemini"""
+        display_name = self._display_name(model, version, tools_key)
+        logger.info(f"💾 Criando cache de contexto: {display_name} (~{len(corpus):,} chars)")
+
+        try:
+            cached = self.client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=display_name,
+                    system_instruction=system_instruction,
+                    contents=[
+                        types.Content(role='user', parts=[types.Part(text=corpus)])
+                    ],
+                    tools=tools or None,
+                    ttl=f"{self.ttl_seconds}s"
+                )
+            )
+
+            expire_at = cached.expire_time.timestamp() if cached.expire_time else time.time() + self.ttl_seconds
+
+            tokens = 0
+            if cached.usage_metadata and cached.usage_metadata.total_token_count:
+                tokens = cached.usage_metadata.total_token_count
+
+            logger.info(f"✅ Cache criado: {cached.name} ({tokens:,} tokens, TTL {self.ttl_seconds}s)")
+            return {'name': cached.name, 'expire_at': expire_at, 'tokens': tokens}
+
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível criar cache de contexto: {e}")
+            logger.info("💡 Usando contexto inline como fallback")
+            return None
+
+    def _drop_old_versions(self, model, version, tools_key):
+        """Remove caches de versões antigas do mesmo modelo/ferramentas (chamar com lock)"""
+        for key, entry in list(self._entries.items()):
+            if key[0] == model and key[2] == tools_key and key[1] != version:
+                del self._entries[key]
+                threading.Thread(
+                    target=self._delete_remote, args=(entry['name'],), daemon=True
+                ).start()
+
+    def _delete_remote(self, cache_name):
+        try:
+            self.client.caches.delete(name=cache_name)
+            logger.info(f"🗑️ Cache antigo removido: {cache_name}")
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao remover cache {cache_name}: {e}")
+
+    # ============ RENOVAÇÃO EM BACKGROUND ============
+
+    def _ensure_renewer(self):
+        with self._lock:
+            if self._renewer and self._renewer.is_alive():
+                return
+
+            self._renewer = threading.Thread(
+                target=self._renew_loop,
+                name='gemini-context-cache-renewer',
+                daemon=True
+            )
+            self._renewer.start()
+
+    def _renew_loop(self):
+        while not self._stop_event.wait(self.check_interval_seconds):
+            try:
+                self.renew_expiring()
+            except Exception as e:
+                logger.error(f"❌ Erro na renovação de caches: {e}")
+
+    def renew_expiring(self):
+        """
+        Renova caches prestes a expirar que foram usados recentemente
+        Caches ociosos são deixados expirar (economiza armazenamento)
+        """
+        now = time.time()
+
+        with self._lock:
+            expiring = [
+                (key, dict(entry)) for key, entry in self._entries.items()
+                if entry['expire_at'] - now <= self.renew_margin_seconds
+            ]
+
+        for key, entry in expiring:
+            if now - entry['last_used'] > self.ttl_seconds:
+                with self._lock:
+                    self._entries.pop(key, None)
+                logger.info(f"💤 Cache ocioso, deixando expirar: {entry['name']}")
+                continue
+
+            try:
+                updated = self.client.caches.update(
+                    name=entry['name'],
+                    config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s")
+                )
+                expire_at = updated.expire_time.timestamp() if updated.expire_time else now + self.ttl_seconds
+
+                with self._lock:
+                    if key in self._entries:
+                        self._entries[key]['expire_at'] = expire_at
+
+                logger.info(f"🔄 Cache renovado: {entry['name']}")
+
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao renovar cache {entry['name']}: {e}")
+                with self._lock:
+                    self._entries.pop(key, None)
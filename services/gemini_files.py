@@ -0,0 +1,505 @@
+"""
+Ciclo de vida dos arquivos enviados à Files API do Gemini
+
+- Espera o processamento (vídeos) com backoff exponencial, sem travar em
+  intervalos fixos e respeitando cancelamento
+- Registra cada arquivo remoto (nome, tamanho, expiração, arquivo do chat,
+  hash do conteúdo) em SQLite compartilhado entre os workers; o mesmo
+  conteúdo é enviado uma vez e reutilizado enquanto não expira
+- Uma thread de limpeza apaga arquivos registrados que expiraram ou ficaram
+  órfãos (sem registro no chat) e mantém o armazenamento remoto abaixo da
+  cota do projeto; arquivos fora do registro nunca são apagados
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from config import Config
+from utils.advanced_logger import logger
+
+
+class GeminiFileCancelled(Exception):
+    """Espera pelo processamento interrompida (job cancelado)"""
+
+
+def _epoch(value):
+    """datetime (ou None) -> epoch em segundos"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class GeminiFileManager:
+    """
+    Registro e limpeza dos arquivos remotos
+
+    Estados locais:
+    - 'uploaded': enviado, ainda não associado a um arquivo do chat
+    - 'attached': associado (arquivo_id) - usado até expirar
+    """
+
+    def __init__(self, client, path, quota_bytes=20 * 1024 ** 3, sweep_interval_seconds=900,
+                 orphan_grace_seconds=3600, expiry_margin_seconds=600):
+        self.client = client
+        self.path = path
+        self.quota_bytes = quota_bytes
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.expiry_margin_seconds = expiry_margin_seconds
+
+        self._sweeper = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.reused = 0
+        self.deleted_expired = 0
+        self.deleted_orphans = 0
+        self.deleted_quota = 0
+        self.last_sweep = None
+        self.remote_bytes = None
+        self.untracked = None
+
+        self._conn_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS gemini_files (
+                name TEXT PRIMARY KEY,
+                uri TEXT NOT NULL,
+                mime_type TEXT,
+                size_bytes INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                expires_at REAL,
+                arquivo_id INTEGER,
+                state TEXT NOT NULL DEFAULT 'uploaded',
+                sha256 TEXT
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(gemini_files)")}
+        if 'sha256' not in columns:
+            self._conn.execute("ALTER TABLE gemini_files ADD COLUMN sha256 TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_gemini_files_sha256 ON gemini_files (sha256)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS gemini_files_meta (
+                chave TEXT PRIMARY KEY,
+                valor REAL NOT NULL
+            )
+        """)
+
+    # ============ PROCESSAMENTO ============
+
+    def wait_until_active(self, uploaded_file, cancelled=None, timeout_seconds=600,
+                          initial_delay=0.5, max_delay=10.0):
+        """
+        Espera o arquivo sair de PROCESSING (backoff exponencial)
+
+        Args:
+            uploaded_file: File retornado por files.upload
+            cancelled: Função que retorna True se o job foi cancelado
+            timeout_seconds: Espera máxima
+            initial_delay/max_delay: Intervalos do backoff (x1.6 a cada consulta)
+
+        Returns:
+            File pronto (ACTIVE)
+
+        Raises:
+            GeminiFileCancelled: Cancelado (o arquivo remoto é apagado)
+            ValueError: Processamento falhou ou excedeu o tempo
+        """
+        delay = initial_delay
+        deadline = time.monotonic() + timeout_seconds
+        polls = 0
+
+        while uploaded_file.state.name == "PROCESSING":
+            if cancelled and cancelled():
+                self.delete(uploaded_file.name)
+                raise GeminiFileCancelled(uploaded_file.name)
+
+            if time.monotonic() + delay > deadline:
+                self.delete(uploaded_file.name)
+                raise ValueError(f"Processamento excedeu {timeout_seconds}s")
+
+            time.sleep(delay)
+            delay = min(delay * 1.6, max_delay)
+            polls += 1
+
+            uploaded_file = self.client.files.get(name=uploaded_file.name)
+
+        if uploaded_file.state.name == "FAILED":
+            self.delete(uploaded_file.name)
+            raise ValueError(f"Falha no processamento: {uploaded_file.error}")
+
+        if polls:
+            logger.info(f"⏳ Arquivo processado após {polls} consultas")
+
+        return uploaded_file
+
+    # ============ REGISTRO ============
+
+    def register(self, uploaded_file, sha256=None):
+        """
+        Registra um arquivo recém-enviado
+
+        Args:
+            uploaded_file: File do Gemini
+            sha256: Hash do conteúdo (permite reutilizar o upload)
+        """
+        with self._conn_lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO gemini_files
+                    (name, uri, mime_type, size_bytes, created_at, expires_at, state, sha256)
+                VALUES (?, ?, ?, ?, ?, ?, 'uploaded', ?)
+            """, (
+                uploaded_file.name,
+                uploaded_file.uri,
+                uploaded_file.mime_type,
+                int(getattr(uploaded_file, 'size_bytes', None) or 0),
+                time.time(),
+                _epoch(getattr(uploaded_file, 'expiration_time', None)),
+                sha256
+            ))
+
+        self._ensure_sweeper()
+
+    def lookup(self, sha256):
+        """
+        Upload ainda válido do mesmo conteúdo
+
+        Args:
+            sha256: Hash do conteúdo
+
+        Returns:
+            str: Nome do arquivo no Gemini (None se não há ou está perto de expirar)
+        """
+        with self._conn_lock:
+            row = self._conn.execute("""
+                SELECT name FROM gemini_files
+                WHERE sha256 = ? AND (expires_at IS NULL OR expires_at > ?)
+                ORDER BY created_at DESC LIMIT 1
+            """, (sha256, time.time() + self.expiry_margin_seconds)).fetchone()
+
+        if row:
+            with self._lock:
+                self.reused += 1
+
+        return row[0] if row else None
+
+    def attach(self, name, arquivo_id):
+        """
+        Associa o arquivo remoto a um registro de arquivos_chat
+
+        Args:
+            name: Nome do arquivo no Gemini (files/...)
+            arquivo_id: ID em arquivos_chat
+        """
+        with self._conn_lock:
+            self._conn.execute(
+                "UPDATE gemini_files SET arquivo_id = ?, state = 'attached' WHERE name = ?",
+                (arquivo_id, name)
+            )
+
+    def discard(self, name):
+        """
+        Apaga o arquivo remoto só se nenhum arquivo do chat o usa
+        (uploads podem ser compartilhados por hash)
+
+        Args:
+            name: Nome do arquivo no Gemini
+
+        Returns:
+            bool: True se apagou
+        """
+        with self._conn_lock:
+            row = self._conn.execute(
+                "SELECT arquivo_id FROM gemini_files WHERE name = ?", (name,)
+            ).fetchone()
+
+        if row and row[0]:
+            return False
+
+        return self.delete(name)
+
+    def delete(self, name):
+        """
+        Apaga o arquivo remoto e o registro local
+
+        Args:
+            name: Nome do arquivo no Gemini
+
+        Returns:
+            bool: True se apagou (ou já não existia no Gemini)
+        """
+        try:
+            self.client.files.delete(name=name)
+        except Exception as e:
+            # 404: já expirou/foi apagado - segue limpando o registro
+            if '404' not in str(e) and 'NOT_FOUND' not in str(e):
+                logger.warning(f"⚠️ Erro ao apagar {name} do Gemini: {e}")
+                return False
+
+        with self._conn_lock:
+            row = self._conn.execute(
+                "SELECT arquivo_id FROM gemini_files WHERE name = ?", (name,)
+            ).fetchone()
+            self._conn.execute("DELETE FROM gemini_files WHERE name = ?", (name,))
+
+        # O chat deixa de apontar para um arquivo que não existe mais
+        if row and row[0]:
+            try:
+                from dao.dao import get_dao
+                get_dao().desvincular_arquivo_gemini(name)
+            except Exception as e:
+                logger.warning(f"⚠️ Erro ao desvincular {name}: {e}")
+
+        logger.info(f"🗑️ Arquivo removido do Gemini: {name}")
+        return True
+
+    def is_fresh(self, expiration):
+        """
+        Se um arquivo com essa expiração ainda pode ser referenciado
+
+        Args:
+            expiration: datetime ou ISO (gemini_expiration do banco)
+
+        Returns:
+            bool: False se expirado, perto de expirar ou sem data
+        """
+        try:
+            expires_at = _epoch(expiration)
+        except ValueError:
+            return False
+
+        return bool(expires_at) and expires_at - time.time() > self.expiry_margin_seconds
+
+    def tracked_bytes(self):
+        """Bytes dos arquivos registrados (estimativa do armazenamento remoto)"""
+        with self._conn_lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM gemini_files").fetchone()[0]
+
+    def ensure_capacity(self, size_bytes):
+        """
+        Abre espaço para um upload apagando os arquivos mais antigos, se preciso
+
+        Args:
+            size_bytes: Tamanho do arquivo a enviar
+
+        Returns:
+            bool: True se há espaço (False = arquivo maior que a cota)
+        """
+        if size_bytes > self.quota_bytes:
+            return False
+
+        excess = self.tracked_bytes() + size_bytes - self.quota_bytes
+        if excess > 0:
+            self._evict(excess)
+
+        return True
+
+    def _evict(self, bytes_needed):
+        """Apaga os arquivos mais antigos até liberar bytes_needed"""
+        with self._conn_lock:
+            rows = self._conn.execute(
+                "SELECT name, size_bytes FROM gemini_files ORDER BY created_at"
+            ).fetchall()
+
+        freed = 0
+        for name, size in rows:
+            if freed >= bytes_needed:
+                break
+            if self.delete(name):
+                freed += size
+                with self._lock:
+                    self.deleted_quota += 1
+
+        logger.warning(f"⚠️ Cota de arquivos do Gemini: {freed / 1024 ** 2:.1f}MB liberados")
+
+    # ============ LIMPEZA EM BACKGROUND ============
+
+    def _ensure_sweeper(self):
+        with self._lock:
+            if self._sweeper and self._sweeper.is_alive():
+                return
+
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop,
+                name='gemini-files-sweeper',
+                daemon=True
+            )
+            self._sweeper.start()
+
+    def start(self):
+        """Inicia a limpeza periódica (chamado no aquecimento do serviço)"""
+        self._ensure_sweeper()
+
+    def _sweep_loop(self):
+        while not self._stop_event.wait(self.sweep_interval_seconds):
+            try:
+                if self._claim_sweep():
+                    self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Erro na limpeza de arquivos do Gemini: {e}")
+
+    def _claim_sweep(self):
+        """Só um worker limpa por intervalo (marca no SQLite compartilhado)"""
+        now = time.time()
+
+        with self._conn_lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO gemini_files_meta (chave, valor) VALUES ('next_sweep', 0)"
+            )
+            claimed = self._conn.execute(
+                "UPDATE gemini_files_meta SET valor = ? WHERE chave = 'next_sweep' AND valor <= ?",
+                (now + self.sweep_interval_seconds * 0.9, now)
+            ).rowcount
+
+        return bool(claimed)
+
+    def sweep(self):
+        """
+        Apaga arquivos remotos expirados (ou quase) e órfãos; atualiza o total
+
+        Só mexe em arquivos deste registro: nomes desconhecidos (outro host ou
+        deploy com a mesma chave, uploads anteriores ao registro) entram no
+        total de bytes, mas nunca são apagados
+
+        Returns:
+            dict: Contagem do que foi apagado e bytes restantes
+        """
+        now = time.time()
+
+        with self._conn_lock:
+            tracked = {
+                name: (arquivo_id, created_at)
+                for name, arquivo_id, created_at in self._conn.execute(
+                    "SELECT name, arquivo_id, created_at FROM gemini_files"
+                ).fetchall()
+            }
+
+        expired = orphans = untracked = 0
+        remote_bytes = 0
+        remote_names = set()
+
+        for remote in self.client.files.list():
+            remote_names.add(remote.name)
+            size = int(getattr(remote, 'size_bytes', None) or 0)
+
+            if remote.name not in tracked:
+                untracked += 1
+                remote_bytes += size
+                continue
+
+            arquivo_id, created_at = tracked[remote.name]
+            expires_at = _epoch(getattr(remote, 'expiration_time', None))
+
+            if expires_at and expires_at - now < self.expiry_margin_seconds:
+                if self.delete(remote.name):
+                    expired += 1
+                    continue
+
+            # Registrado e sem arquivo no chat depois da carência: upload abandonado
+            elif not arquivo_id and now - created_at > self.orphan_grace_seconds:
+                if self.delete(remote.name):
+                    orphans += 1
+                    continue
+
+            remote_bytes += size
+
+        # Registros de arquivos que já sumiram do Gemini
+        gone = [name for name in tracked if name not in remote_names]
+        if gone:
+            with self._conn_lock:
+                self._conn.executemany("DELETE FROM gemini_files WHERE name = ?", [(name,) for name in gone])
+
+        with self._lock:
+            self.deleted_expired += expired
+            self.deleted_orphans += orphans
+            self.remote_bytes = remote_bytes
+            self.untracked = untracked
+            self.last_sweep = datetime.now().isoformat()
+
+        # Acima de 90% da cota: volta para 80%
+        if remote_bytes > self.quota_bytes * 0.9:
+            self._evict(remote_bytes - int(self.quota_bytes * 0.8))
+
+        logger.info(
+            f"🧹 Arquivos do Gemini: {expired} expirados, {orphans} órfãos apagados, "
+            f"{untracked} de fora do registro, {remote_bytes / 1024 ** 2:.1f}MB em uso"
+        )
+
+        return {'expired': expired, 'orphans': orphans, 'untracked': untracked,
+                'remote_bytes': remote_bytes}
+
+    def get_stats(self):
+        """
+        Uso do armazenamento remoto e métricas da limpeza
+
+        Returns:
+            dict: Arquivos/bytes registrados, cota e apagados
+        """
+        with self._conn_lock:
+            files, tracked_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM gemini_files"
+            ).fetchone()
+
+        with self._lock:
+            return {
+                'files': files,
+                'tracked_bytes': tracked_bytes,
+                'remote_bytes': self.remote_bytes,
+                'untracked': self.untracked,
+                'quota_bytes': self.quota_bytes,
+                'quota_percent': round(tracked_bytes * 100 / self.quota_bytes, 2),
+                'reused': self.reused,
+                'deleted_expired': self.deleted_expired,
+                'deleted_orphans': self.deleted_orphans,
+                'deleted_quota': self.deleted_quota,
+                'last_sweep': self.last_sweep
+            }
+
+
+# Instância global (criada sob demanda)
+_file_manager = None
+_file_manager_lock = threading.Lock()
+
+
+def get_gemini_file_manager(client=None):
+    """
+    Retorna o gerenciador global (cota GEMINI_FILES_QUOTA_BYTES, registro em GEMINI_FILES_DB_PATH)
+
+    Args:
+        client: Cliente genai (None = cliente do GeminiService)
+    """
+    global _file_manager
+
+    if _file_manager is not None:
+        return _file_manager
+
+    with _file_manager_lock:
+        if _file_manager is None:
+            if client is None:
+                from services.gemini_service import get_gemini_service
+                client = get_gemini_service().client
+
+            _file_manager = GeminiFileManager(
+                client,
+                Config.GEMINI_FILES_DB_PATH,
+                quota_bytes=Config.GEMINI_FILES_QUOTA_BYTES,
+                sweep_interval_seconds=Config.GEMINI_FILES_SWEEP_SECONDS,
+                orphan_grace_seconds=Config.GEMINI_FILES_ORPHAN_GRACE_SECONDS
+            )
+            logger.info(f"✅ Gerenciador de arquivos do Gemini ({Config.GEMINI_FILES_DB_PATH})")
+
+        return _file_manager
@@ -0,0 +1,353 @@
+"""
+Agendador global das requisições ao Gemini
+
+Os limites do FREE tier (RPM, TPM, RPD) valem para a chave da API, não
+para cada usuário. O agendador admite requisições pelos contadores
+globais, coloca o excesso em fila e atende os usuários em ordem justa
+ponderada (orientadores com peso maior que participantes)
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from config import Config
+from utils.limiter import get_limiter, rpm, tpm, rpd
+from utils.advanced_logger import logger
+
+
+class Ticket:
+    """
+    Pedido de admissão de uma requisição
+
+    status: 'admitted', 'queued' ou 'rejected'
+    """
+
+    __slots__ = ('user_id', 'tipo_usuario', 'estimated_tokens', 'finish_tag', 'seq',
+                 'status', 'reason', 'retry_after', 'enqueued_at', 'admitted_at', '_event')
+
+    def __init__(self, user_id, tipo_usuario, estimated_tokens):
+        self.user_id = user_id
+        self.tipo_usuario = tipo_usuario
+        self.estimated_tokens = estimated_tokens
+        self.finish_tag = 0.0
+        self.seq = 0
+        self.status = 'queued'
+        self.reason = None  # Motivo da rejeição: 'busy', 'daily' ou 'too_large'
+        self.retry_after = 0
+        self.enqueued_at = time.time()
+        self.admitted_at = None
+        self._event = threading.Event()
+
+    @property
+    def admitted(self):
+        return self.status == 'admitted'
+
+    @property
+    def waited_seconds(self):
+        return (self.admitted_at or time.time()) - self.enqueued_at
+
+
+class GeminiScheduler:
+    """
+    Fila justa ponderada (WFQ) na frente do Gemini
+
+    - Cada usuário recebe uma tag de término virtual: max(tempo virtual,
+      última tag do usuário) + 1 / peso. A fila atende a menor tag, então
+      um usuário com muitas mensagens não bloqueia os demais
+    - A admissão consome dos contadores globais (janela deslizante de
+      utils/limiter.py); com LIMITER_BACKEND=sqlite valem para todos os workers,
+      com o backend em memória o ledger (attach_ledger) reidrata os contadores
+      no boot e soma as requisições dos outros workers
+    - Uma thread despacha a fila quando a janela libera espaço
+    """
+
+    KEY = 'gemini:admission'
+
+    def __init__(self, rpm_limit=10, tpm_limit=250_000, rpd_limit=250, weights=None,
+                 max_queue=100, max_wait_seconds=45, limiter=None):
+        self.rules = [rpm(rpm_limit), tpm(tpm_limit), rpd(rpd_limit)]
+        self.rpm_limit = rpm_limit
+        self.weights = weights or {'orientador': 2, 'participante': 1}
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+
+        self._limiter = limiter
+
+        self._cond = threading.Condition()
+        self._heap = []                  # [(finish_tag, seq, Ticket)]
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish = {}           # {user_id: última tag}
+        self._dispatcher = None
+
+        # Métricas
+        self.admitted_direct = 0
+        self.admitted_queued = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            self._limiter = get_limiter()
+        return self._limiter
+
+    def _quotas(self, ticket):
+        return [(self.rules[0], 1), (self.rules[1], ticket.estimated_tokens), (self.rules[2], 1)]
+
+    # ============ API PÚBLICA ============
+
+    def submit(self, user_id, tipo_usuario='participante', estimated_tokens=0):
+        """
+        Pede admissão de uma requisição (não bloqueia)
+
+        Args:
+            user_id: ID do usuário
+            tipo_usuario: 'orientador' ou 'participante' (define o peso)
+            estimated_tokens: Estimativa de tokens (para o TPM)
+
+        Returns:
+            Ticket: admitido, na fila ou rejeitado (com retry_after)
+        """
+        ticket = Ticket(user_id, tipo_usuario, int(estimated_tokens or 0))
+
+        with self._cond:
+            # Maior que o TPM inteiro: nunca será admitida
+            if ticket.estimated_tokens > self.rules[1].limit:
+                return self._reject(ticket, 0, reason='too_large')
+
+            wait = 0.0
+
+            # Caminho rápido: fila vazia e janela com espaço
+            if not self._heap:
+                result = self.limiter.hit(self.KEY, self._quotas(ticket))
+                if result.allowed:
+                    self._admit(ticket, queued=False)
+                    return ticket
+
+                # RPD esgotado: não adianta esperar na fila
+                if result.rule.name == 'rpd':
+                    return self._reject(ticket, result.retry_after, reason='daily')
+
+                wait = result.retry_after
+
+            wait = max(wait, self._estimate_wait(len(self._heap) + 1))
+            if len(self._heap) >= self.max_queue or wait > self.max_wait_seconds:
+                return self._reject(ticket, wait)
+
+            weight = self.weights.get(tipo_usuario, 1)
+            start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+            ticket.finish_tag = start + 1.0 / weight
+            ticket.seq = next(self._seq)
+            ticket.retry_after = int(wait) + 1
+            self._last_finish[user_id] = ticket.finish_tag
+
+            heapq.heappush(self._heap, (ticket.finish_tag, ticket.seq, ticket))
+            self._ensure_dispatcher()
+            self._cond.notify_all()
+
+        logger.info(f"⏳ Requisição de User {user_id} na fila do Gemini (~{ticket.retry_after}s, {len(self._heap)} na fila)")
+        return ticket
+
+    def wait(self, ticket, timeout=None):
+        """
+        Bloqueia até a requisição ser admitida
+
+        Args:
+            ticket: Ticket retornado por submit
+            timeout: Máximo de espera (padrão: max_wait_seconds)
+
+        Returns:
+            bool: True se admitida (senão ticket.retry_after indica quando tentar)
+        """
+        if ticket.status != 'queued':
+            return ticket.admitted
+
+        ticket._event.wait(self.max_wait_seconds if timeout is None else timeout)
+
+        with self._cond:
+            if ticket.status == 'queued':
+                # Desistiu: sai da fila (o despacho ignora tickets rejeitados)
+                self._reject(ticket, self._estimate_wait(len(self._heap)))
+
+        return ticket.admitted
+
+    def acquire(self, user_id, tipo_usuario='participante', estimated_tokens=0):
+        """
+        submit + wait
+
+        Returns:
+            Ticket
+        """
+        ticket = self.submit(user_id, tipo_usuario, estimated_tokens)
+        self.wait(ticket)
+        return ticket
+
+    def release(self, ticket, tokens_used=0):
+        """
+        Ajusta o TPM com o uso real (a admissão reservou a estimativa)
+
+        Args:
+            ticket: Ticket admitido
+            tokens_used: Tokens de entrada + saída da resposta
+        """
+        if not ticket or not ticket.admitted:
+            return
+
+        extra = int(tokens_used or 0) - ticket.estimated_tokens
+        if extra > 0:
+            self.limiter.add(self.KEY, [(self.rules[1], extra)])
+
+    def attach_ledger(self, ledger):
+        """
+        Reidrata as janelas de admissão e passa a somar os outros workers
+
+        Args:
+            ledger: UsageLedger compartilhado entre workers
+        """
+        loaded = ledger.subscribe(self._apply_ledger_events)
+        logger.info(f"♻️ GeminiScheduler reidratado do ledger: {loaded} eventos (24h)")
+
+    def _apply_ledger_events(self, events):
+        """Soma requisições de outros workers (ou de antes do reinício)"""
+        if self.limiter.shared:
+            # Contadores em SQLite já incluem essas admissões
+            return
+
+        for event in events:
+            if event['kind'] != 'request':
+                continue
+
+            tokens = (event['tokens_input'] or 0) + (event['tokens_output'] or 0)
+            self.limiter.add(
+                self.KEY,
+                [(self.rules[0], 1), (self.rules[1], tokens), (self.rules[2], 1)],
+                timestamp=event['ts']
+            )
+
+    def get_stats(self):
+        """
+        Estado da fila e métricas
+
+        Returns:
+            dict: Tamanho da fila, admitidos, rejeitados e espera média
+        """
+        usage = self.limiter.usage(self.KEY, self.rules)
+
+        with self._cond:
+            queued = len([t for _, _, t in self._heap if t.status == 'queued'])
+            admitted_queued = self.admitted_queued
+
+            return {
+                'queue_length': queued,
+                'admitted_direct': self.admitted_direct,
+                'admitted_queued': admitted_queued,
+                'rejected': self.rejected,
+                'avg_wait_seconds': round(self.total_wait_seconds / admitted_queued, 2) if admitted_queued else 0.0,
+                'estimated_wait_seconds': round(self._estimate_wait(queued + 1), 1),
+                'usage': usage
+            }
+
+    # ============ INTERNOS (chamar com self._cond) ============
+
+    def _admit(self, ticket, queued):
+        ticket.status = 'admitted'
+        ticket.admitted_at = time.time()
+        ticket._event.set()
+
+        if queued:
+            self.admitted_queued += 1
+            self.total_wait_seconds += ticket.waited_seconds
+        else:
+            self.admitted_direct += 1
+
+    def _reject(self, ticket, retry_after, reason='busy'):
+        ticket.status = 'rejected'
+        ticket.reason = reason
+        ticket.retry_after = int(retry_after) + 1
+        ticket._event.set()
+        self.rejected += 1
+        return ticket
+
+    def _estimate_wait(self, position):
+        """Espera estimada para a posição N da fila (ritmo do RPM)"""
+        result = self.limiter.check(self.KEY, [(self.rules[0], 1)])
+        slot = 60.0 / self.rpm_limit
+        return (result.retry_after if not result.allowed else 0.0) + max(0, position - 1) * slot
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher and self._dispatcher.is_alive():
+            return
+
+        self._dispatcher = threading.Thread(
+            target=self._dispatch_loop,
+            name='gemini-scheduler',
+            daemon=True
+        )
+        self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                # Descarta tickets que desistiram
+                while self._heap and self._heap[0][2].status != 'queued':
+                    heapq.heappop(self._heap)
+
+                if not self._heap:
+                    # Sem fila, ninguém fica "devendo" prioridade
+                    self._last_finish.clear()
+                    self._cond.wait(timeout=60)
+                    continue
+
+                ticket = self._heap[0][2]
+                result = self.limiter.hit(self.KEY, self._quotas(ticket))
+
+                if result.allowed:
+                    heapq.heappop(self._heap)
+                    self._virtual_time = max(self._virtual_time, ticket.finish_tag)
+                    self._admit(ticket, queued=True)
+                    logger.info(f"✅ Requisição de User {ticket.user_id} admitida após {ticket.waited_seconds:.1f}s na fila")
+                    continue
+
+                if result.rule.name == 'rpd':
+                    # Cota diária esgotada: esvazia a fila
+                    for _, _, queued in self._heap:
+                        if queued.status == 'queued':
+                            self._reject(queued, result.retry_after, reason='daily')
+                    self._heap.clear()
+                    continue
+
+                # Espera a janela liberar (ou um novo pedido chegar)
+                self._cond.wait(timeout=max(0.05, result.retry_after))
+
+
+# Instância global (criada sob demanda)
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_gemini_scheduler():
+    """Retorna o agendador global (limites de gemini_stats + Config)"""
+    global _scheduler
+
+    if _scheduler is not None:
+        return _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            from services.gemini_stats import gemini_stats
+
+            _scheduler = GeminiScheduler(
+                rpm_limit=gemini_stats.RPM_LIMIT,
+                tpm_limit=gemini_stats.TPM_LIMIT,
+                rpd_limit=gemini_stats.RPD_LIMIT,
+                weights={
+                    'orientador': Config.GEMINI_WEIGHT_ORIENTADOR,
+                    'participante': Config.GEMINI_WEIGHT_PARTICIPANTE
+                },
+                max_queue=Config.GEMINI_QUEUE_MAX,
+                max_wait_seconds=Config.GEMINI_QUEUE_MAX_WAIT_SECONDS
+            )
+
+        return _scheduler
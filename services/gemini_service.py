@@ -6,13 +6,82 @@ COM MODO BRAGANTEC OPCIONAL para reduzir consumo de tokens
 from google import genai
 from google.genai import types
 from google.genai.types import CountTokensConfig, Content, Part
+import json
 import os
+import threading
 import time
 from config import Config
 from utils.advanced_logger import logger, log_ai_usage
 from collections import defaultdict
 from datetime import datetime, timedelta
 from services.gemini_stats import gemini_stats
+from services.gemini_scheduler import get_gemini_scheduler
+from services.token_estimator import token_estimator
+from services.job_queue import JobCancelled
+from services.gemini_files import GeminiFileCancelled, get_gemini_file_manager
+from services.context_cache import BragantecContextCache
+from services.bragantec_index import get_bragantec_index
+from services.prompt_builder import PromptBuilder
+
+
+# ============ CORPUS COMPARTILHADO ============
+
+# Corpus imutável, lido uma única vez por processo
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def _load_context_files():
+    """Carrega arquivos de contexto da Bragantec (lê o disco)"""
+    logger.debug("📂 Carregando arquivos de contexto...")
+    context_content = []
+    context_path = Config.CONTEXT_FILES_PATH
+    
+    if not os.path.exists(context_path):
+        logger.warning(f"⚠️ Pasta {context_path} não existe")
+        os.makedirs(context_path, exist_ok=True)
+        return ""
+    
+    files_found = 0
+    total_chars = 0
+    
+    # Ordem fixa: o corpus precisa ser idêntico entre execuções (cache)
+    for filename in sorted(os.listdir(context_path)):
+        if filename.endswith('.txt'):
+            files_found += 1
+            filepath = os.path.join(context_path, filename)
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                    total_chars += len(content)
+                    context_content.append(f"=== {filename} ===\n{content}\n")
+                logger.info(f"✅ Contexto carregado: {filename}")
+            except Exception as e:
+                logger.error(f"❌ Erro ao carregar {filename}: {e}")
+    
+    if files_found == 0:
+        logger.warning("⚠️ Nenhum arquivo .txt encontrado em context_files/")
+    else:
+        logger.info(f"✅ {files_found} arquivos carregados (~{total_chars:,} caracteres)")
+    
+    return "\n".join(context_content) if context_content else ""
+
+
+def get_bragantec_corpus():
+    """
+    Retorna o corpus da Bragantec (lido do disco apenas na primeira chamada)
+    
+    Returns:
+        str: Conteúdo concatenado dos cadernos
+    """
+    global _corpus
+    
+    if _corpus is None:
+        with _corpus_lock:
+            if _corpus is None:
+                _corpus = _load_context_files()
+    
+    return _corpus
 
 
 class GeminiService:
@@ -21,15 +90,21 @@ class GeminiService:
     """
     
     def __init__(self):
-        """Inicializa cliente Gemini"""
+        """
+        Inicializa o serviço (leve)
+        
+        Cliente, corpus e cache de contexto são criados sob demanda no
+        primeiro uso. Use get_gemini_service() para a instância compartilhada
+        """
         logger.info("🤖 Inicializando GeminiService...")
         
         try:
-            self.client = genai.Client(api_key=Config.GEMINI_API_KEY)
             self.model_name = 'gemini-2.5-flash' #infelizmente o gemini 3 e pago
             
-            # ✅ NOVO: Carrega contexto da Bragantec APENAS UMA VEZ
-            self.context_files = self._load_context_files()
+            self._init_lock = threading.Lock()
+            self._client = None
+            self._context_cache = None
+            self._prompt_builder = None
             
             # Safety Settings: BLOCK_NONE
             self.safety_settings = [
@@ -51,7 +126,7 @@ class GeminiService:
                 )
             ]
             
-            logger.info("✅ GeminiService inicializado")
+            logger.info("✅ GeminiService inicializado (cliente e corpus sob demanda)")
             logger.info(f"   Modelo: {self.model_name}")
             logger.info(f"   Context window: 1.048.576 tokens")
             logger.info(f"   Max output: 65.536 tokens")
@@ -61,39 +136,127 @@ class GeminiService:
             logger.critical(f"💥 ERRO ao inicializar Gemini: {e}")
             raise
     
-    def _load_context_files(self):
-        """Carrega arquivos de contexto da Bragantec"""
-        logger.debug("📂 Carregando arquivos de contexto...")
-        context_content = []
-        context_path = Config.CONTEXT_FILES_PATH
+    # ============ INICIALIZAÇÃO SOB DEMANDA ============
+    
+    @property
+    def client(self):
+        """Cliente genai (criado no primeiro uso)"""
+        if self._client is None:
+            with self._init_lock:
+                if self._client is None:
+                    logger.info("🔌 Criando cliente Gemini...")
+                    self._client = genai.Client(api_key=Config.GEMINI_API_KEY)
+        return self._client
+    
+    @property
+    def context_files(self):
+        """Corpus da Bragantec (compartilhado pelo processo)"""
+        return get_bragantec_corpus()
+    
+    @property
+    def prompt_builder(self):
+        """Prefixo estável (system instruction → corpus → histórico → volátil)"""
+        if self._prompt_builder is None:
+            corpus = self.context_files
+            with self._init_lock:
+                if self._prompt_builder is None:
+                    self._prompt_builder = PromptBuilder(corpus)
+        return self._prompt_builder
+    
+    @property
+    def context_cache(self):
+        """Cache explícito do corpus (Context Caching) ou None se desativado"""
+        if not Config.GEMINI_CONTEXT_CACHE:
+            return None
         
-        if not os.path.exists(context_path):
-            logger.warning(f"⚠️ Pasta {context_path} não existe")
-            os.makedirs(context_path, exist_ok=True)
-            return ""
+        if self._context_cache is None:
+            client = self.client
+            with self._init_lock:
+                if self._context_cache is None:
+                    self._context_cache = BragantecContextCache(
+                        client,
+                        ttl_seconds=Config.GEMINI_CACHE_TTL_SECONDS
+                    )
+        return self._context_cache
+    
+    @property
+    def files(self):
+        """Registro, espera e limpeza dos arquivos enviados ao Gemini"""
+        return get_gemini_file_manager(self.client)
+    
+    def warm_up(self, carregar_indice=True):
+        """
+        Pré-carrega cliente, corpus e índice BM25
+        (evita que o primeiro usuário pague o custo de inicialização)
         
-        files_found = 0
-        total_chars = 0
-        
-        for filename in os.listdir(context_path):
-            if filename.endswith('.txt'):
-                files_found += 1
-                filepath = os.path.join(context_path, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        total_chars += len(content)
-                        context_content.append(f"=== {filename} ===\n{content}\n")
-                    logger.info(f"✅ Contexto carregado: {filename}")
-                except Exception as e:
-                    logger.error(f"❌ Erro ao carregar {filename}: {e}")
-        
-        if files_found == 0:
-            logger.warning("⚠️ Nenhum arquivo .txt encontrado em context_files/")
-        else:
-            logger.info(f"✅ {files_found} arquivos carregados (~{total_chars:,} caracteres)")
+        Args:
+            carregar_indice: Também carrega o índice BM25
+        """
+        start_time = time.time()
+        logger.info("🔥 Aquecendo GeminiService...")
+        
+        self.client
+        self.prompt_builder
+        
+        if carregar_indice:
+            try:
+                get_bragantec_index()
+            except Exception as e:
+                logger.warning(f"⚠️ Erro ao carregar índice BM25: {e}")
+        
+        self._precompute_token_counts()
+        
+        # Limpeza de arquivos expirados/órfãos começa junto com o serviço
+        self.files.start()
+        
+        duration = (time.time() - start_time) * 1000
+        logger.info(f"✅ GeminiService aquecido em {duration:.2f}ms")
+    
+    def _precompute_token_counts(self):
+        """
+        Conta exatamente (uma vez por processo) os tokens do corpus e das
+        variantes da instrução de sistema, usados na previsão de entrada
+        """
+        variantes = {
+            ('system', tipo, bragantec): self._get_system_instruction(tipo, bragantec)
+            for tipo in ('participante', 'orientador')
+            for bragantec in (False, True)
+        }
+        if self.context_files:
+            variantes['corpus'] = self.context_files
+        
+        for key, text in variantes.items():
+            try:
+                result = self.client.models.count_tokens(
+                    model=self.model_name,
+                    contents=[Content(role='user', parts=[Part(text=text)])]
+                )
+                token_estimator.set_exact(key, result.total_tokens)
+            except Exception as e:
+                logger.warning(f"⚠️ Não foi possível contar tokens de {key}: {e}")
+                return
         
-        return "\n".join(context_content) if context_content else ""
+        logger.info(f"📏 Contagens fixas de tokens prontas ({len(variantes)} partes)")
+    
+    def health(self):
+        """
+        Estado do serviço (sem I/O de disco nem chamadas à API)
+        
+        Returns:
+            dict: Status do cliente, corpus e caches
+        """
+        corpus = _corpus
+        context_cache = self._context_cache
+        
+        return {
+            'model': self.model_name,
+            'client_ready': self._client is not None,
+            'corpus_loaded': corpus is not None,
+            'corpus_chars': len(corpus) if corpus else 0,
+            'context_cache_enabled': Config.GEMINI_CONTEXT_CACHE,
+            'context_caches': context_cache.get_info() if context_cache else [],
+            'token_estimator': token_estimator.get_stats()
+        }
     
     def _get_system_instruction(self, tipo_usuario, usar_contexto_bragantec=False, apelido=None):
     
@@ -183,10 +346,286 @@ class GeminiService:
 
         return base
 
+    def _get_personalizacao(self, apelido=None):
+        """
+        Personalização por usuário enviada junto da mensagem
+        (fica fora do cache e do prefixo estável para não variar por usuário)
+        """
+        if not apelido:
+            return ""
+        
+        return f"=== USUÁRIO ===\nO apelido do usuário é '{apelido}'. Chame-o pelo apelido para criar conexão.\n\n"
+
+    def _get_bragantec_passages(self, query):
+        """
+        Busca no índice BM25 os trechos dos cadernos relevantes para a mensagem
+        
+        Args:
+            query: Mensagem do usuário
+        
+        Returns:
+            str: Trechos formatados ou "" (usar corpus completo)
+        """
+        try:
+            trechos = get_bragantec_index().format_passages(query, k=Config.BRAGANTEC_TOP_K)
+        except Exception as e:
+            logger.warning(f"⚠️ Erro na busca BM25, usando corpus completo: {e}")
+            return ""
+        
+        if trechos:
+            logger.info(f"🔎 Trechos relevantes: ~{len(trechos):,} chars (corpus completo: ~{len(self.context_files):,})")
+        
+        return trechos
+
+    def _get_cached_context(self, tipo_usuario, tools=None, tools_key='none'):
+        """
+        Retorna o nome do cache com system instruction + corpus da Bragantec
+        
+        Args:
+            tipo_usuario: Tipo do usuário (define a instrução de sistema)
+            tools: Ferramentas (precisam ficar dentro do cache)
+            tools_key: Identificador das ferramentas
+        
+        Returns:
+            str: Nome do cache ou None (usar contexto inline)
+        """
+        if not self.context_cache or not self.context_files:
+            return None
+        
+        system_instruction = self._get_system_instruction(tipo_usuario, True)
+        
+        return self.context_cache.get_or_create(
+            self.model_name,
+            system_instruction,
+            self.context_files,
+            tools=tools,
+            tools_key=tools_key
+        )
 
+
+    def _build_chat_request(self, message, tipo_usuario, history, usar_pesquisa,
+                            usar_code_execution, usar_contexto_bragantec,
+                            apelido, contexto_completo, file_refs=None):
+        """
+        Monta conteúdo e configuração de uma requisição de chat
+        (compartilhado entre chat e chat_stream)
+        
+        Os arquivos do chat (file_refs) vão por referência junto da mensagem atual
+        
+        Returns:
+            tuple: (contents, config, cache_name)
+        """
+        # Ferramentas
+        tools = []
+        cache_name = None
+        
+        if usar_pesquisa:
+            tools.append(types.Tool(google_search=types.GoogleSearch()))
+            logger.info("🔍 Google Search habilitado")
+        
+        if usar_code_execution:
+            tools.append(types.Tool(code_execution=types.ToolCodeExecution()))
+            logger.info("🐍 Code Execution habilitado")
+        
+        tools_key = f"s{int(bool(usar_pesquisa))}c{int(bool(usar_code_execution))}"
+        
+        # ✅ MODO BRAGANTEC: trechos relevantes (BM25) ou corpus completo (cache)
+        trechos_bragantec = ""
+        if usar_contexto_bragantec and not contexto_completo:
+            trechos_bragantec = self._get_bragantec_passages(message)
+        
+        if usar_contexto_bragantec and not trechos_bragantec:
+            cache_name = self._get_cached_context(tipo_usuario, tools, tools_key)
+        
+        # Partes voláteis: sempre no fim, depois do histórico
+        volatile_parts = [self._get_personalizacao(apelido)]
+        incluir_corpus = False
+        
+        if trechos_bragantec:
+            volatile_parts.append(
+                f"=== TRECHOS RELEVANTES DOS CADERNOS DA BRAGANTEC ===\n{trechos_bragantec}"
+            )
+            logger.info("📚 Contexto Bragantec: apenas trechos relevantes (BM25)")
+        elif cache_name:
+            logger.info(f"💾 Contexto Bragantec via cache: {cache_name}")
+        elif usar_contexto_bragantec:
+            # ✅ Corpus inline logo no início (prefixo estável)
+            incluir_corpus = True
+            logger.info("📚 Contexto Bragantec ADICIONADO (~{} chars)".format(len(self.context_files)))
+        else:
+            logger.info("🚀 Contexto Bragantec DESABILITADO (economia de tokens)")
+        
+        # ✅ System instruction sem apelido (igual para todos os usuários do mesmo tipo)
+        system_instruction = None
+        if not cache_name:
+            system_instruction = self._get_system_instruction(tipo_usuario, usar_contexto_bragantec)
+        
+        # Configuração
+        config = types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            temperature=0.7,
+            top_p=0.95,
+            top_k=40,
+            max_output_tokens=65536,
+            # Com cache, instrução e ferramentas já estão dentro do cached content
+            tools=tools if (tools and not cache_name) else None,
+            safety_settings=self.safety_settings,
+            thinking_config=types.ThinkingConfig(
+                thinking_budget=24000, # tecnologia legada com a chegada do gemini 3
+                include_thoughts=True
+            ),
+            cached_content=cache_name
+        )
+        
+        # Conteúdo: [corpus] → histórico (com roles) → partes voláteis + mensagem
+        contents = self.prompt_builder.build(
+            message,
+            history=history,
+            volatile_parts=volatile_parts,
+            incluir_corpus=incluir_corpus,
+            extra_parts=[
+                types.Part.from_uri(file_uri=uri, mime_type=mime_type)
+                for uri, mime_type in file_refs or []
+            ]
+        )
+        
+        return contents, config, cache_name
+    
+    @property
+    def scheduler(self):
+        """Fila global de admissão (limites da chave da API)"""
+        return get_gemini_scheduler()
+    
+    def _predict_input_tokens(self, contents, config, cache_name, tipo_usuario,
+                              usar_contexto_bragantec=False, files=None):
+        """
+        Prevê os tokens de entrada de uma requisição já montada (sem rede)
+        
+        Corpus e instrução de sistema usam contagens guardadas; o resto
+        (histórico, trechos, mensagem) usa a razão calibrada
+        
+        Args:
+            contents: Contents montados pelo PromptBuilder
+            config: GenerateContentConfig
+            cache_name: Cache de contexto usado (ou None)
+            tipo_usuario: Tipo do usuário (variante da instrução)
+            usar_contexto_bragantec: Variante da instrução
+            files: MIME types de arquivos anexados
+        
+        Returns:
+            Estimate
+        """
+        fixed_tokens = 0
+        texts = []
+        files = list(files or [])
+        
+        if cache_name:
+            fixed_tokens += self.context_cache.get_tokens(cache_name) or (
+                token_estimator.fixed('corpus', self.context_files) +
+                token_estimator.fixed(('system', tipo_usuario, True),
+                                      self._get_system_instruction(tipo_usuario, True))
+            )
+        elif config.system_instruction:
+            fixed_tokens += token_estimator.fixed(
+                ('system', tipo_usuario, bool(usar_contexto_bragantec)),
+                config.system_instruction
+            )
+        
+        corpus_content = self.prompt_builder.corpus_content
+        
+        for content in contents:
+            if corpus_content is not None and content is corpus_content:
+                fixed_tokens += token_estimator.fixed('corpus', self.context_files)
+                continue
+            
+            for part in content.parts:
+                if part.text:
+                    texts.append(part.text)
+                elif part.file_data:
+                    # Arquivo por referência (file_refs): estimativa por tipo, sem calibrar
+                    files.append(part.file_data.mime_type or 'application/octet-stream')
+        
+        estimate = token_estimator.estimate(texts, fixed_tokens, files)
+        logger.debug(f"📏 Entrada prevista: ~{estimate.tokens:,} tokens")
+        return estimate
+    
+    @staticmethod
+    def _busy_message(ticket):
+        """Mensagem para requisição não admitida pela fila"""
+        if ticket.reason == 'too_large':
+            return (f"Esta mensagem é grande demais (~{ticket.estimated_tokens:,} tokens de entrada). "
+                    f"Desative o Modo Bragantec ou reduza o texto.")
+        
+        if ticket.reason == 'daily':
+            return "Limite diário de requisições ao Gemini atingido. Volte amanhã."
+        
+        return f"Muitas requisições ao Gemini agora. Tente novamente em {ticket.retry_after}s."
+    
+    def _record_usage(self, usage_metadata, user_id):
+        """
+        Registra tokens consumidos nas estatísticas
+        
+        Args:
+            usage_metadata: usage_metadata da resposta (ou último chunk do stream)
+            user_id: ID do usuário
+        
+        Returns:
+            tuple: (tokens_input, tokens_output, tokens_cached)
+        """
+        if not usage_metadata:
+            return 0, 0, 0
+        
+        tokens_input = usage_metadata.prompt_token_count or 0
+        tokens_output = usage_metadata.candidates_token_count or 0
+        tokens_cached = getattr(usage_metadata, 'cached_content_token_count', None) or 0
+        
+        gemini_stats.record_request(user_id, tokens_input, tokens_output, tokens_cached=tokens_cached)
+        
+        logger.info(f"📊 Tokens - Input: {tokens_input:,} | Output: {tokens_output:,}")
+        
+        # ✅ ALERTA se consumo alto (tokens vindos do cache não contam)
+        if tokens_input - tokens_cached > 100000:
+            logger.warning(f"⚠️ CONSUMO ALTO DE TOKENS INPUT: {tokens_input:,}")
+            logger.warning(f"💡 Considere desativar o Modo Bragantec para economizar")
+        
+        if tokens_cached > 0:
+            logger.info(f"💾 Cache usado: {tokens_cached:,} tokens economizados!")
+        
+        return tokens_input, tokens_output, tokens_cached
+    
+    def _check_search_used(self, candidate, user_id):
+        """
+        Verifica se o Google Search foi usado (grounding_metadata)
+        
+        Returns:
+            bool: True se houve buscas
+        """
+        try:
+            grounding = getattr(candidate, 'grounding_metadata', None)
+            if grounding and hasattr(grounding, 'web_search_queries'):
+                queries = grounding.web_search_queries
+                if queries and isinstance(queries, (list, tuple)) and len(queries) > 0:
+                    logger.info(f"🔍 Google Search usado: {len(queries)} queries")
+                    gemini_stats.record_search(user_id)
+                    return True
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao verificar Google Search: {e}")
+        
+        return False
+    
     def chat(self, message, tipo_usuario='participante', history=None, 
          usar_pesquisa=True, usar_code_execution=True, analyze_url=None, 
-         usar_contexto_bragantec=False, user_id=None, apelido=None):
+         usar_contexto_bragantec=False, user_id=None, apelido=None,
+         contexto_completo=False, file_refs=None):
+        """
+        Envia mensagem ao Gemini
+        
+        Args:
+            usar_contexto_bragantec: Ativa o Modo Bragantec
+            contexto_completo: Se True, envia o corpus inteiro (via cache) em vez
+                               de apenas os trechos relevantes da busca BM25
+            file_refs: Arquivos do chat já no Gemini [(uri, mime_type)]
+        """
         
         logger.info("🚀 Iniciando chat com Gemini")
         logger.debug(f"   Tipo usuário: {tipo_usuario}")
@@ -195,72 +634,33 @@ class GeminiService:
         logger.debug(f"   🎯 MODO BRAGANTEC: {usar_contexto_bragantec}")
         logger.debug(f"   Histórico: {len(history) if history else 0} mensagens")
         
-        # Verifica limites
-        can_proceed, error_msg = gemini_stats.check_limits(user_id)
-        if not can_proceed:
-            logger.warning(f"⚠️ Rate limit excedido: {error_msg}")
-            return {
-                'response': f"⚠️ {error_msg}",
-                'thinking_process': None,
-                'error': True,
-                'search_used': False,
-                'code_executed': False,
-                'code_results': None
-            }
-        
         start_time = time.time()
+        cache_name = None
         
         try:
-            # ✅ System instruction OTIMIZADA
-            system_instruction = self._get_system_instruction(
-                tipo_usuario, 
-                usar_contexto_bragantec,
-                apelido  # ✅ NOVO
+            contents, config, cache_name = self._build_chat_request(
+                message, tipo_usuario, history, usar_pesquisa,
+                usar_code_execution, usar_contexto_bragantec,
+                apelido, contexto_completo, file_refs
             )
             
-            # ✅ ADICIONA CONTEXTO BRAGANTEC APENAS SE ATIVADO
-            if usar_contexto_bragantec:
-                full_message = f"{system_instruction}\n\n{self.context_files}\n\n=== MENSAGEM DO USUÁRIO ===\n{message}"
-                logger.info("📚 Contexto Bragantec ADICIONADO (~{} chars)".format(len(self.context_files)))
-            else:
-                full_message = f"{system_instruction}\n\n=== MENSAGEM DO USUÁRIO ===\n{message}"
-                logger.info("🚀 Contexto Bragantec DESABILITADO (economia de tokens)")
-            
-            # Ferramentas
-            tools = []
-            
-            if usar_pesquisa:
-                tools.append(types.Tool(google_search=types.GoogleSearch()))
-                logger.info("🔍 Google Search habilitado")
-            
-            if usar_code_execution:
-                tools.append(types.Tool(code_execution=types.ToolCodeExecution()))
-                logger.info("🐍 Code Execution habilitado")
-            
-            # Configuração
-            config = types.GenerateContentConfig(
-                temperature=0.7,
-                top_p=0.95,
-                top_k=40,
-                max_output_tokens=65536,
-                tools=tools if tools else None,
-                safety_settings=self.safety_settings,
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=24000, # tecnologia legada com a chegada do gemini 3
-                    include_thoughts=True
-                )
+            # ✅ Admissão pela fila global com a entrada prevista (espera a vez se preciso)
+            estimate = self._predict_input_tokens(
+                contents, config, cache_name, tipo_usuario, usar_contexto_bragantec
             )
-            
-            # Prepara conteúdo
-            contents = []
-            
-            # Adiciona histórico
-            if history:
-                for msg in history:
-                    contents.append(msg['parts'][0])
-            
-            # Adiciona mensagem atual
-            contents.append(full_message)
+            ticket = self.scheduler.acquire(user_id, tipo_usuario, estimate.tokens)
+            if not ticket.admitted:
+                error_msg = self._busy_message(ticket)
+                logger.warning(f"⚠️ Requisição não admitida: {error_msg}")
+                return {
+                    'response': f"⚠️ {error_msg}",
+                    'thinking_process': None,
+                    'error': True,
+                    'retry_after': ticket.retry_after if ticket.reason != 'too_large' else None,
+                    'search_used': False,
+                    'code_executed': False,
+                    'code_results': None
+                }
             
             # Gera resposta
             logger.debug("📤 Enviando requisição...")
@@ -312,40 +712,14 @@ class GeminiService:
                     response_text += part.text
             
             # Verifica Google Search
-            search_used = False
-            try:
-                if hasattr(response.candidates[0], 'grounding_metadata'):
-                    grounding = response.candidates[0].grounding_metadata
-                    if grounding and hasattr(grounding, 'web_search_queries'):
-                        queries = grounding.web_search_queries
-                        if queries and isinstance(queries, (list, tuple)) and len(queries) > 0:
-                            search_used = True
-                            logger.info(f"🔍 Google Search usado: {len(queries)} queries")
-                            gemini_stats.record_search(user_id)
-            except Exception as e:
-                logger.warning(f"⚠️ Erro ao verificar Google Search: {e}")
+            search_used = self._check_search_used(response.candidates[0], user_id)
             
             # Registra estatísticas
-            tokens_input = 0
-            tokens_output = 0
-            
-            if hasattr(response, 'usage_metadata'):
-                tokens_input = response.usage_metadata.prompt_token_count
-                tokens_output = response.usage_metadata.candidates_token_count
-                
-                gemini_stats.record_request(user_id, tokens_input, tokens_output)
-                
-                logger.info(f"📊 Tokens - Input: {tokens_input:,} | Output: {tokens_output:,}")
-                
-                # ✅ ALERTA se consumo alto
-                if tokens_input > 100000:
-                    logger.warning(f"⚠️ CONSUMO ALTO DE TOKENS INPUT: {tokens_input:,}")
-                    logger.warning(f"💡 Considere desativar o Modo Bragantec para economizar")
-                
-                if hasattr(response.usage_metadata, 'cached_content_token_count'):
-                    cached = response.usage_metadata.cached_content_token_count
-                    if cached is not None and cached > 0:
-                        logger.info(f"💾 Cache usado: {cached:,} tokens economizados!")
+            tokens_input, tokens_output, tokens_cached = self._record_usage(
+                getattr(response, 'usage_metadata', None), user_id
+            )
+            self.scheduler.release(ticket, tokens_input + tokens_output)
+            token_estimator.observe(estimate, tokens_input)
             
             duration = (time.time() - start_time) * 1000
             logger.info(f"✅ Resposta gerada em {duration:.2f}ms ({len(response_text)} chars)")
@@ -368,12 +742,17 @@ class GeminiService:
                 'code_results': code_results if code_results else None,
                 'tokens_input': tokens_input,
                 'tokens_output': tokens_output,
+                'tokens_cached': tokens_cached,
                 'total_tokens': tokens_input + tokens_output
             }
             
         except Exception as e:
             duration = (time.time() - start_time) * 1000
             logger.error(f"❌ Erro após {duration:.2f}ms: {str(e)}")
+            
+            # Cache pode ter expirado no servidor: força recriação na próxima
+            if cache_name:
+                self.context_cache.invalidate(cache_name)
             import traceback
             logger.error(f"Traceback:\n{traceback.format_exc()}")
             
@@ -389,11 +768,190 @@ class GeminiService:
                 'total_tokens': 0
             }
     
-    def upload_file(self, file_path, mime_type=None):
+    def chat_stream(self, message, tipo_usuario='participante', history=None,
+                    usar_pesquisa=True, usar_code_execution=True, analyze_url=None,
+                    usar_contexto_bragantec=False, user_id=None, apelido=None,
+                    contexto_completo=False, file_refs=None):
+        """
+        Versão em streaming do chat (generate_content_stream)
+        
+        Gera eventos conforme as parts chegam:
+            ('thought', {'text'}), ('text', {'text'}), ('code', {'language', 'code'}),
+            ('code_result', {'outcome', 'output'}), e por fim ('done', resultado)
+            ou ('error', {'message'})
+        
+        O resultado do 'done' tem o mesmo formato do retorno de chat()
+        
+        Args:
+            Mesmos de chat()
+        
+        Yields:
+            tuple: (tipo_evento, dados)
+        """
+        logger.info("🚀 Iniciando chat (stream) com Gemini")
+        logger.debug(f"   🎯 MODO BRAGANTEC: {usar_contexto_bragantec}")
+        
+        start_time = time.time()
+        first_chunk_ms = None
+        cache_name = None
+        
+        thinking_parts = []
+        response_text = ""
+        code_results = []
+        search_used = False
+        usage_metadata = None
         
         try:
+            contents, config, cache_name = self._build_chat_request(
+                message, tipo_usuario, history, usar_pesquisa,
+                usar_code_execution, usar_contexto_bragantec,
+                apelido, contexto_completo, file_refs
+            )
+            
+            # ✅ Admissão pela fila global: avisa o cliente se precisar esperar
+            estimate = self._predict_input_tokens(
+                contents, config, cache_name, tipo_usuario, usar_contexto_bragantec
+            )
+            ticket = self.scheduler.submit(user_id, tipo_usuario, estimate.tokens)
+            if ticket.status == 'queued':
+                yield 'queued', {'wait_seconds': ticket.retry_after}
+                self.scheduler.wait(ticket)
+            
+            if not ticket.admitted:
+                error_msg = self._busy_message(ticket)
+                logger.warning(f"⚠️ Requisição não admitida: {error_msg}")
+                yield 'error', {
+                    'message': f"⚠️ {error_msg}",
+                    'retry_after': ticket.retry_after if ticket.reason != 'too_large' else None
+                }
+                return
+            
+            logger.debug("📤 Enviando requisição (stream)...")
+            stream = self.client.models.generate_content_stream(
+                model=self.model_name,
+                contents=contents,
+                config=config
+            )
+            
+            for chunk in stream:
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.time() - start_time) * 1000
+                    logger.info(f"⚡ Primeiro chunk em {first_chunk_ms:.2f}ms")
+                
+                if getattr(chunk, 'usage_metadata', None):
+                    usage_metadata = chunk.usage_metadata
+                
+                if not chunk.candidates:
+                    continue
+                
+                candidate = chunk.candidates[0]
+                
+                if not search_used and getattr(candidate, 'grounding_metadata', None):
+                    search_used = self._check_search_used(candidate, user_id)
+                
+                if not candidate.content or not candidate.content.parts:
+                    continue
+                
+                for part in candidate.content.parts:
+                    # Thinking process
+                    if part.thought:
+                        if part.text:
+                            thinking_parts.append(part.text)
+                            yield 'thought', {'text': part.text}
+                    
+                    # Code execution
+                    elif getattr(part, 'executable_code', None):
+                        code_info = {
+                            'language': str(part.executable_code.language or 'python'),
+                            'code': part.executable_code.code or ''
+                        }
+                        logger.info(f"🐍 Código detectado: {code_info['language']}")
+                        code_results.append(code_info)
+                        yield 'code', code_info
+                    
+                    # Resultado da execução
+                    elif getattr(part, 'code_execution_result', None):
+                        result_info = {
+                            'outcome': str(part.code_execution_result.outcome or 'unknown'),
+                            'output': part.code_execution_result.output or ''
+                        }
+                        logger.info(f"✅ Resultado: {result_info['outcome']}")
+                        if code_results:
+                            code_results[-1]['result'] = result_info
+                        yield 'code_result', result_info
+                    
+                    # Texto normal
+                    elif part.text:
+                        response_text += part.text
+                        yield 'text', {'text': part.text}
+            
+            thinking_process = ''.join(thinking_parts) or None
+            
+            # Registra estatísticas (usage_metadata vem no último chunk)
+            tokens_input, tokens_output, tokens_cached = self._record_usage(usage_metadata, user_id)
+            self.scheduler.release(ticket, tokens_input + tokens_output)
+            token_estimator.observe(estimate, tokens_input)
+            
+            duration = (time.time() - start_time) * 1000
+            logger.info(f"✅ Stream concluído em {duration:.2f}ms ({len(response_text)} chars)")
+            
+            log_ai_usage(
+                self.model_name,
+                'CHAT_STREAM',
+                tokens_input=tokens_input,
+                tokens_output=tokens_output,
+                thinking=bool(thinking_process),
+                search=search_used
+            )
+            
+            yield 'done', {
+                'response': response_text,
+                'thinking_process': thinking_process,
+                'search_used': search_used,
+                'code_executed': bool(code_results),
+                'code_results': code_results if code_results else None,
+                'tokens_input': tokens_input,
+                'tokens_output': tokens_output,
+                'tokens_cached': tokens_cached,
+                'total_tokens': tokens_input + tokens_output,
+                'first_chunk_ms': first_chunk_ms
+            }
+        
+        except Exception as e:
+            duration = (time.time() - start_time) * 1000
+            logger.error(f"❌ Erro no stream após {duration:.2f}ms: {str(e)}")
+            
+            # Cache pode ter expirado no servidor: força recriação na próxima
+            if cache_name:
+                self.context_cache.invalidate(cache_name)
+            
+            yield 'error', {'message': f"Erro ao processar mensagem: {str(e)}"}
+    
+    def upload_file(self, file_path, mime_type=None, cancelled=None, sha256=None):
+        """
+        Envia arquivo ao Gemini e espera o processamento (vídeos)
+        
+        Args:
+            file_path: Caminho do arquivo
+            mime_type: MIME type (None = API detecta)
+            cancelled: Função que retorna True se o job foi cancelado
+            sha256: Hash do conteúdo (reutiliza um upload válido do mesmo conteúdo)
+        
+        Returns:
+            File do Gemini (None em caso de erro)
+        """
+        try:
+            if sha256:
+                reused = self._reuse_upload(sha256)
+                if reused:
+                    return reused
+
             logger.info(f"📤 Upload: {file_path}")
 
+            # Cota do armazenamento remoto (apaga os mais antigos se preciso)
+            if not self.files.ensure_capacity(os.path.getsize(file_path)):
+                raise ValueError("Arquivo maior que a cota de armazenamento do Gemini")
+
             # Define MIME type 
             if mime_type:
                 logger.info(f"📋 Usando MIME type fornecido: {mime_type}")
@@ -416,35 +974,94 @@ class GeminiService:
             logger.info(f"   URI: {uploaded_file.uri}")
             logger.info(f"   MIME: {uploaded_file.mime_type}")
 
-            # Aguarda processamento (para vídeos)
-            while uploaded_file.state.name == "PROCESSING":
-                logger.info("⏳ Processando...")
-                time.sleep(2)
-                uploaded_file = self.client.files.get(name=uploaded_file.name)
+            self.files.register(uploaded_file, sha256=sha256)
 
-            if uploaded_file.state.name == "FAILED":
-                raise ValueError(f"Falha no processamento: {uploaded_file.error}")
+            # Aguarda processamento (vídeos) com backoff exponencial
+            try:
+                uploaded_file = self.files.wait_until_active(uploaded_file, cancelled=cancelled)
+            except GeminiFileCancelled:
+                raise JobCancelled(uploaded_file.name)
 
             logger.info("✅ Arquivo pronto!")
             return uploaded_file
 
+        except JobCancelled:
+            logger.info("🛑 Upload cancelado")
+            raise
         except Exception as e:
             logger.error(f"❌ Erro no upload: {e}")
             return None
 
 
-    def chat_with_file(self, message, file_path, tipo_usuario='participante', user_id=None, keep_file_on_gemini=False, mime_type=None):
+    def _reuse_upload(self, sha256):
+        """
+        Upload já feito do mesmo conteúdo (None se expirou ou sumiu do Gemini)
+        """
+        name = self.files.lookup(sha256)
+        if not name:
+            return None
+
+        try:
+            uploaded_file = self.client.files.get(name=name)
+        except Exception as e:
+            logger.info(f"♻️ Upload {name} indisponível, reenviando: {e}")
+            self.files.delete(name)
+            return None
+
+        if uploaded_file.state.name != "ACTIVE":
+            return None
+
+        logger.info(f"♻️ Upload reutilizado (mesmo conteúdo): {name}")
+        return uploaded_file
+
+    def chat_with_file(self, message, file_path, tipo_usuario='participante', user_id=None, keep_file_on_gemini=False, mime_type=None,
+                       cancelled=None, sha256=None):
         
-        # Verifica limites
-        can_proceed, error_msg = gemini_stats.check_limits(user_id)
-        if not can_proceed:
-            return {'response': f"⚠️ {error_msg}", 'error': True}
+        cache_name = None
 
         try:
+            # ✅ Corpus + system instruction via cache (sem ferramentas)
+            cache_name = self._get_cached_context(tipo_usuario)
+
+            if cache_name:
+                logger.info(f"💾 Contexto Bragantec via cache: {cache_name}")
+
+            # Config (system instruction fica no cache quando houver)
+            config = types.GenerateContentConfig(
+                system_instruction=None if cache_name else self._get_system_instruction(tipo_usuario, True),
+                temperature=0.7,
+                max_output_tokens=65536,
+                safety_settings=self.safety_settings,
+                thinking_config=types.ThinkingConfig(
+                    thinking_budget=20000,
+                    include_thoughts=True
+                ),
+                cached_content=cache_name
+            )
+
+            # ✅ Admissão pela fila global ANTES do upload (entrada prevista localmente)
+            estimate = self._predict_input_tokens(
+                self.prompt_builder.build(message, incluir_corpus=not cache_name),
+                config, cache_name, tipo_usuario, True,
+                files=[mime_type or 'application/octet-stream']
+            )
+            ticket = self.scheduler.acquire(user_id, tipo_usuario, estimate.tokens)
+            if not ticket.admitted:
+                return {
+                    'response': f"⚠️ {self._busy_message(ticket)}",
+                    'error': True,
+                    'retry_after': ticket.retry_after if ticket.reason != 'too_large' else None
+                }
+
             # Upload com MIME type
-            uploaded_file = self.upload_file(file_path, mime_type=mime_type)
+            uploaded_file = self.upload_file(file_path, mime_type=mime_type, cancelled=cancelled,
+                                             sha256=sha256)
             if not uploaded_file:
                 return {'response': 'Erro ao fazer upload', 'error': True}
+            
+            if cancelled and cancelled():
+                self.files.discard(uploaded_file.name)
+                raise JobCancelled(uploaded_file.name)
 
             # Detecta tipo
             mime = uploaded_file.mime_type.lower()
@@ -459,26 +1076,20 @@ class GeminiService:
 
             logger.info(f"🔍 Tipo: {file_type} | URI: {uploaded_file.uri}")
 
-            # System instruction
-            system_instruction = self._get_system_instruction(tipo_usuario)
-
-            full_message = f"{system_instruction}\n\n{self.context_files}\n\n{message}"
-
-            # Config
-            config = types.GenerateContentConfig(
-                temperature=0.7,
-                max_output_tokens=65536,
-                safety_settings=self.safety_settings,
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=20000,
-                    include_thoughts=True
-                )
+            # Conteúdo: [corpus] → mensagem + arquivo
+            contents = self.prompt_builder.build(
+                message,
+                incluir_corpus=not cache_name,
+                extra_parts=[types.Part.from_uri(
+                    file_uri=uploaded_file.uri,
+                    mime_type=uploaded_file.mime_type
+                )]
             )
 
             # Gera resposta
             response = self.client.models.generate_content(
                 model=self.model_name,
-                contents=[full_message, uploaded_file],
+                contents=contents,
                 config=config
             )
 
@@ -493,11 +1104,11 @@ class GeminiService:
                     response_text += part.text
 
             # Registra estatísticas
-            if hasattr(response, 'usage_metadata'):
-                tokens_input = response.usage_metadata.prompt_token_count
-                tokens_output = response.usage_metadata.candidates_token_count
-                gemini_stats.record_request(user_id, tokens_input, tokens_output)
-                logger.info(f"📊 Tokens - Input: {tokens_input:,} | Output: {tokens_output:,}")
+            tokens_input, tokens_output, tokens_cached = self._record_usage(
+                getattr(response, 'usage_metadata', None), user_id
+            )
+            self.scheduler.release(ticket, tokens_input + tokens_output)
+            token_estimator.observe(estimate, tokens_input)
 
             # Decide se mantém ou deleta
             gemini_file_uri = None
@@ -508,8 +1119,7 @@ class GeminiService:
                 logger.info(f"   URI: {gemini_file_uri}")
                 logger.info(f"   Expira em: {uploaded_file.expiration_time}")
             else:
-                self.client.files.delete(name=uploaded_file.name)
-                logger.info("🗑️ Arquivo deletado do Gemini")
+                self.files.discard(uploaded_file.name)
 
             return {
                 'response': response_text or response.text,
@@ -517,49 +1127,303 @@ class GeminiService:
                 'file_type': file_type,
                 'gemini_file_uri': gemini_file_uri,
                 'gemini_file_name': uploaded_file.name if keep_file_on_gemini else None,
-                'gemini_expiration': str(uploaded_file.expiration_time) if keep_file_on_gemini else None
+                'gemini_expiration': uploaded_file.expiration_time if keep_file_on_gemini else None
             }
 
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"❌ Erro: {e}")
+            if cache_name:
+                self.context_cache.invalidate(cache_name)
             return {'response': f"Erro: {str(e)}", 'error': True}
     
     
-    def count_tokens(self, text):
-
-        try:
-            
+    def generate_json(self, prompt, schema, validator=None, operation='JSON',
+                      tipo_usuario='participante', user_id=None, usar_contexto_bragantec=False,
+                      max_repairs=None, cancelled=None):
+        """
+        Geração com saída estruturada (response_schema) validada no servidor
+        
+        Se o JSON não passa na validação, pede um reparo curto (sem o corpus:
+        só o prompt, a resposta inválida e o erro), no máximo max_repairs vezes
+        
+        Args:
+            prompt: Instruções da tarefa
+            schema: types.Schema da resposta
+            validator: Função validator(data) que levanta ValueError
+            operation: Nome da operação (estatísticas e log)
+            tipo_usuario: Tipo do usuário (instrução de sistema e peso na fila)
+            user_id: ID do usuário
+            usar_contexto_bragantec: Envia o corpus completo (via cache quando houver)
+            max_repairs: Tentativas de reparo (padrão: Config.STRUCTURED_MAX_REPAIRS)
+            cancelled: Função que retorna True se o job foi cancelado
         
-            # Cria conteúdo para contar
-            contents = [
-                Content(
-                    parts=[Part(text=text)],
-                    role='user'
+        Returns:
+            dict: {'data', 'error', 'response', 'attempts', 'tokens_input', 'tokens_output'}
+                  ('retry_after' quando a fila não admitiu)
+        """
+        if max_repairs is None:
+            max_repairs = Config.STRUCTURED_MAX_REPAIRS
+        
+        # Ferramentas não combinam com response_schema: só o corpus (cache sem ferramentas)
+        cache_name = self._get_cached_context(tipo_usuario) if usar_contexto_bragantec else None
+        
+        config_args = dict(
+            temperature=0.7,
+            max_output_tokens=65536,
+            safety_settings=self.safety_settings,
+            response_mime_type='application/json',
+            response_schema=schema
+        )
+        
+        config = types.GenerateContentConfig(
+            system_instruction=None if cache_name else self._get_system_instruction(tipo_usuario, usar_contexto_bragantec),
+            thinking_config=types.ThinkingConfig(thinking_budget=8192),
+            cached_content=cache_name,
+            **config_args
+        )
+        contents = self.prompt_builder.build(
+            prompt, incluir_corpus=usar_contexto_bragantec and not cache_name
+        )
+        
+        tokens_input = tokens_output = 0
+        parse_failures = 0
+        text = ''
+        attempts = 0
+        
+        for attempt in range(1 + max_repairs):
+            if cancelled and cancelled():
+                raise JobCancelled(operation)
+            
+            estimate = self._predict_input_tokens(
+                contents, config, cache_name, tipo_usuario, usar_contexto_bragantec
+            )
+            ticket = self.scheduler.acquire(user_id, tipo_usuario, estimate.tokens)
+            if not ticket.admitted:
+                return {
+                    'data': None,
+                    'error': True,
+                    'response': f"⚠️ {self._busy_message(ticket)}",
+                    'retry_after': ticket.retry_after if ticket.reason != 'too_large' else None,
+                    'attempts': attempts,
+                    'tokens_input': tokens_input,
+                    'tokens_output': tokens_output
+                }
+            
+            attempts += 1
+            
+            try:
+                response = self.client.models.generate_content(
+                    model=self.model_name,
+                    contents=contents,
+                    config=config
                 )
-            ]
+            except Exception as e:
+                logger.error(f"❌ Erro em {operation}: {e}")
+                if cache_name:
+                    self.context_cache.invalidate(cache_name)
+                gemini_stats.record_structured(operation, False, attempts, parse_failures,
+                                               tokens_input + tokens_output)
+                return {
+                    'data': None,
+                    'error': True,
+                    'response': f"Erro ao processar: {str(e)}",
+                    'attempts': attempts,
+                    'tokens_input': tokens_input,
+                    'tokens_output': tokens_output
+                }
+            
+            used_input, used_output, _ = self._record_usage(
+                getattr(response, 'usage_metadata', None), user_id
+            )
+            self.scheduler.release(ticket, used_input + used_output)
+            token_estimator.observe(estimate, used_input)
+            tokens_input += used_input
+            tokens_output += used_output
+            
+            text = response.text or ''
+            
+            try:
+                data = json.loads(text)
+                if validator:
+                    validator(data)
+            except ValueError as e:
+                parse_failures += 1
+                logger.warning(f"⚠️ {operation}: JSON inválido na tentativa {attempt + 1}: {e}")
+                
+                # Reparo: só prompt + resposta inválida + erro (sem corpus nem cache)
+                cache_name = None
+                usar_contexto_bragantec = False
+                config = types.GenerateContentConfig(
+                    system_instruction=self._get_system_instruction(tipo_usuario, False),
+                    thinking_config=types.ThinkingConfig(thinking_budget=0),
+                    **config_args
+                )
+                contents = [
+                    Content(role='user', parts=[Part(text=prompt)]),
+                    Content(role='model', parts=[Part(text=text)]),
+                    Content(role='user', parts=[Part(text=(
+                        f"A resposta anterior não é válida: {e}. "
+                        "Corrija e retorne o JSON completo no formato pedido."
+                    ))])
+                ]
+                continue
+            
+            gemini_stats.record_structured(operation, True, attempts, parse_failures,
+                                           tokens_input + tokens_output)
+            log_ai_usage(self.model_name, operation,
+                         tokens_input=tokens_input, tokens_output=tokens_output)
+            logger.info(f"✅ {operation}: JSON válido após {attempts} tentativa(s)")
+            
+            return {
+                'data': data,
+                'error': False,
+                'response': text,
+                'attempts': attempts,
+                'tokens_input': tokens_input,
+                'tokens_output': tokens_output
+            }
         
-            result = self.client.models.count_tokens(
+        gemini_stats.record_structured(operation, False, attempts, parse_failures,
+                                       tokens_input + tokens_output)
+        logger.error(f"❌ {operation}: JSON inválido após {attempts} tentativas")
+        
+        return {
+            'data': None,
+            'error': True,
+            'response': 'A IA não retornou uma resposta válida. Tente novamente.',
+            'raw': text,
+            'attempts': attempts,
+            'tokens_input': tokens_input,
+            'tokens_output': tokens_output
+        }
+    
+    def resumir_historico(self, resumo_anterior, mensagens, user_id=None, tipo_usuario='participante'):
+        """
+        Incorpora ao resumo do chat as mensagens que saíram da janela do histórico
+        
+        Args:
+            resumo_anterior: Resumo atual (ou None)
+            mensagens: Mensagens em ordem cronológica ({'role', 'conteudo'})
+            user_id: Dono do chat (contabiliza no uso)
+            tipo_usuario: Peso na fila do Gemini
+        
+        Returns:
+            str: Novo resumo (None se não foi possível gerar agora)
+        """
+        max_tokens = Config.HISTORY_SUMMARY_MAX_TOKENS
+        
+        linhas = []
+        for msg in mensagens:
+            autor = 'Usuário' if msg['role'] == 'user' else 'APBIA'
+            conteudo = msg.get('conteudo') or ''
+            # Respostas muito longas: o início basta para o resumo
+            if len(conteudo) > 4000:
+                conteudo = conteudo[:4000] + ' [...]'
+            linhas.append(f"{autor}: {conteudo}")
+        
+        prompt = (
+            f"=== RESUMO ATUAL ===\n{resumo_anterior or '(vazio)'}\n\n"
+            f"=== NOVAS MENSAGENS ===\n" + "\n\n".join(linhas)
+        )
+        
+        config = types.GenerateContentConfig(
+            system_instruction=(
+                "Você mantém o resumo de uma conversa entre um estudante e a APBIA, "
+                "assistente de projetos científicos da Bragantec. Reescreva o resumo atual "
+                "incorporando as novas mensagens. Preserve fatos sobre o projeto, decisões, "
+                "dúvidas em aberto e preferências do usuário; descarte cumprimentos e "
+                f"repetições. Responda só com o resumo, em português, em até {max_tokens // 2} palavras."
+            ),
+            temperature=0.2,
+            max_output_tokens=max_tokens,
+            thinking_config=types.ThinkingConfig(thinking_budget=0)
+        )
+        
+        estimate = token_estimator.estimate([prompt, config.system_instruction])
+        ticket = self.scheduler.acquire(user_id, tipo_usuario, estimate.tokens + max_tokens)
+        if not ticket.admitted:
+            logger.info(f"⏳ Resumo do histórico adiado ({self._busy_message(ticket)})")
+            return None
+        
+        try:
+            response = self.client.models.generate_content(
                 model=self.model_name,
-                contents=contents
+                contents=[Content(role='user', parts=[Part(text=prompt)])],
+                config=config
             )
+        except Exception as e:
+            logger.error(f"❌ Erro ao resumir histórico: {e}")
+            return None
         
-            # Retorna contagem total
-            token_count = result.total_tokens
+        tokens_input, tokens_output, _ = self._record_usage(
+            getattr(response, 'usage_metadata', None), user_id
+        )
+        self.scheduler.release(ticket, tokens_input + tokens_output)
+        token_estimator.observe(estimate, tokens_input)
         
-            logger.info(f"📊 Contagem de tokens: {token_count} tokens para {len(text)} caracteres")
+        log_ai_usage(self.model_name, 'RESUMO_HISTORICO',
+                     tokens_input=tokens_input, tokens_output=tokens_output)
         
-            return token_count
+        return (response.text or '').strip() or None
+    
+    def count_tokens(self, text):
+        """
+        Conta tokens localmente (contador do chat, chamado enquanto o usuário digita)
         
-        except Exception as e:
-            logger.warning(f"⚠️ Erro ao contar tokens via API: {e}")
-            logger.info("💡 Usando fallback: 1 token ≈ 4 caracteres")
+        A razão caracteres/token é calibrada por idioma; só uma amostra a
+        cada TOKEN_COUNT_SAMPLE_EVERY contagens é conferida com a API, em
+        background
         
-            # Fallback: estimativa aproximada
-            # geralmente 1 token ≈ 4 caracteres
-            estimated_tokens = max(1, len(text) // 4)
+        Args:
+            text: Texto
         
-            return estimated_tokens
+        Returns:
+            int: Tokens estimados
+        """
+        tokens, language, sample = token_estimator.count_text(text)
+        
+        if sample:
+            threading.Thread(
+                target=self._calibrate_token_count,
+                args=(text,),
+                name='token-count-sample',
+                daemon=True
+            ).start()
+        
+        return tokens
+    
+    def _calibrate_token_count(self, text):
+        """Confere uma contagem local com count_tokens da API"""
+        actual = None
+        try:
+            result = self.client.models.count_tokens(
+                model=self.model_name,
+                contents=[Content(parts=[Part(text=text)], role='user')]
+            )
+            actual = result.total_tokens
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao amostrar contagem de tokens via API: {e}")
+        finally:
+            token_estimator.observe_language(text, actual)
     
     def get_stats(self):
         """Retorna estatísticas atuais"""
-        return gemini_stats.get_stats()
\ No newline at end of file
+        return gemini_stats.get_stats()
+
+
+# ============ REGISTRO (instância única por processo) ============
+
+_gemini_service = None
+_gemini_service_lock = threading.Lock()
+
+
+def get_gemini_service():
+    """Retorna instância global do GeminiService"""
+    global _gemini_service
+    if _gemini_service is None:
+        with _gemini_service_lock:
+            if _gemini_service is None:
+                _gemini_service = GeminiService()
+    return _gemini_service
@@ -3,10 +3,14 @@ Sistema de Monitoramento de Uso do Gemini 2.5 Flash (FREE Tier)
 Rastreia uso em tempo real e valida limites
 """
 
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import deque
+from datetime import datetime
 from threading import Lock
 import json
+import time
+from services.usage_timeseries import MinuteRingBuffer
+from utils.limiter import get_limiter, Rule, rpm, tpm, rpd, search_rpd
+from utils.advanced_logger import logger
 
 class GeminiStats:
     """
@@ -33,25 +37,50 @@ class GeminiStats:
         self.RPD_LIMIT = 250       # Requests por dia
         self.SEARCH_RPD_LIMIT = 500 # Google Search por dia
         
-        # Contadores por usuário
-        self.requests_minute = defaultdict(list)  # {user_id: [(timestamp, tokens)]}
-        self.requests_day = defaultdict(list)     # {user_id: [(timestamp, tokens)]}
-        self.searches_day = defaultdict(list)     # {user_id: [timestamps]}
+        # Contadores por usuário e globais (janela deslizante em utils/limiter.py)
+        # Chaves: 'gemini:user:<id>' e 'gemini:global'
+        self._limiter = None
+        self.rpm_rule = rpm(self.RPM_LIMIT)
+        self.tpm_rule = tpm(self.TPM_LIMIT)
+        self.rpd_rule = rpd(self.RPD_LIMIT)
+        self.tpd_rule = Rule('tpd', float('inf'), 86400, 96)  # Só contagem (sem limite)
+        self.search_rule = search_rpd(self.SEARCH_RPD_LIMIT)
+        self.rules = [self.rpm_rule, self.tpm_rule, self.rpd_rule, self.tpd_rule, self.search_rule]
         
         # Estatísticas globais
         self.total_requests = 0
         self.total_tokens_input = 0
         self.total_tokens_output = 0
+        self.total_tokens_cached = 0
         self.total_searches = 0
         
-        # Histórico (últimas 24h)
-        self.history = []
+        # Série por minuto das últimas 24h (anel de tamanho fixo)
+        self.timeseries = MinuteRingBuffer(minutes=1440)
+        
+        # Últimas requisições (exibição)
+        self.history = deque(maxlen=50)
+        
+        # Saída estruturada (JSON com response_schema) por operação
+        self.structured = {}
+        
+        # Ledger durável (services/usage_ledger.py), ligado em attach_ledger
+        self.ledger = None
         
         # Cache de estatísticas (atualizado a cada minuto)
         self.cached_stats = {}
         self.last_cache_update = None
     
-    def record_request(self, user_id, tokens_input=0, tokens_output=0):
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            self._limiter = get_limiter()
+        return self._limiter
+    
+    @staticmethod
+    def _key(user_id):
+        return f"gemini:user:{user_id}"
+    
+    def record_request(self, user_id, tokens_input=0, tokens_output=0, tokens_cached=0):
         """
         Registra uma requisição ao Gemini
         
@@ -59,23 +88,22 @@ class GeminiStats:
             user_id: ID do usuário (ou None para global)
             tokens_input: Tokens de entrada
             tokens_output: Tokens de saída
+            tokens_cached: Tokens de entrada servidos pelo cache (cached_content_token_count)
         """
+        tokens_input = int(tokens_input or 0)
+        tokens_output = int(tokens_output or 0)
+        tokens_cached = int(tokens_cached or 0)
+        total_tokens = tokens_input + tokens_output
+        now = datetime.now()
+        
+        self._count_request(user_id, tokens_input, tokens_output, tokens_cached, now.timestamp())
+        
         with self.lock:
-            now = datetime.now()
-            
-            tokens_input = int(tokens_input or 0)
-            tokens_output = int(tokens_output or 0)
-            total_tokens = tokens_input + tokens_output
-            
-            # Registra por usuário
-            if user_id:
-                self.requests_minute[user_id].append((now, total_tokens))
-                self.requests_day[user_id].append((now, total_tokens))
-            
             # Estatísticas globais
             self.total_requests += 1
             self.total_tokens_input += tokens_input
             self.total_tokens_output += tokens_output
+            self.total_tokens_cached += tokens_cached
             
             # Histórico
             self.history.append({
@@ -83,118 +111,90 @@ class GeminiStats:
                 'user_id': user_id,
                 'tokens_input': tokens_input,
                 'tokens_output': tokens_output,
+                'tokens_cached': tokens_cached,
                 'total_tokens': total_tokens
             })
-            
-            # Limpa histórico antigo (> 24h)
-            cutoff = now - timedelta(hours=24)
-            self.history = [h for h in self.history 
-                          if datetime.fromisoformat(h['timestamp']) > cutoff]
+        
+        if self.ledger:
+            self.ledger.record('request', user_id, tokens_input, tokens_output, tokens_cached,
+                               timestamp=now.timestamp())
     
-    def record_search(self, user_id):
-        """
-        Registra uso do Google Search
+    def _count_request(self, user_id, tokens_input, tokens_output, tokens_cached, timestamp,
+                       update_limiter=True):
+        """Soma uma requisição nos contadores de limite e na série por minuto"""
+        total_tokens = tokens_input + tokens_output
+        
+        if update_limiter:
+            quotas = [(self.rpm_rule, 1), (self.tpm_rule, total_tokens),
+                      (self.rpd_rule, 1), (self.tpd_rule, total_tokens)]
+            
+            # Registra por usuário e no total global
+            if user_id:
+                self.limiter.add(self._key(user_id), quotas, timestamp=timestamp)
+            self.limiter.add('gemini:global', quotas, timestamp=timestamp)
         
-        Args:
-            user_id: ID do usuário
-        """
         with self.lock:
-            now = datetime.now()
-            
+            self.timeseries.record(
+                user_id,
+                timestamp=timestamp,
+                requests=1,
+                tokens_input=tokens_input,
+                tokens_output=tokens_output,
+                tokens_cached=tokens_cached
+            )
+    
+    def _count_search(self, user_id, timestamp, update_limiter=True):
+        """Soma uma busca nos contadores de limite e na série por minuto"""
+        if update_limiter:
             if user_id:
-                self.searches_day[user_id].append(now)
-            
-            self.total_searches += 1
+                self.limiter.add(self._key(user_id), [(self.search_rule, 1)], timestamp=timestamp)
+            self.limiter.add('gemini:global', [(self.search_rule, 1)], timestamp=timestamp)
+        
+        with self.lock:
+            self.timeseries.record(user_id, timestamp=timestamp, searches=1)
     
-    def check_limits(self, user_id, estimated_tokens=0):
+    def attach_ledger(self, ledger):
         """
-        Verifica se o usuário pode fazer uma requisição
+        Passa a gravar no ledger durável e reidrata as janelas de minuto/dia
         
         Args:
-            user_id: ID do usuário
-            estimated_tokens: Estimativa de tokens da requisição
+            ledger: UsageLedger compartilhado entre workers
+        """
+        self.ledger = ledger
+        loaded = ledger.subscribe(self._apply_ledger_events)
+        logger.info(f"♻️ GeminiStats reidratado do ledger: {loaded} eventos (24h)")
+    
+    def _apply_ledger_events(self, events):
+        """
+        Aplica eventos gravados por outros workers (ou antes do reinício)
         
-        Returns:
-            (bool, str): (pode_fazer, mensagem_erro)
+        Se o limiter já é compartilhado (SQLite), os contadores de limite
+        já contêm esses eventos; só a série por minuto é atualizada
         """
-        with self.lock:
-            now = datetime.now()
-            
-            # Limpa dados antigos
-            self._cleanup_old_data(user_id, now)
-            
-            # Verifica RPM
-            requests_last_minute = len(self.requests_minute.get(user_id, []))
-            if requests_last_minute >= self.RPM_LIMIT:
-                return False, f"Limite de {self.RPM_LIMIT} requisições/minuto excedido. Aguarde."
-            
-            # Verifica TPM
-            tokens_last_minute = sum(tokens for _, tokens in self.requests_minute.get(user_id, []))
-            if tokens_last_minute + estimated_tokens > self.TPM_LIMIT:
-                return False, f"Limite de {self.TPM_LIMIT:,} tokens/minuto excedido. Aguarde."
-            
-            # Verifica RPD
-            requests_today = len(self.requests_day.get(user_id, []))
-            if requests_today >= self.RPD_LIMIT:
-                return False, f"Limite diário de {self.RPD_LIMIT} requisições excedido. Volte amanhã."
-            
-            return True, ""
+        update_limiter = not self.limiter.shared
+        
+        for event in events:
+            if event['kind'] == 'request':
+                self._count_request(event['user_id'], event['tokens_input'], event['tokens_output'],
+                                    event['tokens_cached'], event['ts'], update_limiter)
+            elif event['kind'] == 'search':
+                self._count_search(event['user_id'], event['ts'], update_limiter)
     
-    def check_search_limit(self, user_id):
+    def record_search(self, user_id):
         """
-        Verifica se pode usar Google Search
+        Registra uso do Google Search
         
         Args:
             user_id: ID do usuário
-        
-        Returns:
-            (bool, str): (pode_fazer, mensagem_erro)
         """
+        now = time.time()
+        self._count_search(user_id, now)
+        
         with self.lock:
-            now = datetime.now()
-            
-            # Limpa buscas antigas (> 24h)
-            cutoff = now - timedelta(days=1)
-            if user_id in self.searches_day:
-                self.searches_day[user_id] = [
-                    ts for ts in self.searches_day[user_id] if ts > cutoff
-                ]
-            
-            searches_today = len(self.searches_day.get(user_id, []))
-            
-            if searches_today >= self.SEARCH_RPD_LIMIT:
-                return False, f"Limite de {self.SEARCH_RPD_LIMIT} buscas/dia excedido."
-            
-            return True, ""
-    
-    def _cleanup_old_data(self, user_id, now):
-        """
-        ✅ CORRIGIDO: Limpa dados antigos dos contadores com verificações de segurança
-        """
-        # Limpa requests_minute (> 1 minuto)
-        cutoff_minute = now - timedelta(minutes=1)
-        
-        # ✅ CORRIGIDO: Verifica se user_id existe antes de limpar
-        if user_id and user_id in self.requests_minute:
-            self.requests_minute[user_id] = [
-                (ts, tokens) for ts, tokens in self.requests_minute[user_id]
-                if ts > cutoff_minute
-            ]
-        
-        # Limpa requests_day (> 24h)
-        cutoff_day = now - timedelta(days=1)
-        
-        if user_id and user_id in self.requests_day:
-            self.requests_day[user_id] = [
-                (ts, tokens) for ts, tokens in self.requests_day[user_id]
-                if ts > cutoff_day
-            ]
-        
-        # Limpa searches_day (> 24h)
-        if user_id and user_id in self.searches_day:
-            self.searches_day[user_id] = [
-                ts for ts in self.searches_day[user_id] if ts > cutoff_day
-            ]
+            self.total_searches += 1
+        
+        if self.ledger:
+            self.ledger.record('search', user_id, timestamp=now)
     
     def get_user_stats(self, user_id):
         """
@@ -206,36 +206,34 @@ class GeminiStats:
         Returns:
             dict: Estatísticas do usuário
         """
-        with self.lock:
-            now = datetime.now()
-            self._cleanup_old_data(user_id, now)
+        usage = self.limiter.usage(self._key(user_id), self.rules)
+        
+        requests_minute = usage['rpm']
+        requests_day = usage['rpd']
+        searches_day = usage['search_rpd']
+        
+        tokens_minute = usage['tpm']
+        tokens_day = usage['tpd']
+        
+        return {
+            'requests_minute': requests_minute,
+            'requests_minute_limit': self.RPM_LIMIT,
+            'requests_minute_percent': int((requests_minute / self.RPM_LIMIT) * 100),
             
-            requests_minute = len(self.requests_minute.get(user_id, []))
-            requests_day = len(self.requests_day.get(user_id, []))
-            searches_day = len(self.searches_day.get(user_id, []))
+            'requests_day': requests_day,
+            'requests_day_limit': self.RPD_LIMIT,
+            'requests_day_percent': int((requests_day / self.RPD_LIMIT) * 100),
             
-            tokens_minute = sum(tokens for _, tokens in self.requests_minute.get(user_id, []))
-            tokens_day = sum(tokens for _, tokens in self.requests_day.get(user_id, []))
+            'tokens_minute': tokens_minute,
+            'tokens_minute_limit': self.TPM_LIMIT,
+            'tokens_minute_percent': int((tokens_minute / self.TPM_LIMIT) * 100),
             
-            return {
-                'requests_minute': requests_minute,
-                'requests_minute_limit': self.RPM_LIMIT,
-                'requests_minute_percent': int((requests_minute / self.RPM_LIMIT) * 100),
-                
-                'requests_day': requests_day,
-                'requests_day_limit': self.RPD_LIMIT,
-                'requests_day_percent': int((requests_day / self.RPD_LIMIT) * 100),
-                
-                'tokens_minute': tokens_minute,
-                'tokens_minute_limit': self.TPM_LIMIT,
-                'tokens_minute_percent': int((tokens_minute / self.TPM_LIMIT) * 100),
-                
-                'tokens_day': tokens_day,
-                
-                'searches_day': searches_day,
-                'searches_day_limit': self.SEARCH_RPD_LIMIT,
-                'searches_day_percent': int((searches_day / self.SEARCH_RPD_LIMIT) * 100),
-            }
+            'tokens_day': tokens_day,
+            
+            'searches_day': searches_day,
+            'searches_day_limit': self.SEARCH_RPD_LIMIT,
+            'searches_day_percent': int((searches_day / self.SEARCH_RPD_LIMIT) * 100),
+        }
     
     def get_global_stats(self):
         """
@@ -244,67 +242,25 @@ class GeminiStats:
         Returns:
             dict: Estatísticas globais
         """
+        # ✅ Agregados de TODOS os usuários (contadores globais do limiter)
+        usage = self.limiter.usage('gemini:global', self.rules)
+        
+        requests_minute_global = usage['rpm']
+        tokens_minute_global = usage['tpm']
+        requests_today_global = usage['rpd']
+        tokens_today_global = usage['tpd']
+        searches_today_global = usage['search_rpd']
+        
         with self.lock:
-            now = datetime.now()
-        
-            # ✅ NOVO: Calcula estatísticas agregadas de TODOS os usuários
-        
-            # Limpa dados antigos primeiro
-            cutoff_minute = now - timedelta(minutes=1)
-            cutoff_day = now - timedelta(days=1)
-        
-            # Conta requisições no último minuto (TODOS os usuários)
-            requests_minute_global = 0
-            tokens_minute_global = 0
-        
-            for user_id in self.requests_minute:
-                # Limpa dados antigos
-                self.requests_minute[user_id] = [
-                    (ts, tokens) for ts, tokens in self.requests_minute[user_id]
-                    if ts > cutoff_minute
-                ]
-                # Soma
-                requests_minute_global += len(self.requests_minute[user_id])
-                tokens_minute_global += sum(tokens for _, tokens in self.requests_minute[user_id])
-        
-            # Conta requisições hoje (TODOS os usuários)
-            requests_today_global = 0
-            tokens_today_global = 0
-        
-            for user_id in self.requests_day:
-                # Limpa dados antigos
-                self.requests_day[user_id] = [
-                    (ts, tokens) for ts, tokens in self.requests_day[user_id]
-                    if ts > cutoff_day
-                ]
-                # Soma
-                requests_today_global += len(self.requests_day[user_id])
-                tokens_today_global += sum(tokens for _, tokens in self.requests_day[user_id])
-        
-            # Conta buscas hoje (TODOS os usuários)
-            searches_today_global = 0
-        
-            for user_id in self.searches_day:
-                # Limpa dados antigos
-                self.searches_day[user_id] = [
-                    ts for ts in self.searches_day[user_id] if ts > cutoff_day
-                ]
-                # Soma
-                searches_today_global += len(self.searches_day[user_id])
-        
-            # Calcula totais das últimas 24h do histórico
-            cutoff_24h = now - timedelta(hours=24)
-        
-            recent_history = [
-                h for h in self.history
-                if datetime.fromisoformat(h['timestamp']) > cutoff_24h
-            ]
-        
-            requests_24h = len(recent_history)
-            tokens_24h = sum(h['total_tokens'] for h in recent_history)
+            # Totais das últimas 24h (O(buckets) na série por minuto)
+            rollup = self.timeseries.rollup(minutes=1440)
+        
+            requests_24h = rollup['requests']
+            tokens_24h = rollup['tokens_input'] + rollup['tokens_output']
+            tokens_cached_24h = rollup['tokens_cached']
         
             # Usuários únicos
-            unique_users = len(set(h['user_id'] for h in recent_history if h['user_id']))
+            unique_users = rollup['unique_users']
         
             # Média de tokens por request
             avg_tokens = int(tokens_24h / requests_24h) if requests_24h > 0 else 0
@@ -321,16 +277,82 @@ class GeminiStats:
                 'total_requests': self.total_requests,
                 'total_tokens_input': self.total_tokens_input,
                 'total_tokens_output': self.total_tokens_output,
+                'total_tokens_cached': self.total_tokens_cached,
                 'total_searches': self.total_searches,
             
                 'requests_24h': requests_24h,
                 'tokens_24h': tokens_24h,
+                'tokens_cached_24h': tokens_cached_24h,
                 'unique_users_24h': unique_users,
                 'avg_tokens_per_request': avg_tokens,
             
-                'history': recent_history[-50:]  # Últimas 50 requisições
+                'history': list(self.history)  # Últimas 50 requisições
             }
     
+    def record_structured(self, operation, success, attempts, parse_failures, tokens):
+        """
+        Registra uma geração com saída estruturada (JSON validado)
+        
+        Args:
+            operation: Nome da operação (ex: 'GERAR_IDEIAS')
+            success: Se terminou com JSON válido
+            attempts: Chamadas feitas (1 + reparos)
+            parse_failures: Respostas que não passaram na validação
+            tokens: Tokens (entrada + saída) de todas as tentativas
+        """
+        with self.lock:
+            stats = self.structured.setdefault(operation, {
+                'requests': 0,
+                'successes': 0,
+                'failures': 0,
+                'attempts': 0,
+                'parse_failures': 0,
+                'tokens': 0,
+                'tokens_success': 0
+            })
+            
+            stats['requests'] += 1
+            stats['attempts'] += attempts
+            stats['parse_failures'] += parse_failures
+            stats['tokens'] += tokens
+            
+            if success:
+                stats['successes'] += 1
+                stats['tokens_success'] += tokens
+            else:
+                stats['failures'] += 1
+    
+    def get_structured_stats(self):
+        """
+        Taxa de falha de parse e tokens por resultado válido, por operação
+        
+        Returns:
+            dict: {operação: métricas}
+        """
+        with self.lock:
+            return {
+                operation: dict(
+                    stats,
+                    parse_failure_rate=round(stats['parse_failures'] / stats['attempts'], 3) if stats['attempts'] else 0.0,
+                    # Inclui os tokens gastos em falhas: custo real de cada resultado útil
+                    tokens_per_success=int(stats['tokens'] / stats['successes']) if stats['successes'] else None
+                )
+                for operation, stats in self.structured.items()
+            }
+    
+    def get_timeline(self, minutes=1440):
+        """
+        Uso por minuto (buckets não vazios)
+        
+        Args:
+            minutes: Janela em minutos (máx. 24h)
+        
+        Returns:
+            list: Pontos em ordem cronológica
+        """
+        with self.lock:
+            return self.timeseries.series(minutes=minutes)
+    
     def get_limits_info(self):
         """
         Retorna informações sobre os limites do FREE tier
@@ -363,14 +385,31 @@ class GeminiStats:
         Returns:
             str: JSON com todas as estatísticas
         """
-        with self.lock:
-            data = {
-                'timestamp': datetime.now().isoformat(),
-                'global': self.get_global_stats(),
-                'limits': self.get_limits_info()
-            }
-            
-            return json.dumps(data, indent=2)
+        # ✅ Sem segurar self.lock: get_global_stats/get_timeline já o adquirem
+        data = {
+            'timestamp': datetime.now().isoformat(),
+            'global': self.get_global_stats(),
+            'timeline': self.get_timeline(),
+            'structured': self.get_structured_stats(),
+            'limits': self.get_limits_info()
+        }
+        
+        if self.ledger:
+            data['ledger'] = self.get_ledger_summary()
+        
+        return json.dumps(data, indent=2)
+    
+    def get_ledger_summary(self, since_seconds=86400):
+        """
+        Totais agregados de todos os workers (lidos do ledger)
+        
+        Returns:
+            dict: Resumo do ledger ou None se desativado
+        """
+        if not self.ledger:
+            return None
+        
+        return self.ledger.summary(since_seconds)
     
     def get_stats(self):
         """
@@ -392,7 +431,9 @@ class GeminiStats:
         """
         all_stats = {}
         
-        for user_id in set(list(self.requests_minute.keys()) + list(self.requests_day.keys())):
+        for key in self.limiter.keys('gemini:user:'):
+            user_id = key.rsplit(':', 1)[1]
+            user_id = int(user_id) if user_id.isdigit() else user_id
             all_stats[user_id] = self.get_user_stats(user_id)
         
         return all_stats
@@ -404,14 +445,8 @@ class GeminiStats:
         Args:
             user_id: ID do usuário
         """
-        with self.lock:
-            if user_id in self.requests_minute:
-                del self.requests_minute[user_id]
-            if user_id in self.requests_day:
-                del self.requests_day[user_id]
-            if user_id in self.searches_day:
-                del self.searches_day[user_id]
+        self.limiter.reset(self._key(user_id))
 
 
 # Instância global
-gemini_stats = GeminiStats()
\ No newline at end of file
+gemini_stats = GeminiStats()
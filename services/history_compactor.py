@@ -0,0 +1,238 @@
+"""
+Janela do histórico do chat limitada por tokens
+
+As mensagens entram da mais nova para a mais antiga até o orçamento
+(HISTORY_TOKEN_BUDGET). O que fica de fora é incorporado, em background,
+a um resumo acumulado gravado em chats.resumo_historico; o resumo vai no
+início do histórico. Assim a entrada de cada turno fica limitada, não
+importa o tamanho da conversa
+"""
+
+import threading
+from config import Config
+from services.token_estimator import token_estimator
+from utils.advanced_logger import logger
+
+
+SUMMARY_HEADER = "=== RESUMO DA CONVERSA ANTERIOR ==="
+
+
+class HistoryCompactor:
+    """
+    Monta o histórico enviado ao Gemini
+
+    - build_history: resumo + mensagens mais recentes que cabem no orçamento
+    - mensagens que saíram da janela (e ainda não estão no resumo) são
+      resumidas quando acumulam HISTORY_SUMMARY_MIN_MESSAGES, uma vez por chat
+    """
+
+    def __init__(self, dao, summarizer, token_budget=8000, max_messages=60, min_fold=6):
+        self.dao = dao
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.min_fold = min_fold
+
+        self._lock = threading.Lock()
+        self._folding = set()  # chat_ids com resumo em andamento
+
+        # Métricas
+        self.folds = 0
+        self.folded_messages = 0
+        self.truncated = 0
+
+    def build_history(self, chat_id, user_id=None, tipo_usuario='participante'):
+        """
+        Histórico do chat dentro do orçamento de tokens
+
+        Args:
+            chat_id: ID do chat
+            user_id: Dono do chat (uso do resumo é contabilizado para ele)
+            tipo_usuario: Peso na fila do Gemini
+
+        Returns:
+            list: [{'role', 'parts': [texto]}] em ordem cronológica
+        """
+        resumo = self.dao.obter_resumo_chat(chat_id)
+        mensagens = self.dao.obter_ultimas_n_mensagens(
+            chat_id, n=self.max_messages + 1, apos_id=resumo['ate_mensagem_id']
+        )
+
+        # Busca cheia: há mensagens fora do resumo anteriores às buscadas,
+        # que precisam ser resumidas junto (senão sairiam do contexto sem resumo)
+        anteriores_ate = None
+        if len(mensagens) > self.max_messages:
+            mensagens = mensagens[-self.max_messages:]
+            anteriores_ate = mensagens[0]['id']
+
+        history = []
+        budget = self.token_budget
+
+        if resumo['resumo']:
+            summary_text = f"{SUMMARY_HEADER}\n{resumo['resumo']}"
+            history.append({'role': 'user', 'parts': [summary_text]})
+            budget -= token_estimator.count(summary_text)
+
+        window = self._pack(mensagens, max(budget, 0))
+        dropped = mensagens[:len(mensagens) - len(window)]
+
+        if anteriores_ate is not None or len(dropped) >= self.min_fold:
+            self._schedule_fold(chat_id, resumo, dropped, anteriores_ate, user_id, tipo_usuario)
+
+        history.extend({'role': msg['role'], 'parts': [msg['conteudo']]} for msg in window)
+
+        logger.debug(
+            f"🧾 Histórico do chat {chat_id}: {len(window)} mensagens na janela, "
+            f"{len(dropped)} fora dela, resumo={'sim' if resumo['resumo'] else 'não'}"
+        )
+
+        return history
+
+    def _pack(self, mensagens, budget):
+        """
+        Escolhe as mensagens mais recentes que cabem no orçamento
+
+        Args:
+            mensagens: Mensagens em ordem cronológica
+            budget: Tokens disponíveis
+
+        Returns:
+            list: Mensagens da janela (ordem cronológica)
+        """
+        window = []
+        used = 0
+
+        for msg in reversed(mensagens):
+            tokens = token_estimator.count(msg.get('conteudo'))
+
+            if used + tokens > budget:
+                if not window and budget > 0:
+                    # Nem a mais recente cabe: entra cortada
+                    max_chars = int(budget * token_estimator.chars_per_token)
+                    window.append(dict(msg, conteudo=msg['conteudo'][:max_chars] + "\n[...]"))
+                    self.truncated += 1
+                break
+
+            window.append(msg)
+            used += tokens
+
+        window.reverse()
+        return window
+
+    def _schedule_fold(self, chat_id, resumo, dropped, anteriores_ate, user_id, tipo_usuario):
+        """Resume em background as mensagens que saíram da janela (uma vez por chat)"""
+        with self._lock:
+            if chat_id in self._folding:
+                return
+            self._folding.add(chat_id)
+
+        threading.Thread(
+            target=self._fold,
+            args=(chat_id, resumo, dropped, anteriores_ate, user_id, tipo_usuario),
+            name=f'history-fold-{chat_id}',
+            daemon=True
+        ).start()
+
+    def _fold(self, chat_id, resumo, dropped, anteriores_ate, user_id, tipo_usuario):
+        """
+        Incorpora ao resumo, em ordem, as mensagens anteriores à janela
+
+        Args:
+            resumo: {'resumo', 'ate_mensagem_id'} lido no build_history
+            dropped: Mensagens buscadas que não couberam no orçamento
+            anteriores_ate: Se informado, também resume (em páginas de
+                max_messages) as mensagens entre o resumo e este ID
+        """
+        try:
+            texto = resumo['resumo']
+            ate_id = resumo['ate_mensagem_id']
+
+            while anteriores_ate is not None:
+                pagina = self.dao.listar_mensagens_entre(
+                    chat_id, ate_id, anteriores_ate, limit=self.max_messages
+                )
+                if not pagina:
+                    break
+
+                texto = self._fold_batch(chat_id, texto, pagina, user_id, tipo_usuario)
+                if texto is None:
+                    return
+                ate_id = pagina[-1]['id']
+
+                if len(pagina) < self.max_messages:
+                    break
+
+            if dropped:
+                self._fold_batch(chat_id, texto, dropped, user_id, tipo_usuario)
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao resumir histórico do chat {chat_id}: {e}")
+        finally:
+            with self._lock:
+                self._folding.discard(chat_id)
+
+    def _fold_batch(self, chat_id, resumo_anterior, mensagens, user_id, tipo_usuario):
+        """
+        Resume um lote de mensagens e grava o resumo
+
+        Returns:
+            str: Novo resumo (None se falhou - o lote fica para a próxima vez)
+        """
+        resumo = self.summarizer(resumo_anterior, mensagens, user_id=user_id,
+                                 tipo_usuario=tipo_usuario)
+        if not resumo:
+            return None
+
+        if not self.dao.atualizar_resumo_chat(chat_id, resumo, mensagens[-1]['id']):
+            return None
+
+        with self._lock:
+            self.folds += 1
+            self.folded_messages += len(mensagens)
+        logger.info(f"🧾 Resumo do chat {chat_id} atualizado (+{len(mensagens)} mensagens)")
+
+        return resumo
+
+    def get_stats(self):
+        """
+        Métricas do compactador
+
+        Returns:
+            dict: Orçamento, resumos feitos e mensagens cortadas
+        """
+        with self._lock:
+            return {
+                'token_budget': self.token_budget,
+                'folds': self.folds,
+                'folded_messages': self.folded_messages,
+                'folding_now': len(self._folding),
+                'truncated': self.truncated
+            }
+
+
+# Instância global (criada sob demanda)
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def get_history_compactor():
+    """Retorna o compactador global (DAO e GeminiService do processo)"""
+    global _compactor
+
+    if _compactor is not None:
+        return _compactor
+
+    with _compactor_lock:
+        if _compactor is None:
+            from dao.dao import get_dao
+            from services.gemini_service import get_gemini_service
+
+            _compactor = HistoryCompactor(
+                get_dao(),
+                get_gemini_service().resumir_historico,
+                token_budget=Config.HISTORY_TOKEN_BUDGET,
+                max_messages=Config.HISTORY_MAX_MESSAGES,
+                min_fold=Config.HISTORY_SUMMARY_MIN_MESSAGES
+            )
+
+        return _compactor
@@ -0,0 +1,391 @@
+"""
+Fila de jobs em background para operações longas de IA
+
+Geração de ideias (corpus completo) e análise de arquivos (upload e
+processamento no Gemini) levam de segundos a minutos. As rotas criam um
+job e respondem na hora com o id; um pool pequeno de threads executa os
+jobs e o navegador consulta /jobs/<id> até o resultado ficar pronto.
+
+Os registros ficam em SQLite (modo WAL): qualquer worker do servidor
+responde pelo status de qualquer job, e jobs interrompidos por um
+reinício aparecem como erro em vez de ficarem "rodando" para sempre
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from utils.advanced_logger import logger
+
+
+# Estados de um job
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+CANCELED = 'canceled'
+
+FINISHED = (DONE, ERROR, CANCELED)
+
+JOB_FIELDS = ('id', 'kind', 'user_id', 'pid', 'status', 'progress', 'result', 'error',
+              'cancel_requested', 'created_at', 'started_at', 'finished_at')
+
+
+class JobCancelled(Exception):
+    """Levantada dentro de um job quando o usuário cancela"""
+
+
+class JobContext:
+    """
+    Passado para a função do job
+
+    - check(): levanta JobCancelled se o cancelamento foi pedido
+    - progress(msg): texto exibido enquanto o job roda
+    """
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self._event = threading.Event()
+        self._next_db_check = 0.0
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+
+        # Cancelamento pedido em outro worker: consulta o banco (no máx. 1x/s)
+        now = time.monotonic()
+        if now >= self._next_db_check:
+            self._next_db_check = now + 1.0
+            if self.queue._cancel_requested(self.job_id):
+                self._event.set()
+
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled(self.job_id)
+
+    def progress(self, message):
+        self.queue._update(self.job_id, progress=message)
+
+
+class JobQueue:
+    """
+    Pool de threads + registros persistentes
+
+    - submit(kind, user_id, func, ...) -> job_id; func(ctx, ...) retorna um
+      dict serializável em JSON (resultado exibido pelo front-end)
+    - cancel(job_id): jobs na fila são descartados; os que já rodam param
+      no próximo ctx.check()
+    """
+
+    def __init__(self, path, workers=4, retention_hours=24):
+        self.path = path
+        self.retention_seconds = retention_hours * 3600
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._running = {}    # {job_id: JobContext} (deste processo)
+        self._futures = {}    # {job_id: Future}
+
+        # Métricas
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.canceled = 0
+
+        self._conn_lock = threading.Lock()
+
+        # Identifica esta execução: o PID sozinho se repete entre reinícios
+        # (containers costumam dar o mesmo PID ao processo principal)
+        self.instance_id = uuid.uuid4().hex
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                user_id INTEGER,
+                pid INTEGER NOT NULL,
+                instance TEXT,
+                status TEXT NOT NULL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'instance' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN instance TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)")
+
+        self._recover_orphans()
+
+    # ============ API PÚBLICA ============
+
+    def submit(self, kind, user_id, func, *args, **kwargs):
+        """
+        Cria um job e agenda a execução
+
+        Args:
+            kind: Tipo do job (ex: 'gerar_ideias', 'analisar_arquivo')
+            user_id: Dono do job (só ele consulta/cancela)
+            func: Função func(ctx, *args, **kwargs) -> dict
+            *args, **kwargs: Argumentos da função
+
+        Returns:
+            str: ID do job
+        """
+        job_id = uuid.uuid4().hex
+
+        with self._conn_lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, user_id, pid, instance, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, user_id, os.getpid(), self.instance_id, QUEUED, time.time())
+            )
+
+        ctx = JobContext(self, job_id)
+
+        with self._lock:
+            self._running[job_id] = ctx
+            self._futures[job_id] = self._executor.submit(self._run, ctx, func, args, kwargs)
+            self.submitted += 1
+
+        logger.info(f"🧵 Job {kind} criado: {job_id} (User {user_id})")
+        return job_id
+
+    def get(self, job_id):
+        """
+        Estado de um job
+
+        Args:
+            job_id: ID do job
+
+        Returns:
+            dict: Registro do job (result já decodificado) ou None
+        """
+        with self._conn_lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        job = dict(zip(JOB_FIELDS, row))
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        job['finished'] = job['status'] in FINISHED
+        del job['pid']
+        return job
+
+    def cancel(self, job_id):
+        """
+        Pede o cancelamento de um job
+
+        Args:
+            job_id: ID do job
+
+        Returns:
+            bool: True se o job ainda não tinha terminado
+        """
+        with self._conn_lock:
+            updated = self._conn.execute(
+                f"UPDATE jobs SET cancel_requested = 1 WHERE id = ? "
+                f"AND status NOT IN ({', '.join('?' * len(FINISHED))})",
+                (job_id, *FINISHED)
+            ).rowcount
+
+        if not updated:
+            return False
+
+        with self._lock:
+            ctx = self._running.get(job_id)
+            future = self._futures.get(job_id)
+
+        if ctx:
+            ctx._event.set()
+
+        # Ainda na fila do pool: nem chega a rodar
+        if future and future.cancel():
+            self._finish(job_id, CANCELED, error='Cancelado pelo usuário')
+
+        logger.info(f"🛑 Cancelamento pedido: job {job_id}")
+        return True
+
+    def get_stats(self):
+        """
+        Métricas da fila
+
+        Returns:
+            dict: Workers, jobs ativos e totais deste processo
+        """
+        with self._conn_lock:
+            by_status = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE created_at >= ? GROUP BY status",
+                (time.time() - self.retention_seconds,)
+            ).fetchall())
+
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'active_here': len(self._running),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'canceled': self.canceled,
+                'by_status': by_status
+            }
+
+    def shutdown(self):
+        """Cancela o que está na fila e espera os jobs em execução"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # ============ EXECUÇÃO ============
+
+    def _run(self, ctx, func, args, kwargs):
+        job_id = ctx.job_id
+
+        try:
+            if ctx.cancelled:
+                raise JobCancelled(job_id)
+
+            self._update(job_id, status=RUNNING, started_at=time.time())
+            result = func(ctx, *args, **kwargs)
+            self._finish(job_id, DONE, result=result)
+
+        except JobCancelled:
+            self._finish(job_id, CANCELED, error='Cancelado pelo usuário')
+
+        except Exception as e:
+            import traceback
+            logger.error(f"❌ Job {job_id} falhou: {e}\n{traceback.format_exc()}")
+            self._finish(job_id, ERROR, error=str(e))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            if self._running.pop(job_id, None) is None:
+                return  # Já finalizado (cancelado enquanto estava na fila)
+            self._futures.pop(job_id, None)
+
+            if status == DONE:
+                self.completed += 1
+            elif status == CANCELED:
+                self.canceled += 1
+            else:
+                self.failed += 1
+
+        self._update(
+            job_id,
+            status=status,
+            result=json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+            error=error,
+            finished_at=time.time()
+        )
+
+        logger.info(f"🧵 Job {job_id} finalizado: {status}")
+
+    # ============ BANCO ============
+
+    def _update(self, job_id, **fields):
+        columns = ', '.join(f"{name} = ?" for name in fields)
+
+        try:
+            with self._conn_lock:
+                self._conn.execute(
+                    f"UPDATE jobs SET {columns} WHERE id = ?",
+                    (*fields.values(), job_id)
+                )
+        except Exception as e:
+            logger.error(f"❌ Erro ao atualizar job {job_id}: {e}")
+
+    def _cancel_requested(self, job_id):
+        with self._conn_lock:
+            row = self._conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def _recover_orphans(self):
+        """
+        Marca como erro jobs de processos que já não existem e apaga os antigos
+
+        Jobs com o PID deste processo mas de outra instância são de uma
+        execução anterior que reaproveitou o PID (reinício do container)
+        """
+        with self._conn_lock:
+            rows = self._conn.execute(
+                "SELECT id, pid, instance FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+
+            orphans = [
+                job_id for job_id, pid, instance in rows
+                if (instance != self.instance_id if pid == os.getpid() else not _pid_alive(pid))
+            ]
+            for job_id in orphans:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                    (ERROR, 'Interrompido: o servidor foi reiniciado', time.time(), job_id)
+                )
+
+            self._conn.execute(
+                "DELETE FROM jobs WHERE created_at < ?",
+                (time.time() - self.retention_seconds,)
+            )
+
+        if orphans:
+            logger.warning(f"⚠️ {len(orphans)} jobs interrompidos por reinício marcados como erro")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+# Instância global (criada sob demanda)
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Retorna a fila de jobs global (JOB_WORKERS threads, registros em JOB_DB_PATH)"""
+    global _job_queue
+
+    if _job_queue is not None:
+        return _job_queue
+
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(
+                Config.JOB_DB_PATH,
+                workers=Config.JOB_WORKERS,
+                retention_hours=Config.JOB_RETENTION_HOURS
+            )
+            atexit.register(_job_queue.shutdown)
+            logger.info(f"✅ Fila de jobs: {Config.JOB_WORKERS} workers ({Config.JOB_DB_PATH})")
+
+        return _job_queue
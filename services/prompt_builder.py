@@ -0,0 +1,118 @@
+"""
+Montagem das requisições ao Gemini com prefixo estável
+
+Ordem (do mais estável ao mais volátil):
+    1. system_instruction (vai em GenerateContentConfig)
+    2. corpus da Bragantec (quando usado inline)
+    3. histórico do chat (Contents com role)
+    4. partes voláteis (apelido, trechos BM25, projetos) + mensagem atual
+
+Assim requisições seguidas compartilham o mesmo prefixo e o cache
+implícito do Gemini pode ser aproveitado
+"""
+
+from google.genai import types
+
+
+# Papéis aceitos pelo Gemini
+ROLE_MAP = {
+    'user': 'user',
+    'model': 'model',
+    'assistant': 'model'
+}
+
+
+class PromptBuilder:
+    """
+    Monta a lista de contents de uma requisição
+
+    O corpus é convertido em Content uma única vez, garantindo que o
+    prefixo seja idêntico byte a byte entre requisições
+    """
+
+    def __init__(self, corpus=""):
+        self.corpus = corpus or ""
+        self._corpus_content = None
+
+        if self.corpus:
+            self._corpus_content = types.Content(
+                role='user',
+                parts=[types.Part(text=self.corpus)]
+            )
+
+    @property
+    def corpus_content(self):
+        """Content do corpus (mesmo objeto em todas as requisições)"""
+        return self._corpus_content
+
+    @staticmethod
+    def history_to_contents(history):
+        """
+        Converte histórico do banco em Contents com role
+
+        Args:
+            history: Lista de {'role', 'parts': [texto]}
+
+        Returns:
+            list: Lista de types.Content
+        """
+        contents = []
+
+        for msg in history or []:
+            role = ROLE_MAP.get(msg.get('role'), 'user')
+            texts = [p for p in msg.get('parts', []) if p]
+
+            if not texts:
+                continue
+
+            contents.append(types.Content(
+                role=role,
+                parts=[types.Part(text=text) for text in texts]
+            ))
+
+        return contents
+
+    @staticmethod
+    def volatile_message(message, volatile_parts=None):
+        """
+        Monta o texto final do usuário (partes voláteis + mensagem)
+
+        Args:
+            message: Mensagem do usuário
+            volatile_parts: Blocos que mudam a cada requisição
+
+        Returns:
+            str: Texto da última mensagem
+        """
+        blocks = [part for part in (volatile_parts or []) if part]
+        blocks.append(f"=== MENSAGEM DO USUÁRIO ===\n{message}")
+        return "\n\n".join(block.strip('\n') for block in blocks)
+
+    def build(self, message, history=None, volatile_parts=None, incluir_corpus=False,
+              extra_parts=None):
+        """
+        Monta os contents da requisição
+
+        Args:
+            message: Mensagem do usuário
+            history: Histórico do chat
+            volatile_parts: Blocos voláteis (vão junto da mensagem, no fim)
+            incluir_corpus: Se True, envia o corpus inline no início
+            extra_parts: Parts adicionais da última mensagem (ex: arquivo enviado)
+
+        Returns:
+            list: Lista de types.Content
+        """
+        contents = []
+
+        if incluir_corpus and self._corpus_content is not None:
+            contents.append(self._corpus_content)
+
+        contents.extend(self.history_to_contents(history))
+
+        parts = [types.Part(text=self.volatile_message(message, volatile_parts))]
+        parts.extend(extra_parts or [])
+
+        contents.append(types.Content(role='user', parts=parts))
+
+        return contents
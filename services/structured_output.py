@@ -0,0 +1,124 @@
+"""
+Esquemas de saída estruturada (response_schema) das gerações de projeto
+
+O Gemini recebe o esquema em GenerateContentConfig e devolve JSON já no
+formato; mesmo assim a resposta é validada aqui antes de chegar ao
+front-end (campos obrigatórios e textos não vazios)
+"""
+
+from google.genai import types
+
+
+# Categorias da Bragantec (ordem exibida no front-end)
+CATEGORIAS = [
+    "Ciências da Natureza e Exatas",
+    "Informática",
+    "Ciências Humanas e Linguagens",
+    "Engenharias"
+]
+
+# Campos de uma ideia (obrigatórios primeiro)
+CAMPOS_IDEIA = {
+    'titulo': "Título atrativo, direto e científico (máx 80 caracteres)",
+    'resumo': "Resumo executivo de 200-250 palavras",
+    'palavras_chave': "Exatamente 3 palavras-chave separadas por vírgula",
+    'inspiracao_vencedores': "2-3 características de projetos vencedores que inspiraram a ideia",
+    'diferenciais_competitivos': "Por que seria bem avaliado pelos jurados (máx 150 palavras)",
+    'viabilidade_tecnica': "Dificuldade e recursos necessários (máx 100 palavras)"
+}
+CAMPOS_IDEIA_OBRIGATORIOS = ['titulo', 'resumo', 'palavras_chave']
+
+# Campo do formulário -> chave no JSON do autocompletar
+CAMPOS_AUTOCOMPLETAR = {
+    'resumo': ('resumo', "Resumo do projeto (200-250 palavras)"),
+    'introducao': ('introducao', "Introdução com tema, relevância e fundamentação (250-400 palavras)"),
+    'objetivos': ('objetivo_geral', "Objetivo geral com verbo no infinitivo (1-2 frases)"),
+    'objetivo_geral': ('objetivo_geral', "Objetivo geral com verbo no infinitivo (1-2 frases)"),
+    'metodologia': ('metodologia', "Materiais, métodos e procedimentos (300-500 palavras)"),
+    'resultados_esperados': ('resultados_esperados', "Resultados e impacto esperados (200-300 palavras)")
+}
+
+
+def _texto(descricao):
+    return types.Schema(type=types.Type.STRING, description=descricao)
+
+
+def _objeto(campos, obrigatorios):
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties=campos,
+        required=obrigatorios,
+        property_ordering=list(campos)
+    )
+
+
+IDEIA_SCHEMA = _objeto(
+    {campo: _texto(descricao) for campo, descricao in CAMPOS_IDEIA.items()},
+    list(CAMPOS_IDEIA)
+)
+
+IDEIAS_SCHEMA = _objeto({categoria: IDEIA_SCHEMA for categoria in CATEGORIAS}, CATEGORIAS)
+
+
+def schema_autocompletar(campos):
+    """
+    Esquema do autocompletar só com os campos pedidos
+
+    Args:
+        campos: Campos do formulário (ex: ['introducao', 'objetivos'])
+
+    Returns:
+        (types.Schema, list): Esquema e chaves esperadas no JSON
+
+    Raises:
+        ValueError: Nenhum campo conhecido
+    """
+    chaves = {}
+    for campo in campos:
+        if campo in CAMPOS_AUTOCOMPLETAR:
+            chave, descricao = CAMPOS_AUTOCOMPLETAR[campo]
+            chaves[chave] = _texto(descricao)
+
+    if not chaves:
+        raise ValueError(f"Campos não suportados: {', '.join(campos)}")
+
+    return _objeto(chaves, list(chaves)), list(chaves)
+
+
+def _exigir_textos(objeto, chaves, onde):
+    if not isinstance(objeto, dict):
+        raise ValueError(f"{onde}: esperado objeto JSON")
+
+    for chave in chaves:
+        valor = objeto.get(chave)
+        if not isinstance(valor, str) or not valor.strip():
+            raise ValueError(f"{onde}: campo '{chave}' ausente ou vazio")
+
+
+def validar_ideias(data):
+    """
+    Valida as 4 ideias (uma por categoria)
+
+    Raises:
+        ValueError: Categoria ou campo obrigatório ausente
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Esperado objeto JSON com as categorias")
+
+    for categoria in CATEGORIAS:
+        if categoria not in data:
+            raise ValueError(f"Categoria '{categoria}' não encontrada")
+        _exigir_textos(data[categoria], CAMPOS_IDEIA_OBRIGATORIOS, categoria)
+
+
+def validador_autocompletar(chaves):
+    """
+    Validador do autocompletar para as chaves pedidas
+
+    Returns:
+        function: validar(data) que levanta ValueError
+    """
+    def validar(data):
+        _exigir_textos(data, chaves, "Autocompletar")
+
+    return validar
@@ -0,0 +1,325 @@
+"""
+Estimativa local de tokens de entrada (sem chamar a API)
+
+A razão caracteres/token é calibrada com o usage_metadata das respostas
+reais. Partes fixas e grandes (corpus da Bragantec, variantes da
+instrução de sistema) têm a contagem guardada por chave e, quando
+conhecida, usam a contagem exata (count_tokens ou tokens do cache)
+
+A contagem exibida no chat (/chat/count-tokens) também é local: a razão
+é calibrada por idioma e a API só é chamada em amostras periódicas
+"""
+
+import hashlib
+import math
+import re
+import threading
+from collections import namedtuple, OrderedDict
+from config import Config
+from utils.advanced_logger import logger
+
+
+# Estimativa de uma requisição
+# - tokens: total previsto
+# - fixed_tokens: parte vinda de contagens guardadas (corpus, instrução, cache)
+# - variable_chars: caracteres estimados pela razão calibrada
+# - calibravel: False se há partes sem texto (arquivos) - não serve para calibrar
+Estimate = namedtuple('Estimate', ['tokens', 'fixed_tokens', 'variable_chars', 'calibravel'])
+
+
+# Tokens de arquivos anexados (aproximação; imagens custam 258 tokens no Gemini)
+FILE_TOKENS = {
+    'image': 258,
+    'default': 1_000
+}
+
+
+# Razão inicial caracteres/token por idioma (ajustada pelas amostras)
+LANGUAGE_RATIOS = {
+    'pt': 3.6,
+    'en': 4.2,
+    'code': 3.0,
+    'other': 3.8
+}
+
+# Palavras frequentes usadas para detectar o idioma
+_PT_WORDS = frozenset('de que não para uma com os das dos como mais mas foi ao pelo pela também você é está são'.split())
+_EN_WORDS = frozenset('the and of to is that for with are this was it be on as have not you'.split())
+_WORD_RE = re.compile(r'[a-zà-ÿ]+')
+_CODE_CHARS = frozenset('{}();=<>[]')
+
+# Amostra usada na detecção (textos longos não precisam ser lidos inteiros)
+_DETECT_CHARS = 2_000
+
+
+def detect_language(text):
+    """
+    Detecta o idioma de forma aproximada ('pt', 'en', 'code' ou 'other')
+
+    Args:
+        text: Texto
+
+    Returns:
+        str: Idioma
+    """
+    sample = text[:_DETECT_CHARS]
+
+    symbols = sum(1 for char in sample if char in _CODE_CHARS)
+    if symbols * 25 > len(sample):
+        return 'code'
+
+    pt = en = 0
+    for word in _WORD_RE.findall(sample.lower()):
+        if word in _PT_WORDS:
+            pt += 1
+        elif word in _EN_WORDS:
+            en += 1
+
+    if pt == en:
+        return 'other'
+    return 'pt' if pt > en else 'en'
+
+
+class TokenEstimator:
+    """
+    Estimador de tokens calibrado
+
+    - chars_per_token começa em 4 e segue uma média móvel das respostas
+    - contagens fixas: {chave: {'tokens', 'exact'}}
+    """
+
+    def __init__(self, chars_per_token=4.0, smoothing=0.2, min_ratio=1.5, max_ratio=8.0,
+                 cache_size=2048, sample_every=50):
+        self.chars_per_token = chars_per_token
+        self.smoothing = smoothing
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+
+        self._lock = threading.Lock()
+        self._fixed = {}
+
+        # Métricas de calibração
+        self.samples = 0
+        self.last_error_percent = None
+
+        # Contagem local do chat: razão por idioma + LRU {hash: (idioma, chars)}
+        self.language_ratios = dict(LANGUAGE_RATIOS)
+        self.language_samples = {language: 0 for language in LANGUAGE_RATIOS}
+        self.cache_size = cache_size
+        self.sample_every = sample_every
+        self._text_cache = OrderedDict()
+        self._text_lock = threading.Lock()
+        self._counts = 0
+        self._cache_hits = 0
+        self._sampling = False
+
+    # ============ CONTAGEM ============
+
+    def count(self, text):
+        """
+        Estima tokens de um texto
+
+        Args:
+            text: Texto
+
+        Returns:
+            int: Tokens estimados
+        """
+        if not text:
+            return 0
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def fixed(self, key, text):
+        """
+        Tokens de uma parte fixa (calculado uma vez por chave)
+
+        Args:
+            key: Chave estável (ex: 'corpus', ('system', 'participante', True))
+            text: Texto da parte (usado só se a chave ainda não existe)
+
+        Returns:
+            int: Tokens (exatos se set_exact já foi chamado)
+        """
+        entry = self._fixed.get(key)
+        if entry is None:
+            entry = {'tokens': self.count(text), 'exact': False, 'chars': len(text or '')}
+            with self._lock:
+                self._fixed.setdefault(key, entry)
+        elif not entry['exact']:
+            # Estimativa acompanha a calibração
+            entry['tokens'] = math.ceil(entry['chars'] / self.chars_per_token)
+        return entry['tokens']
+
+    def set_exact(self, key, tokens):
+        """
+        Registra contagem exata de uma parte fixa
+
+        Args:
+            key: Chave usada em fixed()
+            tokens: Contagem exata (count_tokens / usage_metadata do cache)
+        """
+        with self._lock:
+            entry = self._fixed.get(key, {'chars': 0})
+            self._fixed[key] = {'tokens': int(tokens), 'exact': True, 'chars': entry['chars']}
+
+    def estimate(self, texts, fixed_tokens=0, files=None):
+        """
+        Estima os tokens de entrada de uma requisição
+
+        Args:
+            texts: Textos variáveis (histórico, mensagem, trechos)
+            fixed_tokens: Tokens das partes fixas (via fixed())
+            files: MIME types de arquivos anexados
+
+        Returns:
+            Estimate
+        """
+        variable_chars = sum(len(text) for text in texts if text)
+        tokens = fixed_tokens + math.ceil(variable_chars / self.chars_per_token)
+
+        for mime in files or []:
+            kind = (mime or '').split('/')[0]
+            tokens += FILE_TOKENS.get(kind, FILE_TOKENS['default'])
+
+        return Estimate(tokens, fixed_tokens, variable_chars, not files)
+
+    def count_text(self, text):
+        """
+        Contagem local para o contador do chat (sem chamar a API)
+
+        Args:
+            text: Texto digitado
+
+        Returns:
+            (int, str, bool): (tokens, idioma, deve_amostrar) - deve_amostrar
+            indica que esta contagem deve ser conferida com a API
+        """
+        if not text:
+            return 0, 'other', False
+
+        key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+        with self._text_lock:
+            self._counts += 1
+            cached = self._text_cache.get(key)
+            if cached is not None:
+                self._text_cache.move_to_end(key)
+                self._cache_hits += 1
+
+        if cached is None:
+            cached = (detect_language(text), len(text))
+            with self._text_lock:
+                self._text_cache[key] = cached
+                while len(self._text_cache) > self.cache_size:
+                    self._text_cache.popitem(last=False)
+
+        language, chars = cached
+        tokens = max(1, math.ceil(chars / self.language_ratios[language]))
+
+        with self._text_lock:
+            sample = (
+                self.sample_every > 0
+                and not self._sampling
+                and chars >= 200
+                and self._counts % self.sample_every == 0
+            )
+            if sample:
+                self._sampling = True
+
+        return tokens, language, sample
+
+    # ============ CALIBRAÇÃO ============
+
+    def observe(self, estimate, actual_tokens):
+        """
+        Ajusta chars_per_token com o prompt_token_count real
+
+        Args:
+            estimate: Estimate usado na admissão
+            actual_tokens: usage_metadata.prompt_token_count
+        """
+        if not estimate or not actual_tokens:
+            return
+
+        self.last_error_percent = round((estimate.tokens - actual_tokens) * 100 / actual_tokens, 1)
+
+        variable_tokens = actual_tokens - estimate.fixed_tokens
+        if not estimate.calibravel or estimate.variable_chars < 200 or variable_tokens <= 0:
+            return
+
+        observed = estimate.variable_chars / variable_tokens
+        if not self.min_ratio <= observed <= self.max_ratio:
+            logger.debug(f"📏 Amostra de calibração descartada ({observed:.2f} chars/token)")
+            return
+
+        with self._lock:
+            self.chars_per_token += self.smoothing * (observed - self.chars_per_token)
+            self.samples += 1
+
+        logger.debug(
+            f"📏 Calibração: {self.chars_per_token:.2f} chars/token "
+            f"(erro da estimativa: {self.last_error_percent}%)"
+        )
+
+    def observe_language(self, text, actual_tokens):
+        """
+        Ajusta a razão do idioma do texto com uma contagem exata da API
+
+        Args:
+            text: Texto amostrado em count_text
+            actual_tokens: total_tokens de count_tokens (None se a chamada falhou)
+        """
+        try:
+            if not text or not actual_tokens:
+                return
+
+            language = detect_language(text)
+            observed = len(text) / actual_tokens
+            if not self.min_ratio <= observed <= self.max_ratio:
+                return
+
+            with self._lock:
+                ratio = self.language_ratios[language]
+                self.language_ratios[language] = ratio + self.smoothing * (observed - ratio)
+                self.language_samples[language] += 1
+
+            logger.debug(f"📏 Calibração ({language}): {self.language_ratios[language]:.2f} chars/token")
+        finally:
+            self._sampling = False
+
+    def get_stats(self):
+        """
+        Estado da calibração
+
+        Returns:
+            dict: Razão atual, amostras, erro e contagens fixas
+        """
+        with self._lock:
+            return {
+                'chars_per_token': round(self.chars_per_token, 3),
+                'samples': self.samples,
+                'last_error_percent': self.last_error_percent,
+                'languages': {
+                    language: {
+                        'chars_per_token': round(ratio, 3),
+                        'samples': self.language_samples[language]
+                    }
+                    for language, ratio in self.language_ratios.items()
+                },
+                'text_cache': {
+                    'size': len(self._text_cache),
+                    'counts': self._counts,
+                    'hits': self._cache_hits
+                },
+                'fixed': {
+                    str(key): {'tokens': entry['tokens'], 'exact': entry['exact']}
+                    for key, entry in self._fixed.items()
+                }
+            }
+
+
+# Instância global
+token_estimator = TokenEstimator(
+    cache_size=Config.TOKEN_COUNT_CACHE_SIZE,
+    sample_every=Config.TOKEN_COUNT_SAMPLE_EVERY
+)
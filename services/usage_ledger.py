@@ -0,0 +1,331 @@
+"""
+Ledger durável de uso do Gemini (SQLite em modo WAL)
+
+Todos os workers gravam os eventos de uso (requisições, buscas, envios no
+chat) no mesmo arquivo, em lotes feitos por uma thread em background.
+Na inicialização cada worker recarrega as janelas de minuto/dia; depois,
+a cada flush, importa os eventos gravados pelos outros processos
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+from utils.advanced_logger import logger
+
+
+# Colunas de um evento (mesma ordem da tabela)
+EVENT_FIELDS = ('ts', 'pid', 'kind', 'user_id', 'tokens_input', 'tokens_output', 'tokens_cached')
+
+
+class UsageLedger:
+    """
+    Registro append-only de eventos de uso
+
+    - record() só enfileira (não bloqueia a requisição)
+    - flush() grava o lote em uma transação e entrega aos listeners os
+      eventos novos de outros processos
+    """
+
+    def __init__(self, path, flush_interval_seconds=2, batch_size=200, retention_days=2):
+        self.path = path
+        self.flush_interval_seconds = flush_interval_seconds
+        self.batch_size = batch_size
+        self.retention_seconds = retention_days * 86400
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._flusher = None
+
+        self._listeners = []
+        self._last_seen_id = 0
+        self._flushes = 0
+
+        # Conexão usada por mais de uma thread (flusher e leituras do admin)
+        self._conn_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS usage_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                pid INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                user_id INTEGER,
+                tokens_input INTEGER NOT NULL DEFAULT 0,
+                tokens_output INTEGER NOT NULL DEFAULT 0,
+                tokens_cached INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_events_ts ON usage_events (ts)")
+
+    # ============ ESCRITA ============
+
+    def record(self, kind, user_id=None, tokens_input=0, tokens_output=0, tokens_cached=0,
+               timestamp=None):
+        """
+        Enfileira um evento de uso
+
+        Args:
+            kind: 'request' (Gemini), 'search' (Google Search) ou 'chat' (envio no chat)
+            user_id: ID do usuário (ou None)
+            tokens_input/tokens_output/tokens_cached: Tokens do evento
+            timestamp: Epoch em segundos (padrão: agora)
+        """
+        event = (timestamp or time.time(), os.getpid(), kind, user_id,
+                 int(tokens_input or 0), int(tokens_output or 0), int(tokens_cached or 0))
+
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.batch_size
+
+        self._ensure_flusher()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Grava eventos pendentes e importa os de outros processos
+
+        Returns:
+            int: Número de eventos gravados
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+
+            try:
+                with self._conn_lock:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        if batch:
+                            self._conn.executemany(
+                                f"INSERT INTO usage_events ({', '.join(EVENT_FIELDS)}) "
+                                f"VALUES ({', '.join('?' * len(EVENT_FIELDS))})",
+                                batch
+                            )
+
+                        self._flushes += 1
+                        if self._flushes % 100 == 0:
+                            self._conn.execute(
+                                "DELETE FROM usage_events WHERE ts < ?",
+                                (time.time() - self.retention_seconds,)
+                            )
+
+                        self._conn.execute("COMMIT")
+                    except Exception:
+                        self._conn.execute("ROLLBACK")
+                        raise
+
+            except Exception as e:
+                # Devolve o lote para a próxima tentativa
+                with self._lock:
+                    self._buffer[:0] = batch
+                logger.error(f"❌ Erro ao gravar ledger de uso ({len(batch)} eventos): {e}")
+                return 0
+
+            self._import_remote()
+            return len(batch)
+
+    def _import_remote(self):
+        """Entrega aos listeners os eventos novos gravados por outros processos"""
+        with self._conn_lock:
+            rows = self._conn.execute(
+                f"SELECT id, {', '.join(EVENT_FIELDS)} FROM usage_events WHERE id > ? ORDER BY id",
+                (self._last_seen_id,)
+            ).fetchall()
+
+        if not rows:
+            return
+
+        self._last_seen_id = rows[-1][0]
+
+        pid = os.getpid()
+        events = [dict(zip(EVENT_FIELDS, row[1:])) for row in rows if row[2] != pid]
+
+        if events:
+            self._notify(events)
+
+    def _notify(self, events):
+        for listener in list(self._listeners):
+            try:
+                listener(events)
+            except Exception as e:
+                logger.error(f"❌ Erro ao aplicar eventos do ledger: {e}")
+
+    # ============ LEITURA ============
+
+    def subscribe(self, listener, since_seconds=86400):
+        """
+        Reidrata um consumidor e passa a enviar eventos de outros processos
+
+        Args:
+            listener: Função que recebe uma lista de eventos (dicts)
+            since_seconds: Janela recarregada agora (padrão: 24h)
+        """
+        with self._conn_lock:
+            rows = self._conn.execute(
+                f"SELECT id, {', '.join(EVENT_FIELDS)} FROM usage_events WHERE ts >= ? ORDER BY id",
+                (time.time() - since_seconds,)
+            ).fetchall()
+
+            if not self._last_seen_id:
+                max_id = self._conn.execute("SELECT MAX(id) FROM usage_events").fetchone()[0]
+                self._last_seen_id = max_id or 0
+
+        # Só o que já estava no arquivo até aqui (o resto chega pelo flush)
+        events = [dict(zip(EVENT_FIELDS, row[1:])) for row in rows if row[0] <= self._last_seen_id]
+        if events:
+            listener(events)
+
+        self._listeners.append(listener)
+        return len(events)
+
+    def summary(self, since_seconds=86400):
+        """
+        Totais agregados de todos os workers
+
+        Args:
+            since_seconds: Janela (padrão: 24h)
+
+        Returns:
+            dict: Totais por tipo de evento e por usuário
+        """
+        self.flush()
+        since = time.time() - since_seconds
+
+        with self._conn_lock:
+            totals = self._conn.execute("""
+                SELECT kind, COUNT(*), SUM(tokens_input), SUM(tokens_output), SUM(tokens_cached)
+                FROM usage_events WHERE ts >= ? GROUP BY kind
+            """, (since,)).fetchall()
+
+            users = self._conn.execute("""
+                SELECT user_id, COUNT(*), SUM(tokens_input), SUM(tokens_output), SUM(tokens_cached)
+                FROM usage_events WHERE ts >= ? AND kind = 'request' AND user_id IS NOT NULL
+                GROUP BY user_id
+            """, (since,)).fetchall()
+
+            searches = dict(self._conn.execute("""
+                SELECT user_id, COUNT(*) FROM usage_events
+                WHERE ts >= ? AND kind = 'search' AND user_id IS NOT NULL GROUP BY user_id
+            """, (since,)).fetchall())
+
+        return {
+            'since_seconds': since_seconds,
+            'totals': {
+                kind: {
+                    'events': count,
+                    'tokens_input': tin or 0,
+                    'tokens_output': tout or 0,
+                    'tokens_cached': tcached or 0
+                }
+                for kind, count, tin, tout, tcached in totals
+            },
+            'users': {
+                user_id: {
+                    'requests': count,
+                    'tokens_input': tin or 0,
+                    'tokens_output': tout or 0,
+                    'tokens_cached': tcached or 0,
+                    'searches': searches.get(user_id, 0)
+                }
+                for user_id, count, tin, tout, tcached in users
+            }
+        }
+
+    def timeline(self, since_seconds=86400):
+        """
+        Requisições e tokens por minuto (todos os workers)
+
+        Returns:
+            list: [{'minute', 'requests', 'tokens', 'searches'}]
+        """
+        self.flush()
+
+        with self._conn_lock:
+            rows = self._conn.execute("""
+                SELECT CAST(ts / 60 AS INTEGER) AS minute,
+                       SUM(kind = 'request'),
+                       SUM(CASE WHEN kind = 'request' THEN tokens_input + tokens_output ELSE 0 END),
+                       SUM(kind = 'search')
+                FROM usage_events WHERE ts >= ?
+                GROUP BY minute ORDER BY minute
+            """, (time.time() - since_seconds,)).fetchall()
+
+        return [
+            {'minute': minute * 60, 'requests': requests, 'tokens': tokens, 'searches': searches}
+            for minute, requests, tokens, searches in rows
+        ]
+
+    # ============ BACKGROUND ============
+
+    def _ensure_flusher(self):
+        if self._flusher and self._flusher.is_alive():
+            return
+
+        with self._lock:
+            if self._flusher and self._flusher.is_alive():
+                return
+
+            self._flusher = threading.Thread(
+                target=self._flush_loop,
+                name='usage-ledger-flusher',
+                daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_interval_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def shutdown(self):
+        """Grava o que ainda está pendente e para a thread"""
+        self._stop_event.set()
+        self._wake.set()
+        self.flush()
+
+
+# Instância global (criada sob demanda)
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger():
+    """
+    Retorna o ledger global (ou None se USAGE_LEDGER_ENABLED=false ou o
+    arquivo não puder ser aberto)
+    """
+    global _ledger
+
+    if _ledger is not None or not Config.USAGE_LEDGER_ENABLED:
+        return _ledger
+
+    with _ledger_lock:
+        if _ledger is not None:
+            return _ledger
+
+        try:
+            _ledger = UsageLedger(
+                Config.USAGE_LEDGER_PATH,
+                flush_interval_seconds=Config.USAGE_LEDGER_FLUSH_SECONDS
+            )
+            atexit.register(_ledger.shutdown)
+            logger.info(f"✅ Ledger de uso: {Config.USAGE_LEDGER_PATH}")
+        except Exception as e:
+            logger.error(f"❌ Erro ao abrir ledger de uso: {e}")
+
+        return _ledger
@@ -0,0 +1,114 @@
+"""
+Série temporal de uso do Gemini em anel (um bucket por minuto)
+
+Tamanho fixo (24h = 1440 buckets em arrays): registrar custa O(1) e os
+totais das últimas N horas saem em O(buckets), sem parsear timestamps
+"""
+
+import time
+from array import array
+from datetime import datetime
+
+
+class MinuteRingBuffer:
+    """
+    Buffer circular de contadores por minuto
+
+    Cada slot guarda o minuto a que pertence; um slot com minuto antigo
+    é zerado ao ser reutilizado
+    """
+
+    FIELDS = ('requests', 'tokens_input', 'tokens_output', 'tokens_cached', 'searches')
+
+    def __init__(self, minutes=1440):
+        self.size = minutes
+
+        self.minutes = array('q', [-1] * minutes)
+        self.counters = {field: array('q', [0] * minutes) for field in self.FIELDS}
+
+        # Usuários distintos por minuto (conjuntos pequenos, só ids)
+        self.users = [None] * minutes
+
+    def _slot(self, minute):
+        slot = minute % self.size
+
+        if self.minutes[slot] != minute:
+            self.minutes[slot] = minute
+            for values in self.counters.values():
+                values[slot] = 0
+            self.users[slot] = None
+
+        return slot
+
+    def record(self, user_id=None, timestamp=None, **values):
+        """
+        Soma valores no bucket do minuto
+
+        Args:
+            user_id: ID do usuário (conta em usuários únicos)
+            timestamp: Epoch em segundos (padrão: agora)
+            **values: Campos de FIELDS (ex: requests=1, tokens_input=120)
+        """
+        slot = self._slot(int((timestamp or time.time()) // 60))
+
+        for field, value in values.items():
+            if value:
+                self.counters[field][slot] += int(value)
+
+        if user_id:
+            if self.users[slot] is None:
+                self.users[slot] = set()
+            self.users[slot].add(user_id)
+
+    def rollup(self, minutes=None, now=None):
+        """
+        Totais dos últimos N minutos
+
+        Args:
+            minutes: Tamanho da janela (padrão: o buffer inteiro)
+            now: Epoch em segundos (padrão: agora)
+
+        Returns:
+            dict: Totais de FIELDS + 'unique_users'
+        """
+        current = int((now or time.time()) // 60)
+        window = min(minutes or self.size, self.size)
+
+        totals = dict.fromkeys(self.FIELDS, 0)
+        users = set()
+
+        for slot in range(self.size):
+            if 0 <= current - self.minutes[slot] < window:
+                for field in self.FIELDS:
+                    totals[field] += self.counters[field][slot]
+                if self.users[slot]:
+                    users |= self.users[slot]
+
+        totals['unique_users'] = len(users)
+        return totals
+
+    def series(self, minutes=None, now=None):
+        """
+        Buckets não vazios dos últimos N minutos em ordem cronológica
+
+        Returns:
+            list: [{'timestamp', 'requests', 'tokens_input', ...}]
+        """
+        current = int((now or time.time()) // 60)
+        window = min(minutes or self.size, self.size)
+
+        points = []
+        for minute in range(current - window + 1, current + 1):
+            slot = minute % self.size
+            if self.minutes[slot] != minute:
+                continue
+
+            point = {field: self.counters[field][slot] for field in self.FIELDS}
+            if not any(point.values()):
+                continue
+
+            point['timestamp'] = datetime.fromtimestamp(minute * 60).isoformat()
+            point['unique_users'] = len(self.users[slot] or ())
+            points.append(point)
+
+        return points
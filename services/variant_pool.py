@@ -0,0 +1,366 @@
+"""
+Pool de variantes com TTL para gerações que não dependem do usuário
+
+O prompt de "gerar ideias" é o mesmo para todos: em vez de uma chamada de
+~200k tokens por clique, o resultado fica em um pool de N variantes
+(diferentes entre si) por hash do prompt. Pedidos simultâneos sem
+variante pronta esperam a mesma chamada (single-flight) e uma thread em
+background repõe o pool antes das variantes expirarem, enquanto houver
+procura.
+
+As variantes ficam em SQLite (modo WAL), compartilhadas entre os workers
+e preservadas em reinícios; o single-flight vale dentro de cada processo
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+from utils.advanced_logger import logger
+
+
+def prompt_key(*parts):
+    """
+    Chave estável de um prompt (sha256 das partes)
+
+    Args:
+        *parts: Textos que definem o resultado (prompt, versão do esquema...)
+
+    Returns:
+        str: Hash hexadecimal
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _Flight:
+    """Geração em andamento de uma chave (quem chega depois espera por ela)"""
+
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class VariantPool:
+    """
+    Cache de resultados com várias variantes por chave
+
+    - get(key): variante válida menos servida (ou None)
+    - get_or_generate(key, generator): get ou gera (uma geração por chave
+      por vez; os demais esperam o mesmo resultado)
+    - register(key, generator): habilita a reposição em background
+    generator(existentes) recebe as variantes atuais (para diversificar) e
+    retorna um dict serializável em JSON
+    """
+
+    def __init__(self, path, size=4, ttl_seconds=21600, refresh_interval_seconds=600,
+                 wait_timeout_seconds=300):
+        self.path = path
+        self.size = size
+        self.ttl_seconds = ttl_seconds
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.wait_timeout_seconds = wait_timeout_seconds
+
+        self._lock = threading.Lock()
+        self._inflight = {}      # {key: _Flight}
+        self._generators = {}    # {key: generator} (reposição em background)
+        self._last_requested = {}
+        self._refresher = None
+        self._stop_event = threading.Event()
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.generated = 0
+        self.refreshed = 0
+
+        self._conn_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS variants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chave TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                served INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_variants_chave ON variants (chave, created_at)")
+
+    # ============ LEITURA ============
+
+    def get(self, key):
+        """
+        Variante válida menos servida (rodízio entre usuários)
+
+        Args:
+            key: Chave (prompt_key)
+
+        Returns:
+            dict: {'data', 'created_at', 'age_seconds'} ou None
+        """
+        self._touch(key)
+
+        with self._conn_lock:
+            row = self._conn.execute("""
+                SELECT id, data, created_at FROM variants
+                WHERE chave = ? AND created_at >= ?
+                ORDER BY served, created_at DESC LIMIT 1
+            """, (key, time.time() - self.ttl_seconds)).fetchone()
+
+            if row:
+                self._conn.execute("UPDATE variants SET served = served + 1 WHERE id = ?", (row[0],))
+
+        if not row:
+            return None
+
+        with self._lock:
+            self.hits += 1
+
+        return {
+            'data': json.loads(row[1]),
+            'created_at': row[2],
+            'age_seconds': int(time.time() - row[2])
+        }
+
+    def variants(self, key):
+        """Dados das variantes válidas de uma chave (mais novas primeiro)"""
+        with self._conn_lock:
+            rows = self._conn.execute(
+                "SELECT data FROM variants WHERE chave = ? AND created_at >= ? ORDER BY created_at DESC",
+                (key, time.time() - self.ttl_seconds)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # ============ GERAÇÃO ============
+
+    def get_or_generate(self, key, generator, cancelled=None):
+        """
+        Variante pronta ou gerada agora (single-flight por chave)
+
+        Args:
+            key: Chave (prompt_key)
+            generator: generator(existentes) -> dict
+            cancelled: Função que retorna True se quem espera desistiu
+
+        Returns:
+            (dict, str): (variante como em get(), origem 'hit'|'coalesced'|'miss')
+        """
+        variant = self.get(key)
+        if variant:
+            return variant, 'hit'
+
+        flight, leader = self._join_flight(key)
+
+        if not leader:
+            with self._lock:
+                self.coalesced += 1
+
+            deadline = time.monotonic() + self.wait_timeout_seconds
+            while not flight.event.wait(1.0):
+                if (cancelled and cancelled()) or time.monotonic() > deadline:
+                    with self._lock:
+                        flight.waiters -= 1
+                    raise TimeoutError("Geração compartilhada não terminou a tempo")
+
+            if flight.error:
+                raise flight.error
+            return flight.result, 'coalesced'
+
+        with self._lock:
+            self.misses += 1
+
+        return self._generate(key, generator, flight), 'miss'
+
+    def register(self, key, generator):
+        """
+        Habilita a reposição do pool em background para a chave
+
+        Args:
+            key: Chave (prompt_key)
+            generator: generator(existentes) -> dict (sem usuário: uso global)
+        """
+        with self._lock:
+            self._generators[key] = generator
+        self._ensure_refresher()
+
+    def _join_flight(self, key):
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight:
+                flight.waiters += 1
+                return flight, False
+
+            flight = _Flight()
+            self._inflight[key] = flight
+            return flight, True
+
+    def _generate(self, key, generator, flight):
+        """Gera uma variante (chamar como líder do flight)"""
+        try:
+            data = generator(self.variants(key))
+            created_at = time.time()
+
+            with self._conn_lock:
+                self._conn.execute(
+                    "INSERT INTO variants (chave, data, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(data, ensure_ascii=False, default=str), created_at)
+                )
+
+            flight.result = {'data': data, 'created_at': created_at, 'age_seconds': 0}
+
+            with self._lock:
+                self.generated += 1
+
+            logger.info(f"🧺 Nova variante no pool {key[:12]}")
+            return flight.result
+
+        except BaseException as e:
+            flight.error = e
+            raise
+
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    # ============ REPOSIÇÃO EM BACKGROUND ============
+
+    def _touch(self, key):
+        with self._lock:
+            self._last_requested[key] = time.time()
+
+    def _ensure_refresher(self):
+        with self._lock:
+            if self._refresher and self._refresher.is_alive():
+                return
+
+            self._refresher = threading.Thread(
+                target=self._refresh_loop,
+                name='variant-pool-refresher',
+                daemon=True
+            )
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval_seconds):
+            with self._lock:
+                generators = list(self._generators.items())
+
+            for key, generator in generators:
+                try:
+                    self._refresh(key, generator)
+                except Exception as e:
+                    logger.warning(f"⚠️ Reposição do pool {key[:12]} falhou: {e}")
+
+    def _refresh(self, key, generator):
+        """Gera no máximo uma variante por rodada, se a chave ainda tem procura"""
+        now = time.time()
+
+        with self._lock:
+            last_requested = self._last_requested.get(key, 0)
+
+        # Sem procura em um TTL inteiro: deixa expirar (não gasta cota à toa)
+        if now - last_requested > self.ttl_seconds:
+            return
+
+        with self._conn_lock:
+            self._conn.execute(
+                "DELETE FROM variants WHERE chave = ? AND created_at < ?",
+                (key, now - self.ttl_seconds)
+            )
+            count, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM variants WHERE chave = ?", (key,)
+            ).fetchone()
+
+        # Pool cheio e nada perto de expirar: nada a fazer
+        if count >= self.size and oldest and now - oldest < self.ttl_seconds / 2:
+            return
+
+        flight, leader = self._join_flight(key)
+        if not leader:
+            with self._lock:
+                flight.waiters -= 1
+            return
+
+        self._generate(key, generator, flight)
+
+        # Pool acima do tamanho: descarta a mais antiga
+        with self._conn_lock:
+            self._conn.execute("""
+                DELETE FROM variants WHERE id IN (
+                    SELECT id FROM variants WHERE chave = ?
+                    ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (key, self.size))
+
+        with self._lock:
+            self.refreshed += 1
+
+    def get_stats(self):
+        """
+        Métricas do pool
+
+        Returns:
+            dict: Acertos, gerações e variantes válidas por chave
+        """
+        with self._conn_lock:
+            pools = dict(self._conn.execute(
+                "SELECT chave, COUNT(*) FROM variants WHERE created_at >= ? GROUP BY chave",
+                (time.time() - self.ttl_seconds,)
+            ).fetchall())
+
+        with self._lock:
+            return {
+                'size': self.size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'generated': self.generated,
+                'refreshed': self.refreshed,
+                'in_flight': len(self._inflight),
+                'pools': {key[:12]: count for key, count in pools.items()}
+            }
+
+
+# Instância global (criada sob demanda)
+_variant_pool = None
+_variant_pool_lock = threading.Lock()
+
+
+def get_variant_pool():
+    """Retorna o pool global (IDEIAS_POOL_SIZE variantes, TTL IDEIAS_CACHE_TTL_SECONDS)"""
+    global _variant_pool
+
+    if _variant_pool is not None:
+        return _variant_pool
+
+    with _variant_pool_lock:
+        if _variant_pool is None:
+            _variant_pool = VariantPool(
+                Config.IDEIAS_CACHE_PATH,
+                size=Config.IDEIAS_POOL_SIZE,
+                ttl_seconds=Config.IDEIAS_CACHE_TTL_SECONDS,
+                refresh_interval_seconds=Config.IDEIAS_REFRESH_INTERVAL_SECONDS
+            )
+
+        return _variant_pool
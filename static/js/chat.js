@@ -152,8 +152,11 @@ async function handleSendMessage(e) {
     // Mostra indicador de pensamento
     showThinking(true);
     
+    let streamingMessage = null;
+    
     try {
-        const response = await fetch('/chat/send', {
+        // ✅ Streaming (SSE): mostra pensamento/texto conforme o Gemini gera
+        const response = await fetch('/chat/send-stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -167,65 +170,214 @@ async function handleSendMessage(e) {
             })
         });
         
-        // Verifica se a resposta foi OK
-        if (!response.ok) {
-            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-        }
-        
-        const data = await response.json();
-        
-        showThinking(false);
+        const contentType = response.headers.get('Content-Type') || '';
         
-        if (data.error) {
-            showError(data.message || 'Erro ao processar mensagem');
+        // Erros antes do stream (rate limit, IA offline) vêm como JSON
+        if (!contentType.includes('text/event-stream')) {
+            const data = await response.json().catch(() => null);
+            showThinking(false);
+            showError((data && data.message) || `HTTP ${response.status}: ${response.statusText}`);
             return;
         }
         
-        if (data.success) {
-            // Log de tokens (se disponível)
-            if (data.tokens_input || data.tokens_output) {
-                window.lastTokenUsage = {
-                    input: data.tokens_input,
-                    output: data.tokens_output
-                };
+        let finished = false;
+        
+        await readEventStream(response, (event, data) => {
+            if (event === 'start') {
+                if (data.chat_id && !currentChatId) {
+                    currentChatId = data.chat_id;
+                    addChatToSidebar(data.chat_id, message);
+                }
+                return;
             }
             
-            // Alerta se consumo muito alto
-            if (data.tokens_input && data.tokens_input > 100000) {
+            if (event === 'queued') {
+                // Fila global do Gemini cheia: a mensagem espera a vez
                 APBIA.showNotification(
-                    `⚠️ Alto consumo de tokens: ${data.tokens_input.toLocaleString('pt-BR')} tokens de entrada!\n` +
-                    `Dica: Desative o Modo Bragantec se não precisar do histórico completo.`,
-                    'warning'
+                    `⏳ Muitas mensagens agora. Sua mensagem está na fila (~${data.wait_seconds}s)`,
+                    'info'
                 );
+                return;
             }
             
-            // Adiciona resposta da IA
-            addMessageToChat(
-                'assistant', 
-                data.response, 
-                data.thinking_process,
-                data.search_used,
-                data.code_results
-            );
+            if (event === 'reattaching') {
+                // Upload do arquivo expirou no Gemini: reenviado antes da resposta
+                APBIA.showNotification(`📎 Reanexando ${data.arquivo}...`, 'info');
+                return;
+            }
+            
+            if (event === 'error') {
+                finished = true;
+                showThinking(false);
+                if (streamingMessage) streamingMessage.remove();
+                showError(data.message || 'Erro ao processar mensagem');
+                return;
+            }
             
-            // Só mostra aviso se for REALMENTE uma nova conversa
-            if (data.chat_id && !currentChatId) {
-                currentChatId = data.chat_id;
-                addChatToSidebar(data.chat_id, message);
-            } else if (data.chat_id) {
-                // Atualiza ID se mudou
-                currentChatId = data.chat_id;
+            if (event === 'done') {
+                finished = true;
+                showThinking(false);
+                if (streamingMessage) streamingMessage.remove();
+                handleChatResponse(data, message);
+                return;
             }
+            
+            // thought / text / code / code_result
+            showThinking(false);
+            if (!streamingMessage) {
+                streamingMessage = createStreamingMessage();
+            }
+            streamingMessage.append(event, data);
+        });
+        
+        if (!finished) {
+            throw new Error('Stream encerrado antes do fim');
         }
         
     } catch (error) {
         showThinking(false);
+        if (streamingMessage) streamingMessage.remove();
         // Mensagem de erro mais clara
         console.error('❌ Erro na requisição:', error);
         showError('Erro ao enviar mensagem. Verifique sua conexão e tente novamente.');
     }
 }
 
+/**
+ * Lê uma resposta text/event-stream e chama onEvent(evento, dados) para cada evento
+ */
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let dataLines = [];
+            
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            
+            if (dataLines.length > 0) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
+/**
+ * Cria a mensagem temporária da IA que é preenchida durante o stream
+ * (substituída pela mensagem completa no evento 'done')
+ */
+function createStreamingMessage() {
+    const messagesContainer = document.getElementById('chatMessages');
+    
+    const welcome = document.getElementById('welcomeMessage');
+    if (welcome) {
+        welcome.remove();
+    }
+    
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message assistant fade-in';
+    
+    const thinkingDiv = document.createElement('div');
+    thinkingDiv.className = 'alert alert-info border mb-2 small';
+    thinkingDiv.style.display = 'none';
+    thinkingDiv.style.whiteSpace = 'pre-wrap';
+    messageDiv.appendChild(thinkingDiv);
+    
+    const contentDiv = document.createElement('div');
+    contentDiv.className = 'message-content';
+    messageDiv.appendChild(contentDiv);
+    
+    messagesContainer.appendChild(messageDiv);
+    
+    let thinkingText = '';
+    let responseText = '';
+    
+    return {
+        append(event, data) {
+            if (event === 'thought') {
+                thinkingText += data.text;
+                thinkingDiv.style.display = 'block';
+                thinkingDiv.textContent = '💭 ' + thinkingText;
+            } else if (event === 'text') {
+                responseText += data.text;
+                contentDiv.innerHTML = formatMessageContent(responseText);
+            } else if (event === 'code') {
+                responseText += `\n\`[executando código ${data.language}]\`\n`;
+                contentDiv.innerHTML = formatMessageContent(responseText);
+            }
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        },
+        remove() {
+            messageDiv.remove();
+        }
+    };
+}
+
+/**
+ * Exibe a resposta final da IA (formato de /chat/send e do evento 'done')
+ */
+function handleChatResponse(data, message) {
+    if (data.error) {
+        showError(data.message || 'Erro ao processar mensagem');
+        return;
+    }
+    
+    if (data.success) {
+        // Log de tokens (se disponível)
+        if (data.tokens_input || data.tokens_output) {
+            window.lastTokenUsage = {
+                input: data.tokens_input,
+                output: data.tokens_output
+            };
+        }
+        
+        // Alerta se consumo muito alto
+        if (data.tokens_input && data.tokens_input > 100000) {
+            APBIA.showNotification(
+                `⚠️ Alto consumo de tokens: ${data.tokens_input.toLocaleString('pt-BR')} tokens de entrada!\n` +
+                `Dica: Desative o Modo Bragantec se não precisar do histórico completo.`,
+                'warning'
+            );
+        }
+        
+        // Adiciona resposta da IA
+        addMessageToChat(
+            'assistant', 
+            data.response, 
+            data.thinking_process,
+            data.search_used,
+            data.code_results
+        );
+        
+        // Só mostra aviso se for REALMENTE uma nova conversa
+        if (data.chat_id && !currentChatId) {
+            currentChatId = data.chat_id;
+            addChatToSidebar(data.chat_id, message);
+        } else if (data.chat_id) {
+            // Atualiza ID se mudou
+            currentChatId = data.chat_id;
+        }
+    }
+}
+
 function addChatToSidebar(chatId, firstMessage) {
     const chatHistory = document.getElementById('chatHistory');
     
@@ -741,7 +893,12 @@ async function handleFileUpload(e) {
             body: formData
         });
         
-        const data = await response.json();
+        let data = await response.json();
+        
+        // ✅ Análise roda em background: acompanha o job até terminar
+        if (data.success && data.job_id) {
+            data = await APBIA.waitForJob(data.job_id, { interval: 2000 });
+        }
         
         showThinking(false);
         
@@ -762,7 +919,7 @@ async function handleFileUpload(e) {
         
     } catch (error) {
         showThinking(false);
-        showError('Erro ao enviar arquivo');
+        showError(error.canceled ? 'Análise cancelada' : (error.message || 'Erro ao enviar arquivo'));
         console.error('Erro:', error);
     }
     
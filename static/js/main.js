@@ -281,6 +281,48 @@ function hideLoadingOverlay() {
     }
 }
 
+// ===== JOBS EM BACKGROUND =====
+
+// Consulta /jobs/<id> até o job terminar e retorna job.result
+async function waitForJob(jobId, { interval = 1500, onUpdate = null } = {}) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        const data = await response.json();
+        
+        if (!response.ok || !data.success) {
+            throw new Error(data.message || `HTTP ${response.status}`);
+        }
+        
+        const job = data.job;
+        
+        if (onUpdate) {
+            onUpdate(job);
+        }
+        
+        if (job.status === 'done') {
+            return job.result;
+        }
+        
+        if (job.status === 'canceled') {
+            const error = new Error(job.error || 'Cancelado');
+            error.canceled = true;
+            throw error;
+        }
+        
+        if (job.status === 'error') {
+            throw new Error(job.error || 'Erro no processamento');
+        }
+        
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
+// Pede o cancelamento de um job
+async function cancelJob(jobId) {
+    const response = await fetch(`/jobs/${jobId}/cancel`, { method: 'POST' });
+    return response.ok;
+}
+
 // Exporta funções globais
 window.APBIA = {
     showNotification,
@@ -290,7 +332,9 @@ window.APBIA = {
     isValidEmail,
     formatPhone,
     showLoadingOverlay,
-    hideLoadingOverlay
+    hideLoadingOverlay,
+    waitForJob,
+    cancelJob
 };
 
 // Log de boas-vindas
@@ -183,7 +183,39 @@ async function handleGerarIdeias() {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
         }
         
-        const data = await response.json();
+        const job = await response.json();
+        
+        if (!job.success) {
+            throw new Error(job.message || 'Erro ao iniciar geração');
+        }
+        
+        // ✅ Ideias já prontas no pool: exibe direto
+        if (!job.job_id) {
+            hideLoading();
+            mostrarIdeias(job.ideias, job.metadata);
+            return;
+        }
+        
+        // ✅ Geração roda em background: acompanha o job até terminar
+        const btnCancelar = document.getElementById('btnCancelarIdeias');
+        if (btnCancelar) {
+            btnCancelar.style.display = 'inline-block';
+            btnCancelar.onclick = () => {
+                btnCancelar.disabled = true;
+                APBIA.cancelJob(job.job_id);
+            };
+        }
+        
+        const data = await APBIA.waitForJob(job.job_id, {
+            interval: 2000,
+            onUpdate: (status) => {
+                if (status.status === 'queued') {
+                    showLoading('⏳ Aguardando na fila...');
+                } else if (status.status === 'running') {
+                    showLoading(status.progress || '🧠 Analisando projetos vencedores...');
+                }
+            }
+        });
         
         hideLoading();
         
@@ -197,7 +229,18 @@ async function handleGerarIdeias() {
     } catch (error) {
         console.error('❌ ERRO na requisição:', error);
         hideLoading();
-        showNotification('Erro ao conectar com IA: ' + error.message, 'error');
+        
+        if (error.canceled) {
+            showNotification('Geração de ideias cancelada', 'info');
+        } else {
+            showNotification('Erro ao gerar ideias: ' + error.message, 'error');
+        }
+    } finally {
+        const btnCancelar = document.getElementById('btnCancelarIdeias');
+        if (btnCancelar) {
+            btnCancelar.style.display = 'none';
+            btnCancelar.disabled = false;
+        }
     }
 }
 
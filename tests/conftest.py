@@ -0,0 +1,17 @@
+"""
+Configuração dos testes
+
+Os testes rodam sem Supabase/Gemini reais: as variáveis obrigatórias do
+Config recebem valores fictícios e os clientes são substituídos por fakes
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault('SUPABASE_URL', 'https://teste.supabase.co')
+os.environ.setdefault('SUPABASE_KEY', 'chave-de-teste')
+os.environ.setdefault('GEMINI_API_KEY', 'chave-de-teste')
@@ -0,0 +1,207 @@
+"""
+Testes do cache explícito do corpus (services/context_cache.py)
+
+O `client.caches` do Gemini é substituído por um fake em memória que
+registra as chamadas de create/list/update/delete
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from services.context_cache import BragantecContextCache
+
+
+MODEL = 'gemini-2.5-flash'
+INSTRUCAO = 'Você é a APBIA.'
+CORPUS = '=== bragantec 2019.txt ===\nProjetos premiados...\n'
+
+
+class FakeCaches:
+    """Imitação de client.caches (create/list/update/delete)"""
+
+    def __init__(self, ttl_seconds=3600, tokens=250_000):
+        self.ttl_seconds = ttl_seconds
+        self.tokens = tokens
+        self.remote = {}
+        self.created = []
+        self.updated = []
+        self.deleted = []
+        self.fail_create = False
+        self._counter = 0
+        self._deleted_event = threading.Event()
+
+    def _cached(self, name, display_name, ttl_seconds):
+        return SimpleNamespace(
+            name=name,
+            display_name=display_name,
+            expire_time=datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds),
+            usage_metadata=SimpleNamespace(total_token_count=self.tokens)
+        )
+
+    def create(self, model, config):
+        if self.fail_create:
+            raise RuntimeError('quota de cache excedida')
+
+        self._counter += 1
+        cached = self._cached(f'cachedContents/{self._counter}', config.display_name, self.ttl_seconds)
+        self.remote[cached.name] = cached
+        self.created.append((model, config))
+        return cached
+
+    def list(self):
+        return list(self.remote.values())
+
+    def update(self, name, config):
+        ttl_seconds = int(config.ttl.rstrip('s'))
+        cached = self._cached(name, self.remote[name].display_name, ttl_seconds)
+        self.remote[name] = cached
+        self.updated.append(name)
+        return cached
+
+    def delete(self, name):
+        self.remote.pop(name, None)
+        self.deleted.append(name)
+        self._deleted_event.set()
+
+    def wait_delete(self, timeout=5):
+        return self._deleted_event.wait(timeout)
+
+
+@pytest.fixture
+def caches():
+    return FakeCaches()
+
+
+@pytest.fixture
+def context_cache(caches):
+    cache = BragantecContextCache(SimpleNamespace(caches=caches), check_interval_seconds=3600)
+    yield cache
+    cache.shutdown()
+
+
+def test_cria_cache_com_corpus_e_instrucao(context_cache, caches):
+    name = context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS)
+
+    assert name == 'cachedContents/1'
+    assert len(caches.created) == 1
+
+    model, config = caches.created[0]
+    assert model == MODEL
+    assert config.system_instruction == INSTRUCAO
+    assert config.contents[0].parts[0].text == CORPUS
+    assert config.ttl == '3600s'
+    assert context_cache.get_info()[0]['tokens'] == caches.tokens
+
+
+def test_sem_corpus_nao_cria_cache(context_cache, caches):
+    assert context_cache.get_or_create(MODEL, INSTRUCAO, '') is None
+    assert caches.created == []
+
+
+def test_reaproveita_cache_local(context_cache, caches):
+    primeiro = context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS)
+    segundo = context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS)
+
+    assert primeiro == segundo
+    assert len(caches.created) == 1
+
+
+def test_reaproveita_cache_de_outro_worker(caches):
+    worker_a = BragantecContextCache(SimpleNamespace(caches=caches), check_interval_seconds=3600)
+    worker_b = BragantecContextCache(SimpleNamespace(caches=caches), check_interval_seconds=3600)
+
+    try:
+        name_a = worker_a.get_or_create(MODEL, INSTRUCAO, CORPUS)
+        name_b = worker_b.get_or_create(MODEL, INSTRUCAO, CORPUS)
+    finally:
+        worker_a.shutdown()
+        worker_b.shutdown()
+
+    assert name_a == name_b
+    assert len(caches.created) == 1
+
+
+def test_cache_remoto_perto_de_expirar_nao_e_reaproveitado(caches):
+    worker_a = BragantecContextCache(SimpleNamespace(caches=caches), check_interval_seconds=3600)
+    worker_b = BragantecContextCache(SimpleNamespace(caches=caches), check_interval_seconds=3600)
+
+    try:
+        # Restam 60s (menos que a margem de renovação)
+        caches.ttl_seconds = 60
+        worker_a.get_or_create(MODEL, INSTRUCAO, CORPUS)
+
+        caches.ttl_seconds = 3600
+        worker_b.get_or_create(MODEL, INSTRUCAO, CORPUS)
+    finally:
+        worker_a.shutdown()
+        worker_b.shutdown()
+
+    assert len(caches.created) == 2
+
+
+def test_invalidate_forca_nova_criacao(context_cache, caches):
+    name = context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS)
+
+    # Expirou no servidor antes do previsto
+    caches.remote.pop(name)
+    context_cache.invalidate(name)
+
+    novo = context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS)
+
+    assert novo != name
+    assert len(caches.created) == 2
+    assert [info['name'] for info in context_cache.get_info()] == [novo]
+
+
+def test_mudanca_no_corpus_cria_nova_versao_e_remove_a_antiga(context_cache, caches):
+    antigo = context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS)
+    novo = context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS + '=== bragantec 2020.txt ===\n')
+
+    assert novo != antigo
+    assert caches.wait_delete()
+    assert caches.deleted == [antigo]
+    assert [info['name'] for info in context_cache.get_info()] == [novo]
+
+
+def test_falha_na_criacao_nao_repete_ate_o_intervalo(context_cache, caches):
+    caches.fail_create = True
+
+    assert context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS) is None
+
+    caches.fail_create = False
+    assert context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS) is None
+    assert caches.created == []
+
+
+def test_renova_cache_em_uso_e_deixa_ocioso_expirar(context_cache, caches):
+    name = context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS)
+
+    # Força o cache para dentro da margem de renovação
+    with context_cache._lock:
+        entry = next(iter(context_cache._entries.values()))
+        entry['expire_at'] -= caches.ttl_seconds
+
+    context_cache.renew_expiring()
+    assert caches.updated == [name]
+    assert context_cache.get_info()[0]['expires_in_seconds'] > context_cache.renew_margin_seconds
+
+    # Sem uso há mais que o TTL: não é renovado
+    with context_cache._lock:
+        entry['expire_at'] -= caches.ttl_seconds
+        entry['last_used'] -= 2 * context_cache.ttl_seconds
+
+    context_cache.renew_expiring()
+    assert caches.updated == [name]
+    assert context_cache.get_info() == []
+
+
+def test_tokens_do_cache_para_a_estimativa(context_cache, caches):
+    name = context_cache.get_or_create(MODEL, INSTRUCAO, CORPUS)
+
+    assert context_cache.get_tokens(name) == caches.tokens
+
+    context_cache.invalidate(name)
+    assert context_cache.get_tokens(name) == 0
@@ -0,0 +1,125 @@
+"""
+Testes da janela do histórico (services/history_compactor.py)
+
+O DAO é um fake em memória; o resumidor devolve os IDs resumidos para
+conferir que nenhuma mensagem sai da janela sem entrar no resumo
+"""
+
+import threading
+
+from services.history_compactor import HistoryCompactor
+
+
+class FakeDAO:
+    """Mensagens e resumo de um chat em memória"""
+
+    def __init__(self, total_mensagens):
+        self.mensagens = [
+            {'id': i, 'role': 'user' if i % 2 else 'model', 'conteudo': f'msg {i}'}
+            for i in range(1, total_mensagens + 1)
+        ]
+        self.resumo = {'resumo': None, 'ate_mensagem_id': None}
+
+    def _fora_do_resumo(self):
+        ate_id = self.resumo['ate_mensagem_id'] or 0
+        return [m for m in self.mensagens if m['id'] > ate_id]
+
+    def obter_resumo_chat(self, chat_id):
+        return dict(self.resumo)
+
+    def obter_ultimas_n_mensagens(self, chat_id, n=10, apos_id=None):
+        return [m for m in self.mensagens if m['id'] > (apos_id or 0)][-n:]
+
+    def listar_mensagens_entre(self, chat_id, apos_id, antes_id, limit=100):
+        return [m for m in self.mensagens if (apos_id or 0) < m['id'] < antes_id][:limit]
+
+    def atualizar_resumo_chat(self, chat_id, resumo, ate_mensagem_id):
+        self.resumo = {'resumo': resumo, 'ate_mensagem_id': ate_mensagem_id}
+        return True
+
+
+class Resumidor:
+    """Resumo = IDs resumidos até agora (pode falhar sob demanda)"""
+
+    def __init__(self):
+        self.falhar = False
+        self.chamadas = 0
+
+    def __call__(self, resumo_anterior, mensagens, user_id=None, tipo_usuario=None):
+        self.chamadas += 1
+        if self.falhar:
+            return None
+        ids = (resumo_anterior.split(',') if resumo_anterior else []) + [str(m['id']) for m in mensagens]
+        return ','.join(ids)
+
+
+def _ids_no_resumo(dao):
+    return [int(i) for i in dao.resumo['resumo'].split(',')] if dao.resumo['resumo'] else []
+
+
+def _esperar_resumo():
+    for thread in threading.enumerate():
+        if thread.name.startswith('history-fold-'):
+            thread.join(timeout=5)
+
+
+def _montar(dao, resumidor, **kwargs):
+    return HistoryCompactor(dao, resumidor, token_budget=100_000, max_messages=60, min_fold=6, **kwargs)
+
+
+def test_mensagens_alem_do_limite_entram_no_resumo():
+    dao = FakeDAO(61)
+    compactor = _montar(dao, Resumidor())
+
+    history = compactor.build_history(1)
+    _esperar_resumo()
+
+    assert [h['parts'][0] for h in history] == [f'msg {i}' for i in range(2, 62)]
+    assert _ids_no_resumo(dao) == [1]
+    assert dao.resumo['ate_mensagem_id'] == 1
+
+
+def test_resumo_cobre_todas_as_mensagens_quando_o_resumo_atrasa():
+    dao = FakeDAO(61)
+    resumidor = Resumidor()
+    resumidor.falhar = True
+    compactor = _montar(dao, resumidor)
+
+    compactor.build_history(1)
+    _esperar_resumo()
+    assert dao.resumo['resumo'] is None
+
+    # Conversa continua enquanto o resumo não sai (200 mensagens fora do resumo)
+    dao.mensagens.extend(
+        {'id': i, 'role': 'user', 'conteudo': f'msg {i}'} for i in range(62, 201)
+    )
+    resumidor.falhar = False
+
+    history = compactor.build_history(1)
+    _esperar_resumo()
+
+    janela = [int(h['parts'][0].split()[1]) for h in history if not h['parts'][0].startswith('===')]
+    assert janela == list(range(141, 201))
+
+    # Tudo antes da janela foi resumido, em ordem e sem pular nenhuma mensagem
+    assert _ids_no_resumo(dao) == list(range(1, 141))
+
+    # Próximo turno: nada a resumir
+    chamadas = resumidor.chamadas
+    compactor.build_history(1)
+    _esperar_resumo()
+    assert resumidor.chamadas == chamadas
+
+
+def test_mensagens_que_nao_cabem_no_orcamento_sao_resumidas():
+    dao = FakeDAO(20)
+    for msg in dao.mensagens[:10]:
+        msg['conteudo'] = 'x' * 40_000
+
+    compactor = HistoryCompactor(dao, Resumidor(), token_budget=2000, max_messages=60, min_fold=6)
+
+    history = compactor.build_history(1)
+    _esperar_resumo()
+
+    assert [h['parts'][0] for h in history] == [f'msg {i}' for i in range(11, 21)]
+    assert _ids_no_resumo(dao) == list(range(1, 11))
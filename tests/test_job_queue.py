@@ -0,0 +1,50 @@
+"""
+Testes da recuperação de jobs órfãos (services/job_queue.py)
+"""
+
+import os
+import threading
+import time
+
+from services.job_queue import JobQueue, DONE, ERROR, RUNNING
+
+
+def _inserir_job(queue, job_id, pid, instance=None):
+    with queue._conn_lock:
+        queue._conn.execute(
+            "INSERT INTO jobs (id, kind, user_id, pid, instance, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, 'gerar_ideias', 1, pid, instance, RUNNING, time.time())
+        )
+
+
+def test_job_de_execucao_anterior_com_o_mesmo_pid_vira_erro(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+
+    anterior = JobQueue(path, workers=1)
+    _inserir_job(anterior, 'antigo', os.getpid(), anterior.instance_id)
+    anterior.shutdown()
+
+    # Reinício do container: mesmo PID, nova instância
+    queue = JobQueue(path, workers=1)
+    try:
+        job = queue.get('antigo')
+        assert job['status'] == ERROR
+        assert job['finished']
+    finally:
+        queue.shutdown()
+
+
+def test_job_desta_instancia_nao_e_recuperado(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), workers=1)
+    liberar = threading.Event()
+
+    try:
+        job_id = queue.submit('gerar_ideias', 1, lambda ctx: liberar.wait(5) and {'ok': True})
+        queue._recover_orphans()
+        assert queue.get(job_id)['status'] != ERROR
+
+        liberar.set()
+        queue._futures[job_id].result(timeout=5)
+        assert queue.get(job_id)['status'] == DONE
+    finally:
+        queue.shutdown()
@@ -0,0 +1,102 @@
+"""
+Testes da montagem de prompts (services/prompt_builder.py)
+
+O que importa para o cache implícito do Gemini é que o prefixo das
+requisições (corpus + histórico) seja idêntico byte a byte entre chamadas
+"""
+
+from services.prompt_builder import PromptBuilder
+
+
+CORPUS = '=== bragantec 2011.txt ===\nProjeto A\n\n=== bragantec 2012.txt ===\nProjeto B\n'
+
+HISTORICO = [
+    {'role': 'user', 'parts': ['Quero uma ideia de projeto']},
+    {'role': 'assistant', 'parts': ['Que tal um sensor de umidade?']},
+]
+
+
+def _serializar(contents):
+    """Bytes exatamente como vão para a API"""
+    return [content.model_dump_json(exclude_none=True).encode('utf-8') for content in contents]
+
+
+def test_prefixo_identico_entre_requisicoes():
+    builder = PromptBuilder(CORPUS)
+
+    primeira = builder.build('Primeira pergunta', HISTORICO, ['=== APELIDO ===\nAna'], incluir_corpus=True)
+    segunda = builder.build('Outra pergunta', HISTORICO, ['=== TRECHOS ===\nOutro trecho'], incluir_corpus=True)
+
+    # Tudo menos a última mensagem (volátil) é igual byte a byte
+    assert _serializar(primeira[:-1]) == _serializar(segunda[:-1])
+    assert _serializar(primeira[-1:]) != _serializar(segunda[-1:])
+
+
+def test_prefixo_se_mantem_quando_o_historico_cresce():
+    builder = PromptBuilder(CORPUS)
+
+    antes = builder.build('Pergunta 2', HISTORICO, incluir_corpus=True)
+    depois = builder.build(
+        'Pergunta 3',
+        HISTORICO + [
+            {'role': 'user', 'parts': ['Pergunta 2']},
+            {'role': 'model', 'parts': ['Resposta 2']},
+        ],
+        incluir_corpus=True
+    )
+
+    prefixo = _serializar(antes[:-1])
+    assert _serializar(depois[:len(prefixo)]) == prefixo
+
+
+def test_corpus_vem_primeiro_e_e_o_mesmo_entre_instancias():
+    primeira = PromptBuilder(CORPUS).build('Oi', HISTORICO, incluir_corpus=True)
+    segunda = PromptBuilder(CORPUS).build('Oi', HISTORICO, incluir_corpus=True)
+
+    assert primeira[0].parts[0].text == CORPUS
+    assert _serializar(primeira) == _serializar(segunda)
+
+
+def test_sem_corpus_quando_nao_solicitado():
+    contents = PromptBuilder(CORPUS).build('Oi', HISTORICO, incluir_corpus=False)
+
+    assert all(part.text != CORPUS for content in contents for part in content.parts)
+
+
+def test_historico_preserva_papeis_e_todas_as_partes():
+    historico = [
+        {'role': 'user', 'parts': ['parte 1', 'parte 2']},
+        {'role': 'assistant', 'parts': ['resposta']},
+        {'role': 'model', 'parts': ['']},
+    ]
+
+    contents = PromptBuilder.history_to_contents(historico)
+
+    assert [content.role for content in contents] == ['user', 'model']
+    assert [part.text for part in contents[0].parts] == ['parte 1', 'parte 2']
+
+
+def test_partes_volateis_ficam_na_ultima_mensagem():
+    contents = PromptBuilder(CORPUS).build('Minha dúvida', HISTORICO, ['=== PROJETOS ===\nProjeto X\n'])
+    ultima = contents[-1]
+
+    assert ultima.role == 'user'
+    assert ultima.parts[0].text == '=== PROJETOS ===\nProjeto X\n\n=== MENSAGEM DO USUÁRIO ===\nMinha dúvida'
+
+
+def test_corpus_carregado_em_ordem_de_nome(tmp_path, monkeypatch):
+    from config import Config
+    from services.gemini_service import _load_context_files
+
+    # Criados fora de ordem (a ordem do os.listdir não é garantida)
+    for nome in ['bragantec 2019.txt', 'bragantec 2011.txt', 'notas.md', 'bragantec 2015.txt']:
+        (tmp_path / nome).write_text(f'conteúdo de {nome}', encoding='utf-8')
+
+    monkeypatch.setattr(Config, 'CONTEXT_FILES_PATH', str(tmp_path))
+
+    corpus = _load_context_files()
+
+    posicoes = [corpus.index(f'=== bragantec {ano}.txt ===') for ano in (2011, 2015, 2019)]
+    assert posicoes == sorted(posicoes)
+    assert 'notas.md' not in corpus
+    assert corpus.encode('utf-8') == _load_context_files().encode('utf-8')
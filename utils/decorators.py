@@ -97,44 +97,39 @@ def check_ia_status(f):
 
 def rate_limit(max_calls=10, period=60):
     """
-    Decorator simples de rate limiting
+    Decorator simples de rate limiting (motor único de utils/limiter.py)
     
     Args:
         max_calls: Número máximo de chamadas permitidas
         period: Período em segundos
     """
-    from collections import defaultdict
-    from time import time
+    from utils.limiter import get_limiter, Rule
     
-    calls = defaultdict(list)
+    rule = Rule('calls', max_calls, period, max(1, min(12, int(period))))
     
     def decorator(f):
+        namespace = f"decorator:{f.__module__}.{f.__qualname__}"
+        
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not current_user.is_authenticated:
                 return f(*args, **kwargs)
             
-            user_id = current_user.id
-            now = time()
-            
-            # Remove chamadas antigas
-            calls[user_id] = [call_time for call_time in calls[user_id] 
-                             if now - call_time < period]
+            # Verifica e registra a chamada (atômico)
+            result = get_limiter().hit(f"{namespace}:{current_user.id}", [(rule, 1)])
             
-            # Verifica limite
-            if len(calls[user_id]) >= max_calls:
+            if not result.allowed:
                 if request.is_json:
-                    return jsonify({
+                    response = jsonify({
                         'error': True,
                         'message': 'Muitas requisições. Aguarde um momento.'
-                    }), 429
+                    })
+                    response.headers['Retry-After'] = str(int(result.retry_after) + 1)
+                    return response, 429
                 else:
                     flash('Muitas requisições. Por favor, aguarde.', 'warning')
                     return redirect(request.referrer or url_for('index'))
             
-            # Adiciona nova chamada
-            calls[user_id].append(now)
-            
             return f(*args, **kwargs)
         return decorated_function
     return decorator
\ No newline at end of file
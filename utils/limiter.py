@@ -0,0 +1,455 @@
+"""
+Motor único de rate limiting (janela deslizante com buckets)
+
+Cada regra (RPM, TPM, RPD, buscas/dia...) divide a janela em N buckets
+fixos. O uso da janela é a soma dos buckets ativos, mantida em um total
+corrente: verificar e consumir custa O(1) amortizado e a memória por chave
+é limitada a N contadores por regra.
+
+Backends:
+    - MemoryLimiterStorage: um processo (padrão)
+    - SQLiteLimiterStorage: compartilhado entre workers do WSGI (mesma máquina)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from config import Config
+from utils.advanced_logger import logger
+
+
+class Rule(namedtuple('Rule', ['name', 'limit', 'window', 'buckets'])):
+    """
+    Regra de limite
+
+    Args:
+        name: Identificador (ex: 'rpm', 'tpm', 'rpd')
+        limit: Máximo permitido na janela
+        window: Tamanho da janela em segundos
+        buckets: Em quantos buckets a janela é dividida
+    """
+
+    __slots__ = ()
+
+    @property
+    def bucket_size(self):
+        return self.window / self.buckets
+
+    def bucket_index(self, now):
+        return int(now // self.bucket_size)
+
+
+# Resultado de uma verificação
+# - allowed: se a requisição cabe em todas as regras
+# - rule: regra violada (ou None)
+# - retry_after: segundos até a regra violada liberar espaço
+# - usage: {nome_regra: uso na janela}
+LimitResult = namedtuple('LimitResult', ['allowed', 'rule', 'retry_after', 'usage'])
+
+
+# Regras padrão (FREE tier do Gemini 2.5 Flash)
+def rpm(limit):
+    return Rule('rpm', limit, 60, 12)
+
+
+def tpm(limit):
+    return Rule('tpm', limit, 60, 12)
+
+
+def rpd(limit):
+    return Rule('rpd', limit, 86400, 96)
+
+
+def search_rpd(limit):
+    return Rule('search_rpd', limit, 86400, 96)
+
+
+def _retry_after(rule, buckets_in_window, used, cost, now):
+    """
+    Tempo até buckets antigos saírem da janela e liberarem `cost`
+
+    Args:
+        buckets_in_window: Lista de (índice, contagem) em ordem crescente
+    """
+    excess = used + cost - rule.limit
+    freed = 0
+
+    for index, count in buckets_in_window:
+        freed += count
+        if freed >= excess:
+            return max(0.0, (index + rule.buckets) * rule.bucket_size - now)
+
+    return float(rule.window)
+
+
+# ============ BACKEND EM MEMÓRIA ============
+
+class MemoryLimiterStorage:
+    """
+    Contadores em memória (um processo)
+
+    - Estado por chave: {regra: [contagens (anel), último bucket, total]}
+    - Chaves ociosas (sem uso por uma janela inteira) são removidas
+    - max_keys limita a memória mesmo com muitas chaves ativas (LRU)
+    """
+
+    # Contadores visíveis só neste processo
+    shared = False
+
+    def __init__(self, max_keys=10_000, sweep_every=1_000):
+        self.max_keys = max_keys
+        self.sweep_every = sweep_every
+
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()  # {chave: {'seen': ts, 'window': s, 'rules': {...}}}
+        self._ops = 0
+
+    def _state(self, key, rule, now, create):
+        entry = self._keys.get(key)
+        if entry is None:
+            if not create:
+                return None
+            entry = {'seen': now, 'window': 0, 'rules': {}}
+            self._keys[key] = entry
+
+        state = entry['rules'].get(rule.name)
+        if state is None:
+            if not create:
+                return None
+            state = [[0] * rule.buckets, rule.bucket_index(now), 0]
+            entry['rules'][rule.name] = state
+
+        # Avança o anel até o bucket atual (zera os que saíram da janela)
+        counts, last, total = state
+        current = rule.bucket_index(now)
+        gap = current - last
+
+        if gap >= rule.buckets:
+            state[0] = [0] * rule.buckets
+            state[2] = 0
+        elif gap > 0:
+            for index in range(last + 1, current + 1):
+                slot = index % rule.buckets
+                total -= counts[slot]
+                counts[slot] = 0
+            state[2] = total
+
+        if gap > 0:
+            state[1] = current
+
+        return state
+
+    def _touch(self, key, quotas, now):
+        entry = self._keys.get(key)
+        if entry is None:
+            return
+
+        entry['seen'] = max(entry['seen'], now)
+        entry['window'] = max([entry['window']] + [rule.window for rule, _ in quotas])
+        self._keys.move_to_end(key)
+
+    def _evict(self, now):
+        """Remove chaves ociosas e aplica o teto de chaves (chamar com lock)"""
+        self._ops += 1
+
+        if self._ops % self.sweep_every == 0:
+            idle = [k for k, e in self._keys.items() if now - e['seen'] > e['window']]
+            for key in idle:
+                del self._keys[key]
+
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+
+    def apply(self, key, quotas, now, consume=True, force=False):
+        """
+        Verifica (e opcionalmente consome) todas as regras de uma vez
+
+        Args:
+            key: Chave (ex: 'gemini:user:5')
+            quotas: Lista de (Rule, custo)
+            now: Timestamp atual
+            consume: Se True, soma o custo quando todas as regras permitem
+            force: Se True, consome mesmo acima do limite (registro de uso real)
+
+        Returns:
+            LimitResult
+        """
+        with self._lock:
+            usage = {}
+            violated = None
+            retry_after = 0.0
+
+            for rule, cost in quotas:
+                state = self._state(key, rule, now, create=consume)
+                used = state[2] if state else 0
+                usage[rule.name] = used
+
+                if violated is None and not force and used + cost > rule.limit:
+                    violated = rule
+
+                    current = rule.bucket_index(now)
+                    in_window = [
+                        (index, state[0][index % rule.buckets])
+                        for index in range(current - rule.buckets + 1, current + 1)
+                    ] if state else []
+                    retry_after = _retry_after(rule, in_window, used, cost, now)
+
+            if consume and (violated is None or force):
+                for rule, cost in quotas:
+                    if not cost:
+                        continue
+                    state = self._state(key, rule, now, create=True)
+
+                    # now pode ser passado (reidratação): só entra se ainda está na janela
+                    index = rule.bucket_index(now)
+                    if state[1] - index >= rule.buckets:
+                        continue
+
+                    state[0][index % rule.buckets] += cost
+                    state[2] += cost
+                    usage[rule.name] = state[2]
+
+                self._touch(key, quotas, now)
+
+            self._evict(now)
+
+            return LimitResult(violated is None, violated, retry_after, usage)
+
+    def usage(self, key, rules, now):
+        with self._lock:
+            result = {}
+            for rule in rules:
+                state = self._state(key, rule, now, create=False)
+                result[rule.name] = state[2] if state else 0
+            return result
+
+    def reset(self, key):
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def keys(self, prefix, now):
+        with self._lock:
+            return [
+                k for k, e in self._keys.items()
+                if k.startswith(prefix) and now - e['seen'] <= e['window']
+            ]
+
+
+# ============ BACKEND SQLITE ============
+
+class SQLiteLimiterStorage:
+    """
+    Contadores em SQLite (WAL), compartilhados entre processos
+
+    Uma linha por (chave, regra, bucket). Cada verificação roda em uma
+    transação BEGIN IMMEDIATE, então workers diferentes não ultrapassam
+    o limite ao mesmo tempo
+    """
+
+    # Contadores compartilhados entre processos (e persistidos)
+    shared = True
+
+    def __init__(self, path, sweep_every=500):
+        self.path = path
+        self.sweep_every = sweep_every
+
+        self._local = threading.local()
+        self._ops = 0
+        self._ops_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS limiter_buckets (
+                chave TEXT NOT NULL,
+                regra TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                expira REAL NOT NULL,
+                PRIMARY KEY (chave, regra, bucket)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_limiter_expira ON limiter_buckets (expira)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _window_rows(conn, key, rule, now):
+        current = rule.bucket_index(now)
+        return conn.execute(
+            "SELECT bucket, total FROM limiter_buckets "
+            "WHERE chave = ? AND regra = ? AND bucket > ? ORDER BY bucket",
+            (key, rule.name, current - rule.buckets)
+        ).fetchall()
+
+    def _sweep(self, conn, now):
+        with self._ops_lock:
+            self._ops += 1
+            due = self._ops % self.sweep_every == 0
+
+        if due:
+            conn.execute("DELETE FROM limiter_buckets WHERE expira <= ?", (now,))
+
+    def apply(self, key, quotas, now, consume=True, force=False):
+        """Mesma semântica de MemoryLimiterStorage.apply"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE" if consume else "BEGIN")
+
+        try:
+            usage = {}
+            violated = None
+            retry_after = 0.0
+
+            for rule, cost in quotas:
+                rows = self._window_rows(conn, key, rule, now)
+                used = sum(total for _, total in rows)
+                usage[rule.name] = used
+
+                if violated is None and not force and used + cost > rule.limit:
+                    violated = rule
+                    retry_after = _retry_after(rule, rows, used, cost, now)
+
+            if consume and (violated is None or force):
+                for rule, cost in quotas:
+                    if not cost:
+                        continue
+                    bucket = rule.bucket_index(now)
+                    conn.execute(
+                        "INSERT INTO limiter_buckets (chave, regra, bucket, total, expira) "
+                        "VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT (chave, regra, bucket) DO UPDATE SET total = total + excluded.total",
+                        (key, rule.name, bucket, cost, (bucket + rule.buckets) * rule.bucket_size)
+                    )
+                    usage[rule.name] += cost
+
+                self._sweep(conn, now)
+
+            conn.execute("COMMIT")
+            return LimitResult(violated is None, violated, retry_after, usage)
+
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def usage(self, key, rules, now):
+        conn = self._conn()
+        return {
+            rule.name: sum(total for _, total in self._window_rows(conn, key, rule, now))
+            for rule in rules
+        }
+
+    def reset(self, key):
+        self._conn().execute("DELETE FROM limiter_buckets WHERE chave = ?", (key,))
+
+    def keys(self, prefix, now):
+        rows = self._conn().execute(
+            "SELECT DISTINCT chave FROM limiter_buckets WHERE substr(chave, 1, ?) = ? AND expira > ?",
+            (len(prefix), prefix, now)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+# ============ MOTOR ============
+
+class SlidingWindowLimiter:
+    """
+    Interface única de limites usada por RateLimiter, GeminiStats e
+    pelo decorator rate_limit
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or MemoryLimiterStorage()
+
+    def hit(self, key, quotas):
+        """
+        Verifica e consome atomicamente (só consome se todas as regras permitirem)
+
+        Args:
+            key: Chave do sujeito (ex: 'chat:user:5')
+            quotas: Lista de (Rule, custo)
+
+        Returns:
+            LimitResult
+        """
+        return self.storage.apply(key, quotas, time.time(), consume=True)
+
+    def check(self, key, quotas):
+        """Verifica sem consumir"""
+        return self.storage.apply(key, quotas, time.time(), consume=False)
+
+    def add(self, key, quotas, timestamp=None):
+        """
+        Registra uso real (consome mesmo acima do limite)
+
+        Args:
+            timestamp: Momento do uso (padrão: agora; usado na reidratação)
+        """
+        return self.storage.apply(key, quotas, timestamp or time.time(), consume=True, force=True)
+
+    @property
+    def shared(self):
+        """Se os contadores já são compartilhados entre processos"""
+        return self.storage.shared
+
+    def usage(self, key, rules):
+        """
+        Uso atual na janela de cada regra
+
+        Returns:
+            dict: {nome_regra: uso}
+        """
+        return self.storage.usage(key, rules, time.time())
+
+    def reset(self, key):
+        """Apaga todos os contadores de uma chave"""
+        self.storage.reset(key)
+
+    def keys(self, prefix):
+        """Chaves com uso dentro da janela que começam com prefix"""
+        return self.storage.keys(prefix, time.time())
+
+
+# Instância global (criada sob demanda)
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """
+    Retorna o limitador global
+
+    LIMITER_BACKEND=sqlite compartilha os contadores entre workers
+    (arquivo em LIMITER_SQLITE_PATH)
+    """
+    global _limiter
+
+    if _limiter is not None:
+        return _limiter
+
+    with _limiter_lock:
+        if _limiter is not None:
+            return _limiter
+
+        storage = None
+        if Config.LIMITER_BACKEND == 'sqlite':
+            try:
+                storage = SQLiteLimiterStorage(Config.LIMITER_SQLITE_PATH)
+                logger.info(f"✅ Rate limiter compartilhado (SQLite): {Config.LIMITER_SQLITE_PATH}")
+            except Exception as e:
+                logger.error(f"❌ Erro ao abrir SQLite do rate limiter: {e}")
+                logger.warning("⚠️ Usando rate limiter em memória")
+
+        _limiter = SlidingWindowLimiter(storage)
+        return _limiter
@@ -1,153 +1,149 @@
 """
 Rate Limiter para FREE tier do Gemini
 10 RPM, 250k TPM, 250 RPD
-✅ CORRIGIDO: Thread-safe com locks
+✅ Usa o motor único de janela deslizante (utils/limiter.py)
 """
 
-from collections import defaultdict
-from time import time
-from threading import Lock
-from flask import jsonify
+from utils.limiter import get_limiter, rpm, rpd
+from utils.advanced_logger import logger
 
 class RateLimiter:
     """
-    ✅ Rate Limiter thread-safe para Gemini FREE tier
-    
+    ✅ Rate Limiter por usuário para as rotas de chat
+
     Limites:
     - RPM: 10 requests/minuto
-    - TPM: 250k tokens/minuto
-    - RPD: 250 requests/dia
+    - RPD: 250 requests/dia (janela deslizante de 24h)
     """
-    
-    def __init__(self):
-        # ✅ Adiciona lock para operações thread-safe
-        self._lock = Lock()
-        
-        self.requests = defaultdict(list)  # {user_id: [timestamps]}
-        self.daily_requests = defaultdict(int)  # {user_id: count}
-        self.last_reset = {}  # {user_id: timestamp}
-        
+
+    NAMESPACE = 'chat'
+
+    def __init__(self, limiter=None):
+        self._limiter = limiter
+
         # Limites FREE tier
         self.RPM = 10
         self.RPD = 250
-    
+
+        self.rules = [rpm(self.RPM), rpd(self.RPD)]
+        
+        # Ledger durável (services/usage_ledger.py), ligado em attach_ledger
+        self.ledger = None
+
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            self._limiter = get_limiter()
+        return self._limiter
+
+    def _key(self, user_id):
+        return f"{self.NAMESPACE}:user:{user_id}"
+
     def check_limit(self, user_id):
         """
-        ✅ CORRIGIDO: Verifica se usuário pode fazer request (thread-safe)
-        
+        Verifica se usuário pode fazer request e já consome a cota (atômico)
+
         Args:
             user_id: ID do usuário
-        
+
         Returns:
             (bool, str): (pode_fazer, mensagem_erro)
         """
-        # ✅ Lock para garantir atomicidade
-        with self._lock:
-            now = time()
-            
-            # Reset diário (meia-noite Pacific Time = 86400s)
-            if user_id not in self.last_reset or (now - self.last_reset[user_id]) > 86400:
-                self.daily_requests[user_id] = 0
-                self.last_reset[user_id] = now
-            
-            # Remove requests antigas (> 1 minuto = 60s)
-            self.requests[user_id] = [
-                req_time for req_time in self.requests[user_id]
-                if now - req_time < 60
-            ]
-            
-            # ✅ Verifica RPM (requests por minuto)
-            if len(self.requests[user_id]) >= self.RPM:
-                return False, f"⚠️ Limite de {self.RPM} requests/minuto excedido. Aguarde 1 minuto."
-            
-            # ✅ Verifica RPD (requests por dia)
-            if self.daily_requests[user_id] >= self.RPD:
-                return False, f"⚠️ Limite diário de {self.RPD} requests excedido. Volte amanhã."
-            
-            # ✅ CRÍTICO: Adiciona request ANTES de retornar
-            # Isso previne race conditions
-            self.requests[user_id].append(now)
-            self.daily_requests[user_id] += 1
-            
-            return True, ""
+        result = self.limiter.hit(self._key(user_id), [(rule, 1) for rule in self.rules])
+
+        if not result.allowed:
+            wait = int(result.retry_after) + 1
+
+            if result.rule.name == 'rpm':
+                return False, f"⚠️ Limite de {self.RPM} requests/minuto excedido. Aguarde {wait}s."
+
+            return False, f"⚠️ Limite diário de {self.RPD} requests excedido. Volte amanhã."
+
+        self.limiter.add(f"{self.NAMESPACE}:global", [(rule, 1) for rule in self.rules])
+        
+        if self.ledger:
+            self.ledger.record('chat', user_id)
+        
+        return True, ""
     
+    def attach_ledger(self, ledger):
+        """
+        Passa a gravar no ledger durável e reidrata as janelas de minuto/dia
+        
+        Args:
+            ledger: UsageLedger compartilhado entre workers
+        """
+        self.ledger = ledger
+        loaded = ledger.subscribe(self._apply_ledger_events)
+        logger.info(f"♻️ RateLimiter reidratado do ledger: {loaded} eventos (24h)")
+    
+    def _apply_ledger_events(self, events):
+        """Soma envios de outros workers (ou de antes do reinício)"""
+        if self.limiter.shared:
+            # Contadores em SQLite já incluem esses envios
+            return
+        
+        quotas = [(rule, 1) for rule in self.rules]
+        
+        for event in events:
+            if event['kind'] != 'chat':
+                continue
+            
+            if event['user_id']:
+                self.limiter.add(self._key(event['user_id']), quotas, timestamp=event['ts'])
+            self.limiter.add(f"{self.NAMESPACE}:global", quotas, timestamp=event['ts'])
+
     def get_user_stats(self, user_id):
         """
         Retorna estatísticas de uso do usuário
-        
+
         Args:
             user_id: ID do usuário
-        
+
         Returns:
             dict: Estatísticas
         """
-        with self._lock:
-            now = time()
-            
-            # Limpa requests antigos
-            self.requests[user_id] = [
-                req_time for req_time in self.requests[user_id]
-                if now - req_time < 60
-            ]
-            
-            rpm_usado = len(self.requests[user_id])
-            rpd_usado = self.daily_requests.get(user_id, 0)
-            
-            return {
-                'rpm_usado': rpm_usado,
-                'rpm_limite': self.RPM,
-                'rpm_restante': max(0, self.RPM - rpm_usado),
-                'rpm_percentual': int((rpm_usado / self.RPM) * 100),
-                
-                'rpd_usado': rpd_usado,
-                'rpd_limite': self.RPD,
-                'rpd_restante': max(0, self.RPD - rpd_usado),
-                'rpd_percentual': int((rpd_usado / self.RPD) * 100),
-            }
-    
+        usage = self.limiter.usage(self._key(user_id), self.rules)
+        rpm_usado = usage['rpm']
+        rpd_usado = usage['rpd']
+
+        return {
+            'rpm_usado': rpm_usado,
+            'rpm_limite': self.RPM,
+            'rpm_restante': max(0, self.RPM - rpm_usado),
+            'rpm_percentual': int((rpm_usado / self.RPM) * 100),
+
+            'rpd_usado': rpd_usado,
+            'rpd_limite': self.RPD,
+            'rpd_restante': max(0, self.RPD - rpd_usado),
+            'rpd_percentual': int((rpd_usado / self.RPD) * 100),
+        }
+
     def reset_user(self, user_id):
         """
         Reseta limites de um usuário (apenas para admin/debug)
-        
+
         Args:
             user_id: ID do usuário
         """
-        with self._lock:
-            if user_id in self.requests:
-                del self.requests[user_id]
-            if user_id in self.daily_requests:
-                del self.daily_requests[user_id]
-            if user_id in self.last_reset:
-                del self.last_reset[user_id]
-    
+        self.limiter.reset(self._key(user_id))
+
     def get_all_stats(self):
         """
         Retorna estatísticas globais
-        
+
         Returns:
             dict: Estatísticas de todos os usuários
         """
-        with self._lock:
-            now = time()
-            
-            # Limpa requests antigos de todos os usuários
-            for user_id in list(self.requests.keys()):
-                self.requests[user_id] = [
-                    req_time for req_time in self.requests[user_id]
-                    if now - req_time < 60
-                ]
-            
-            total_rpm = sum(len(reqs) for reqs in self.requests.values())
-            total_rpd = sum(self.daily_requests.values())
-            total_usuarios = len(self.daily_requests)
-            
-            return {
-                'total_rpm': total_rpm,
-                'total_rpd': total_rpd,
-                'total_usuarios_ativos': total_usuarios,
-                'limite_rpm': self.RPM,
-                'limite_rpd': self.RPD,
-            }
+        usage = self.limiter.usage(f"{self.NAMESPACE}:global", self.rules)
+
+        return {
+            'total_rpm': usage['rpm'],
+            'total_rpd': usage['rpd'],
+            'total_usuarios_ativos': len(self.limiter.keys(f"{self.NAMESPACE}:user:")),
+            'limite_rpm': self.RPM,
+            'limite_rpd': self.RPD,
+        }
 
 # ✅ Instância global thread-safe
-rate_limiter = RateLimiter()
\ No newline at end of file
+rate_limiter = RateLimiter()
@@ -0,0 +1,114 @@
+"""
+Identity map por requisição (unit of work leve sobre flask.g)
+
+Memoiza leituras do DAO por (tabela, chave) enquanto a requisição durar.
+Escritas feitas pelo DAO atualizam ou invalidam as entradas afetadas.
+Fora de uma requisição (threads, scripts) nada é memoizado.
+"""
+
+from flask import g, has_request_context, request
+from utils.advanced_logger import logger
+
+
+_TODAS = object()
+
+
+def _normalize(chave):
+    """IDs vindos de rotas/forms podem ser str: '5' e 5 são a mesma chave"""
+    if isinstance(chave, str) and chave.isdigit():
+        return int(chave)
+    return chave
+
+
+def _state():
+    """Estado do identity map da requisição atual (ou None)"""
+    if not has_request_context():
+        return None
+
+    state = g.get('_identity_map')
+    if state is None:
+        state = {'entries': {}, 'hits': 0, 'misses': 0}
+        g._identity_map = state
+
+    return state
+
+
+def memoize(tabela, chave, loader):
+    """
+    Retorna o valor memoizado de (tabela, chave) ou executa o loader
+
+    Args:
+        tabela: Nome da tabela (ou grupo lógico, ex: 'orientacoes')
+        chave: Chave da linha/consulta
+        loader: Função sem argumentos que consulta o banco
+
+    Returns:
+        Valor retornado pelo loader (inclusive None)
+    """
+    state = _state()
+    if state is None:
+        return loader()
+
+    key = (tabela, _normalize(chave))
+    if key in state['entries']:
+        state['hits'] += 1
+        return state['entries'][key]
+
+    state['misses'] += 1
+    value = loader()
+    state['entries'][key] = value
+    return value
+
+
+def put(tabela, chave, valor):
+    """Grava um valor conhecido (ex: linha retornada por um UPDATE)"""
+    state = _state()
+    if state is not None:
+        state['entries'][(tabela, _normalize(chave))] = valor
+
+
+def invalidate(tabela, chave=_TODAS):
+    """
+    Remove entradas do identity map
+
+    Args:
+        tabela: Nome da tabela
+        chave: Chave específica (omitida = todas as entradas da tabela)
+    """
+    state = _state()
+    if state is None:
+        return
+
+    if chave is _TODAS:
+        for key in [k for k in state['entries'] if k[0] == tabela]:
+            del state['entries'][key]
+    else:
+        state['entries'].pop((tabela, _normalize(chave)), None)
+
+
+def get_stats():
+    """
+    Estatísticas da requisição atual
+
+    Returns:
+        dict: {'hits', 'misses'} ou None fora de requisição
+    """
+    state = g.get('_identity_map') if has_request_context() else None
+    if state is None:
+        return None
+    return {'hits': state['hits'], 'misses': state['misses']}
+
+
+def init_app(app):
+    """Registra o log de consultas economizadas por endpoint"""
+
+    @app.teardown_request
+    def log_identity_map(error=None):
+        stats = get_stats()
+        if stats and stats['hits']:
+            logger.info(
+                f"♻️ {request.endpoint or 'Unknown'}: {stats['hits']} consultas evitadas "
+                f"pelo cache da requisição ({stats['misses']} ao banco)"
+            )
+
+    logger.info("✅ Identity map por requisição configurado")
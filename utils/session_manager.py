@@ -3,19 +3,37 @@ Sistema de Sessão Única para APBIA
 Impede que a mesma conta seja acessada simultaneamente de múltiplos dispositivos
 """
 
+import atexit
 import secrets
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 from functools import wraps
 from flask import session, redirect, url_for, flash, request
 from flask_login import current_user, logout_user
+from config import Config
 from utils.advanced_logger import logger
 
 class SessionManager:
     """Gerencia sessões únicas por usuário"""
     
-    def __init__(self, dao):
+    def __init__(self, dao, cache_ttl_seconds=None, flush_interval_seconds=None):
         self.dao = dao
         self.session_timeout = timedelta(hours=1)  # Timeout de 1 hora
+        
+        # ✅ Cache de sessões validadas: {token: {'user_id', 'last_activity', 'checked_at'}}
+        # O token só é reconferido no banco após o TTL (limite para detectar
+        # login em outro dispositivo/worker); entradas vencidas saem no flush
+        self.cache_ttl_seconds = Config.SESSION_CACHE_TTL_SECONDS if cache_ttl_seconds is None else cache_ttl_seconds
+        self._cache = {}
+        
+        # ✅ Atividade pendente (write-behind): {user_id: datetime UTC}
+        self.flush_interval_seconds = Config.SESSION_ACTIVITY_FLUSH_SECONDS if flush_interval_seconds is None else flush_interval_seconds
+        self._pending_activity = {}
+        
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop_event = threading.Event()
     
     def generate_session_token(self):
         """Gera token único de sessão"""
@@ -32,11 +50,15 @@ class SessionManager:
         logger.info(f"🔑 Criando nova sessão para User {user_id}")
         
         # Atualiza token na tabela de usuários
-        self.dao.supabase.table('usuarios').update({
-            'session_token': token,
-            'session_created_at': now.isoformat(),
-            'last_activity': now.isoformat()
-        }).eq('id', user_id).execute()
+        self.dao.atualizar_usuario(
+            user_id,
+            session_token=token,
+            session_created_at=now.isoformat(),
+            last_activity=now.isoformat()
+        )
+        
+        # Sessões antigas deste usuário neste processo deixam de valer na hora
+        self._forget_user(user_id)
         
         # Armazena token na sessão Flask
         session['session_token'] = token
@@ -69,69 +91,188 @@ class SessionManager:
     
         logger.debug(f"🔍 Validando sessão - User {user_id} | Token Flask: {current_token[:10]}...")
     
-        # Busca dados do banco
-        result = self.dao.supabase.table('usuarios')\
-            .select('session_token, session_created_at, last_activity')\
-            .eq('id', user_id)\
-            .execute()
-    
-        if not result.data:
-            logger.error(f"❌ User {user_id} não encontrado no banco")
-            return False
-    
-        user_data = result.data[0]
-        stored_token = user_data.get('session_token')
-        session_created = user_data.get('session_created_at')
-        last_activity = user_data.get('last_activity')
-    
-        logger.debug(f"📊 Dados do banco - Token DB: {stored_token[:10] if stored_token else 'None'}... | Created: {session_created} | Last Activity: {last_activity}")
-    
-        # ✅ Verifica se tokens coincidem (detecta login em outro dispositivo)
-        if current_token != stored_token:
-            logger.warning(f"🚫 SESSÃO INVÁLIDA - User {user_id}: Token não coincide (outro dispositivo fez login)")
-            logger.debug(f"   Token Flask: {current_token[:15]}...")
-            logger.debug(f"   Token DB:    {stored_token[:15] if stored_token else 'None'}...")
-            return False
-    
-        # ✅ Verifica inatividade de 1 hora
-        if last_activity:
-            try:
-                last_activity_dt = datetime.fromisoformat(last_activity.replace('Z', '+00:00'))
-                now_utc = datetime.now(timezone.utc)
-                inactivity_duration = now_utc - last_activity_dt
+        now_utc = datetime.now(timezone.utc)
+        
+        # ✅ Cache em memória: evita SELECT enquanto o token foi conferido há pouco
+        with self._lock:
+            cached = self._cache.get(current_token)
+            if cached and (cached['user_id'] != user_id or time.time() - cached['checked_at'] > self.cache_ttl_seconds):
+                cached = None
+            last_activity_dt = cached['last_activity'] if cached else None
+        
+        if cached is None:
+            # Busca dados do banco (linha memoizada na requisição, já lida pelo load_user)
+            user_data = self.dao.buscar_dados_usuario(user_id)
+        
+            if not user_data:
+                logger.error(f"❌ User {user_id} não encontrado no banco")
+                return False
+
+            stored_token = user_data.get('session_token')
+            session_created = user_data.get('session_created_at')
+            last_activity = user_data.get('last_activity')
+        
+            logger.debug(f"📊 Dados do banco - Token DB: {stored_token[:10] if stored_token else 'None'}... | Created: {session_created} | Last Activity: {last_activity}")
+        
+            # ✅ Verifica se tokens coincidem (detecta login em outro dispositivo)
+            if current_token != stored_token:
+                logger.warning(f"🚫 SESSÃO INVÁLIDA - User {user_id}: Token não coincide (outro dispositivo fez login)")
+                logger.debug(f"   Token Flask: {current_token[:15]}...")
+                logger.debug(f"   Token DB:    {stored_token[:15] if stored_token else 'None'}...")
+                with self._lock:
+                    self._cache.pop(current_token, None)
+                return False
             
-                logger.debug(f"⏱️  Inatividade: {inactivity_duration.total_seconds() / 60:.1f} minutos")
+            last_activity_dt = None
+            if last_activity:
+                try:
+                    last_activity_dt = datetime.fromisoformat(last_activity.replace('Z', '+00:00'))
+                except Exception as e:
+                    logger.error(f"❌ Erro ao verificar inatividade - User {user_id}: {e}")
             
-                if inactivity_duration > self.session_timeout:
-                    logger.warning(f"💤 SESSÃO EXPIRADA - User {user_id}: Inatividade > 1 hora ({inactivity_duration.total_seconds() / 3600:.2f}h)")
-                    return False
-            except Exception as e:
-                logger.error(f"❌ Erro ao verificar inatividade - User {user_id}: {e}")
+            # Atividade ainda não gravada no banco conta também
+            with self._lock:
+                pending = self._pending_activity.get(user_id)
+            if pending and (last_activity_dt is None or pending > last_activity_dt):
+                last_activity_dt = pending
+    
+        # ✅ Verifica inatividade de 1 hora
+        if last_activity_dt:
+            inactivity_duration = now_utc - last_activity_dt
+        
+            logger.debug(f"⏱️  Inatividade: {inactivity_duration.total_seconds() / 60:.1f} minutos")
+        
+            if inactivity_duration > self.session_timeout:
+                logger.warning(f"💤 SESSÃO EXPIRADA - User {user_id}: Inatividade > 1 hora ({inactivity_duration.total_seconds() / 3600:.2f}h)")
+                with self._lock:
+                    self._cache.pop(current_token, None)
+                return False
     
         # ✅ CORRIGIDO: Só atualiza se não for polling
         if update_activity:
             self.update_activity(user_id)
-            logger.debug(f"✅ Sessão válida - User {user_id} | Atividade atualizada")
+            last_activity_dt = now_utc
+            logger.debug(f"✅ Sessão válida - User {user_id} | Atividade registrada")
         else:
             logger.debug(f"✅ Sessão válida - User {user_id} | Atividade NÃO atualizada (polling)")
+        
+        with self._lock:
+            if cached is None:
+                self._cache[current_token] = {
+                    'user_id': user_id,
+                    'last_activity': last_activity_dt,
+                    'checked_at': time.time()
+                }
+            else:
+                cached['last_activity'] = last_activity_dt
+        
+        # A thread de flush também limpa o cache (mesmo só com polling)
+        self._ensure_flusher()
     
         return True
     
     def update_activity(self, user_id):
-        """Atualiza timestamp de última atividade"""
+        """
+        Registra atividade do usuário (write-behind)
+        O timestamp é gravado no banco em lote pela thread de flush
+        """
         now = datetime.now(timezone.utc)  # ✅ FIX: UTC timezone
-        self.dao.supabase.table('usuarios').update({
-            'last_activity': now.isoformat()
-        }).eq('id', user_id).execute()
-        logger.debug(f"🔄 Atividade atualizada - User {user_id}: {now.isoformat()}")
+        
+        with self._lock:
+            self._pending_activity[user_id] = now
+        
+        self._ensure_flusher()
+        logger.debug(f"🔄 Atividade registrada - User {user_id}: {now.isoformat()}")
+    
+    def flush_activity(self):
+        """
+        Grava no banco as atividades pendentes
+        
+        Um único UPDATE por lote (in_ nos IDs) com o timestamp mais recente
+        do lote - a diferença é no máximo o intervalo de flush
+        
+        Returns:
+            int: Número de usuários atualizados
+        """
+        with self._lock:
+            pending = self._pending_activity
+            self._pending_activity = {}
+        
+        self._prune_cache()
+        
+        if not pending:
+            return 0
+        
+        latest = max(pending.values())
+        user_ids = list(pending.keys())
+        
+        try:
+            self.dao.supabase.table('usuarios')\
+                .update({'last_activity': latest.isoformat()})\
+                .in_('id', user_ids)\
+                .execute()
+            logger.debug(f"💾 Atividade de {len(user_ids)} usuário(s) gravada em lote")
+            return len(user_ids)
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar atividade em lote: {e}")
+            # Devolve ao buffer (sem sobrescrever atividades mais novas)
+            with self._lock:
+                for user_id, ts in pending.items():
+                    if user_id not in self._pending_activity or self._pending_activity[user_id] < ts:
+                        self._pending_activity[user_id] = ts
+            return 0
+    
+    def _prune_cache(self):
+        """
+        Remove do cache tokens não conferidos há mais que o TTL
+        (expirados ou abandonados: seriam reconferidos no banco de qualquer forma)
+        """
+        limite = time.time() - self.cache_ttl_seconds
+        
+        with self._lock:
+            for token in [t for t, entry in self._cache.items() if entry['checked_at'] < limite]:
+                del self._cache[token]
+    
+    def _ensure_flusher(self):
+        if self._flusher and self._flusher.is_alive():
+            return
+        
+        with self._lock:
+            if self._flusher and self._flusher.is_alive():
+                return
+            
+            self._flusher = threading.Thread(
+                target=self._flush_loop,
+                name='session-activity-flusher',
+                daemon=True
+            )
+            self._flusher.start()
+    
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval_seconds):
+            self.flush_activity()
+    
+    def shutdown(self):
+        """Para a thread de flush e grava o que estiver pendente"""
+        self._stop_event.set()
+        self.flush_activity()
+    
+    def _forget_user(self, user_id):
+        """Remove do cache as sessões de um usuário (login novo / logout)"""
+        with self._lock:
+            for token in [t for t, entry in self._cache.items() if entry['user_id'] == user_id]:
+                del self._cache[token]
     
     def invalidate_session(self, user_id):
         """Invalida sessão de um usuário"""
         logger.info(f"🗑️  Invalidando sessão - User {user_id}")
-        self.dao.supabase.table('usuarios').update({
-            'session_token': None,
-            'session_created_at': None
-        }).eq('id', user_id).execute()
+        self._forget_user(user_id)
+        self.dao.atualizar_usuario(
+            user_id,
+            session_token=None,
+            session_created_at=None
+        )
         
         if 'session_token' in session:
             session.pop('session_token')
@@ -149,10 +290,7 @@ def require_valid_session(f):
         if not current_user.is_authenticated:
             return f(*args, **kwargs)
         
-        # Importa aqui para evitar circular import
-        from dao.dao import SupabaseDAO
-        dao = SupabaseDAO()
-        session_manager = SessionManager(dao)
+        session_manager = get_session_manager()
         
         # Valida sessão
         if not session_manager.validate_session(current_user.id):
@@ -173,7 +311,8 @@ def get_session_manager():
     """Retorna instância global do SessionManager"""
     global _session_manager
     if _session_manager is None:
-        from dao.dao import SupabaseDAO
-        dao = SupabaseDAO()
-        _session_manager = SessionManager(dao)
+        from dao.dao import get_dao
+        _session_manager = SessionManager(get_dao())
+        # Grava atividades pendentes ao encerrar o processo
+        atexit.register(_session_manager.shutdown)
     return _session_manager
\ No newline at end of file